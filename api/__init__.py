@@ -3,6 +3,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette import status
 
 bearer_security = HTTPBearer()
+optional_bearer_security = HTTPBearer(auto_error = False)
 
 def get_access_token(credentials: HTTPAuthorizationCredentials = Depends(bearer_security)) -> str:
     if not credentials:
@@ -12,5 +13,8 @@ def get_access_token(credentials: HTTPAuthorizationCredentials = Depends(bearer_
         )
     return credentials.credentials
 
+def get_optional_access_token(credentials: HTTPAuthorizationCredentials = Depends(optional_bearer_security)):
+    return credentials.credentials if credentials else None
+
 async def get_admin_access(admin_token: HTTPAuthorizationCredentials = Depends(bearer_security)):
     return admin_token
\ No newline at end of file
@@ -0,0 +1,123 @@
+import logging
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.service_cache import blob_cache, metadata_cache, completion_cache, summary_cache
+from services.service_hedge import llm_router
+from services.service_metrics import registry, RequestSpan, current_span, request_duration, request_upstream_calls
+from services.service_scheduler import github_scheduler
+from services.service_search import search_index
+from services.service_webhook import webhook_processor
+from services.service_singleflight import github_flights, llm_flights
+
+
+logger = logging.getLogger("api.request")
+
+router = APIRouter()
+
+
+class RequestMetricsMiddleware:
+    """Time every request, tag it with an X-Request-ID and count its upstream calls.
+
+    Upstream calls made while handling the request (GitHub, LLM) are recorded
+    on a ``RequestSpan`` held in a context variable, so the request log line
+    shows how many calls and how much upstream time it cost.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        span = RequestSpan(headers.get(b"x-request-id", b"").decode("latin-1")[:64] or None)
+        token = current_span.set(span)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", span.request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            route = scope.get("route")
+            # Chỉ dùng route mẫu làm label; request không khớp route nào gộp chung một nhóm
+            route = route.path if route is not None else "unmatched"
+            request_duration.observe(seconds, method = scope["method"], route = route, status = status)
+            request_upstream_calls.observe(len(span.calls), route = route)
+            logger.info(
+                "request",
+                extra = {
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status,
+                    "duration": round(seconds, 4),
+                    "upstream_calls": len(span.calls),
+                    "upstream": span.summary(),
+                }
+            )
+            current_span.reset(token)
+
+
+@registry.collector
+def service_stats():
+    samples = []
+    for name, cache in (("blob", blob_cache), ("metadata", metadata_cache), ("llm", completion_cache), ("summary", summary_cache)):
+        stats = cache.stats()
+        samples += [
+            ("cache_hits_total", "counter", "Cache hits (incl. disk hits / revalidations)", {"cache": name}, stats["hits"] + stats.get("disk_hits", 0) + stats.get("revalidated", 0)),
+            ("cache_misses_total", "counter", "Cache misses", {"cache": name}, stats["misses"]),
+            ("cache_hit_ratio", "gauge", "Cache hit ratio since start", {"cache": name}, stats["hit_ratio"]),
+            ("cache_evictions_total", "counter", "Cache evictions", {"cache": name}, stats["evictions"]),
+        ]
+
+    for resource, remaining in github_scheduler.headroom().items():
+        samples.append(("github_rate_limit_remaining", "gauge", "Lowest remaining GitHub quota across tokens", {"resource": resource}, remaining))
+    scheduler = github_scheduler.stats()
+    for key in ("in_flight", "queued"):
+        samples.append((f"github_scheduler_{key}", "gauge", f"GitHub scheduler {key.replace('_', ' ')}", {}, scheduler[key]))
+    for key in ("throttled", "rejected"):
+        samples.append((f"github_scheduler_{key}_total", "counter", f"GitHub scheduler {key}", {}, scheduler[key]))
+
+    for name, flights in (("github", github_flights), ("llm", llm_flights)):
+        stats = flights.stats()
+        samples += [
+            ("singleflight_executed_total", "counter", "Calls actually sent upstream", {"upstream": name}, stats["executed"]),
+            ("singleflight_shared_total", "counter", "Calls served by an identical in-flight call", {"upstream": name}, stats["shared"]),
+        ]
+
+    index = search_index.stats()
+    for key in ("repos", "commits", "blobs", "bytes"):
+        samples.append((f"search_index_{key}", "gauge", f"Code search index {key}", {}, index[key]))
+    for key in ("builds", "evictions"):
+        samples.append((f"search_index_{key}_total", "counter", f"Code search index {key}", {}, index[key]))
+
+    # Chỉ pending là gauge, các số còn lại cộng dồn từ lúc khởi động
+    webhook = webhook_processor.stats()
+    samples.append(("webhook_pending", "gauge", "GitHub webhook pending", {}, webhook["pending"]))
+    for key in ("deliveries", "invalidated", "dropped", "prewarmed_blobs", "failed"):
+        samples.append((f"webhook_{key}_total", "counter", f"GitHub webhook {key.replace('_', ' ')}", {}, webhook[key]))
+
+    routing = llm_router.stats()
+    for key in ("requests", "hedged", "hedge_wins", "failovers"):
+        samples.append((f"llm_routing_{key}_total", "counter", f"LLM routing {key.replace('_', ' ')}", {}, routing[key]))
+    for model, latency in routing["latency"].items():
+        for quantile in ("p50", "p95"):
+            if latency[quantile] is not None:
+                samples.append(("llm_latency_seconds", "gauge", "Rolling LLM latency of successful completions", {"model": model, "quantile": quantile}, latency[quantile]))
+    return samples
+
+
+@router.get("/metrics", include_in_schema = False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type = "text/plain; version=0.0.4")
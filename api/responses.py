@@ -0,0 +1,259 @@
+import asyncio
+import zlib
+
+import brotli
+import msgpack
+import orjson
+import zstandard
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from configs.config import settings
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# Mức nén: ưu tiên tốc độ, response được nén lại ở mỗi request
+LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+# Liệt kê từng loại text: text/event-stream (SSE) không được nén để event đến client ngay
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/x-ndjson", "application/msgpack", "application/x-msgpack",
+    "text/plain", "text/html", "text/csv", "text/markdown"
+)
+# Body lớn hơn mức này được nén trong thread để không chặn event loop
+THREAD_MIN_SIZE = 256 * 1024
+# Stream gom các phần nhỏ lại cho tới khoảng này rồi mới gửi (và nén) một lần
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def dump_json(content):
+    # Kiểu orjson không hỗ trợ (pydantic model, ...) mới đi qua jsonable_encoder
+    return orjson.dumps(content, default = jsonable_encoder, option = orjson.OPT_NON_STR_KEYS)
+
+
+def dump_msgpack(content):
+    return msgpack.packb(content, default = jsonable_encoder, datetime = False)
+
+
+def parse_qualities(header):
+    """``{token: q}`` of an ``Accept`` / ``Accept-Encoding`` header (lowercased, parameters other than q dropped)"""
+    qualities = {}
+    for item in (header or "").split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        qualities[token.lower()] = q
+    return qualities
+
+
+def wants_msgpack(accept):
+    """True if ``accept`` prefers MessagePack over JSON (MessagePack must be listed explicitly)"""
+    qualities = parse_qualities(accept)
+    msgpack_q = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return msgpack_q > 0 and msgpack_q >= qualities.get("application/json", 0.0)
+
+
+class FastJSONResponse(Response):
+    """JSON encoded by orjson.
+
+    Built directly (as ``negotiated_response`` does) it encodes the content
+    as is, without ``jsonable_encoder``. As the app's default response class,
+    FastAPI still runs a handler's plain return value through
+    ``jsonable_encoder`` first; only the rendering is faster there.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dump_json(content)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content):
+        return dump_msgpack(content)
+
+
+def negotiated_response(request, content, headers = None):
+    """``content`` as MessagePack if the ``Accept`` header asks for it, else as JSON"""
+    if wants_msgpack(request.headers.get("accept")):
+        return MsgPackResponse(content, headers = headers)
+    return FastJSONResponse(content, headers = headers)
+
+
+async def _batched(parts):
+    buffer, size = [], 0
+    async for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def stream_json_object(items):
+    """Encode an async iterator of ``(key, value)`` as one JSON object, a few items per chunk"""
+    async def parts():
+        yield b"{"
+        separator = b""
+        async for key, value in items:
+            yield separator + dump_json(key) + b":" + dump_json(value)
+            separator = b","
+        yield b"}"
+    return _batched(parts())
+
+
+def stream_msgpack_map(count, items):
+    """Encode an async iterator of exactly ``count`` ``(key, value)`` pairs as one MessagePack map"""
+    async def parts():
+        packer = msgpack.Packer(default = jsonable_encoder, datetime = False)
+        yield packer.pack_map_header(count)
+        async for key, value in items:
+            yield packer.pack(key) + packer.pack(value)
+    return _batched(parts())
+
+
+def stream_ndjson(items):
+    """One JSON document per line"""
+    async def parts():
+        async for item in items:
+            yield dump_json(item) + b"\n"
+    return parts()
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality = level)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level = level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+COMPRESSORS = {"zstd": _Zstd, "br": _Brotli, "gzip": _Gzip}
+
+
+def compress(encoding, data):
+    compressor = COMPRESSORS[encoding](LEVELS[encoding])
+    return compressor.compress(data) + compressor.finish()
+
+
+def choose_encoding(accept_encoding, encodings):
+    """Best of ``encodings`` (server preference order) for an ``Accept-Encoding`` header, or None"""
+    qualities = parse_qualities(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Compress JSON / NDJSON / MessagePack / text responses with zstd, brotli or gzip.
+
+    The encoding is negotiated from ``Accept-Encoding`` among
+    ``COMPRESSION_ENCODINGS``. Complete bodies under ``COMPRESSION_MIN_SIZE``
+    are sent as is; streamed bodies are compressed chunk by chunk and
+    flushed after each chunk, so NDJSON lines still reach the client as
+    soon as they are produced. Server-Sent Events are never compressed.
+    """
+
+    def __init__(self, app, min_size = None, encodings = None):
+        self.app = app
+        self.min_size = settings.COMPRESSION_MIN_SIZE if min_size is None else min_size
+        encodings = encodings if encodings is not None else settings.COMPRESSION_ENCODINGS.split(",")
+        self.encodings = [encoding.strip() for encoding in encodings if encoding.strip() in COMPRESSORS]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encodings)
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1").lower()
+                compressible = content_type.startswith(COMPRESSIBLE_TYPES) and b"content-encoding" not in response_headers
+                if compressible:
+                    message["headers"] = list(message.get("headers", [])) + [(b"vary", b"Accept-Encoding")]
+                if not compressible or encoding is None or message["status"] in (204, 304):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Chờ phần body đầu tiên để biết độ dài / có stream hay không
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+                compressor = COMPRESSORS[encoding](LEVELS[encoding])
+                start["headers"] = [
+                    (key, value) for key, value in start["headers"] if key.lower() != b"content-length"
+                ] + [(b"content-encoding", encoding.encode())]
+                if not more_body:
+                    body = await self._compress(compressor, body, finish = True)
+                    start["headers"].append((b"content-length", str(len(body)).encode()))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": body})
+                await send(start)
+
+            body = await self._compress(compressor, body, finish = not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _compress(compressor, body, finish):
+        def run():
+            data = compressor.compress(body) if body else b""
+            return data + compressor.finish() if finish else data
+        if len(body) >= THREAD_MIN_SIZE:
+            return await asyncio.to_thread(run)
+        return run()
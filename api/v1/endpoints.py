@@ -1,8 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from services import service_base
-from services.service_github import GitHubRepo
-from .. import get_admin_access, get_access_token
-from configs.config import superuser_auth
+from services.service_llm import sse_encode
+from services.service_github import github_pool
+from services.service_cache import blob_cache, metadata_cache, completion_cache, summary_cache
+from services.service_scheduler import github_scheduler
+from services.service_singleflight import github_flights, llm_flights
+from services.service_hedge import llm_router
+from services.service_search import search_index
+from services.service_retrieval import retrieval_indexes
+from services.service_webhook import webhook_processor, verify_signature, HANDLED_EVENTS
+from .. import get_admin_access, get_access_token, get_optional_access_token
+from ..responses import negotiated_response, stream_json_object, stream_msgpack_map, stream_ndjson, wants_msgpack, MSGPACK_TYPES
+from .schemas import ChatBatchRequest
+from configs.config import settings, superuser_auth
 
 
 
@@ -12,20 +24,122 @@ router = APIRouter()
     "/chat",
     tags = ["Chat với AI tuỳ chọn"],
 )
-async def chat(prompt: str, provider: str, model_name: str, history = []):
+async def chat(
+    prompt: str,
+    provider: str,
+    model_name: str,
+    history = [],
+    stream: bool = False,
+    repo_name: str = None,
+    branch: str = None,
+    top_k: int = None,
+    cache_control: str = Header(None),
+    access_token: str = Depends(get_optional_access_token)
+):
+    """
+    Chat với AI, tuỳ chọn dựa trên code của một repository
+
+    - **repo_name**, **branch**: Lấy các đoạn code liên quan nhất tới `prompt` (BM25, index theo commit) và chèn vào prompt, trong giới hạn `RAG_CONTEXT_TOKENS` token (cần token GitHub)
+    - **top_k**: Số đoạn code lấy ra (mặc định `RAG_TOP_K`)
+    - **stream**: Server-Sent Events; khi có `repo_name`, event đầu tiên là `{"type": "context", "sources"}`
+    """
+    # Cache-Control: no-cache -> bỏ qua cache khi đọc nhưng vẫn lưu kết quả mới; no-store -> không dùng cache
+    directives = (cache_control or "").lower()
+    use_cache = "no-store" not in directives
+    refresh_cache = "no-cache" in directives
+
+    if repo_name:
+        if access_token is None:
+            raise HTTPException(status_code=403, detail="Invalid github access_token")
+        result = await service_base.chat_repo(
+            github_pool.get(access_token),
+            user_query = prompt,
+            repo_name = repo_name,
+            branch = branch,
+            provider = provider,
+            model_name = model_name,
+            history = history,
+            top_k = top_k,
+            stream = stream,
+            use_cache = use_cache,
+            refresh_cache = refresh_cache
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="Repository or branch not found")
+        if stream:
+            return StreamingResponse(
+                sse_encode(result),
+                media_type = "text/event-stream",
+                headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        return result
+
+    if stream:
+        # Server-Sent Events: mỗi event là một JSON {"type": "delta" | "done" | "error", ...}
+        events = service_base.chat_llm_stream(
+            user_query = prompt,
+            provider = provider,
+            model_name = model_name,
+            history = history,
+            use_cache = use_cache,
+            refresh_cache = refresh_cache
+        )
+        return StreamingResponse(
+            sse_encode(events),
+            media_type = "text/event-stream",
+            headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     return await service_base.chat_llm(
         user_query=prompt,
         provider = provider,
         model_name = model_name,
-        history = history
+        history = history,
+        use_cache = use_cache,
+        refresh_cache = refresh_cache
+    )
+
+@router.post(
+    "/chat/batch",
+    tags = ["Chat với AI tuỳ chọn"],
+)
+async def chat_batch(request: ChatBatchRequest, cache_control: str = Header(None)):
+    """
+    Chạy nhiều job chat song song (giới hạn số job đồng thời theo từng provider)
+
+    - **jobs**: Danh sách `{"prompt", "provider", "model_name", "history"}`
+    - **stream**: Trả về NDJSON, mỗi dòng một kết quả ngay khi job hoàn thành (theo thứ tự hoàn thành)
+
+    Mỗi kết quả có dạng `{"index", "output", "status_code", "attempts"}`; job lỗi 429/5xx được thử lại với jitter.
+    """
+    directives = (cache_control or "").lower()
+    results = service_base.chat_llm_batch(
+        [job.model_dump() for job in request.jobs],
+        use_cache = "no-store" not in directives,
+        refresh_cache = "no-cache" in directives
     )
 
+    if request.stream:
+        async def ndjson():
+            try:
+                async for result in results:
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+            finally:
+                await results.aclose()
+
+        return StreamingResponse(ndjson(), media_type = "application/x-ndjson")
+
+    ordered = [None] * len(request.jobs)
+    async for result in results:
+        ordered[result["index"]] = result
+    return ordered
+
 @router.post(
     "/branch",
     tags = ["Lấy thông tin các branch"]
 )
 async def get_branch(repo_name: str, access_token: str = Depends(get_access_token), default: bool = False):
-    gh = GitHubRepo(access_token = access_token)
+    gh = github_pool.get(access_token)
     branches = await gh.get_branches(repo_name = repo_name, default = default)
     if branches is None:
         raise HTTPException(status_code=404, detail="Repository not found")
@@ -36,57 +150,175 @@ async def get_branch(repo_name: str, access_token: str = Depends(get_access_toke
     "/structure",
     tags = ["Lấy cấu trúc dạng cây của một repo"]
 )
-async def get_structure(repo_name: str, branch: str = None, access_token: str = Depends(get_access_token)):
-    gh = GitHubRepo(access_token = access_token)
+async def get_structure(request: Request, repo_name: str, branch: str = None, access_token: str = Depends(get_access_token)):
+    gh = github_pool.get(access_token)
     repo_structure = await gh.get_structure(repo_name = repo_name, branch = branch)
     if repo_structure is None:
         raise HTTPException(status_code=404, detail="Repository or branch is not found")
 
-    return repo_structure
+    return negotiated_response(request, repo_structure)
 
 @router.post(
     "/get_content",
     tags = ["Lấy nội dung các file"]
 )
 async def get_content(
+    request: Request,
     repo_name: str, 
     branch: str, 
     access_token: str = Depends(get_access_token), 
     files: list[str] = None,
-    forbidden_extensions: list[str] = None
+    forbidden_extensions: list[str] = None,
+    archive: bool = False
 ):
-    gh = GitHubRepo(access_token = access_token)
-    contents = await gh.get_files_content(
+    """
+    Lấy nội dung các file, dạng `{path: content}` (`null` với file không tồn tại, nhị phân hoặc quá lớn)
+
+    Từ `CONTENT_STREAM_MIN_FILES` file trở lên, kết quả được stream từng file ngay khi tải xong
+    (thứ tự key khi đó là thứ tự tải xong). Header `Accept: application/msgpack` để nhận MessagePack.
+    """
+    gh = github_pool.get(access_token)
+    result = await gh.iter_files_content(
         repo_name = repo_name, 
         branch = branch, 
         files = files,
-        forbidden_extensions = forbidden_extensions
+        forbidden_extensions = forbidden_extensions,
+        archive = archive
     )
-    if not contents:
+    if result is None or not result[0]:
         raise HTTPException(status_code=404, detail="Repo / branch / files not found")
-    
-    return contents
+
+    files, items = result
+    if len(files) < settings.CONTENT_STREAM_MIN_FILES:
+        contents = {file: content async for file, content in items}
+        return negotiated_response(request, {file: contents[file] for file in files})
+
+    async def closing(body):
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await items.aclose()
+
+    if wants_msgpack(request.headers.get("accept")):
+        return StreamingResponse(closing(stream_msgpack_map(len(files), items)), media_type = MSGPACK_TYPES[0])
+    return StreamingResponse(closing(stream_json_object(items)), media_type = "application/json")
 
 @router.post(
     "/get_commit_history",
     tags = ["Lấy lịch sử commit của một repository hoặc một file cụ thể"]
 )
-async def get_commit_history(repo_name: str, branch: str = None, file_path: str = None, access_token: str = Depends(get_access_token)):
-    gh = GitHubRepo(access_token = access_token)
-    commit_history = await gh.get_commit_history(repo_name = repo_name, branch = branch, file_path = file_path)
-    if commit_history is None:
+async def get_commit_history(
+    request: Request,
+    repo_name: str, 
+    branch: str = None, 
+    file_path: str = None, 
+    limit: int = None,
+    since: str = None,
+    until: str = None,
+    cursor: str = None,
+    stream: bool = False,
+    access_token: str = Depends(get_access_token)
+):
+    """
+    Lấy lịch sử commit, có phân trang bằng cursor
+
+    - **limit**: Số commit tối đa trả về (không cung cấp sẽ lấy toàn bộ)
+    - **since** / **until**: Giới hạn thời gian (ISO 8601)
+    - **cursor**: Cursor lấy từ header `X-Next-Cursor` của lần gọi trước
+    - **stream**: Trả về NDJSON, mỗi dòng một commit `{"sha", "message", "cursor"}`, ngay khi từng trang được tải
+    - Header `Accept: application/msgpack` (khi không stream): nhận MessagePack thay vì JSON
+    """
+    gh = github_pool.get(access_token)
+
+    if stream:
+        commits = await gh.iter_commit_history(
+            repo_name = repo_name, branch = branch, file_path = file_path,
+            since = since, until = until, cursor = cursor, limit = limit
+        )
+        if commits is None:
+            raise HTTPException(status_code=404, detail="Repository or branch or file not found")
+
+        async def lines():
+            count = 0
+            try:
+                async for commit, next_cursor in commits:
+                    yield {"sha": commit["sha"], "message": commit["commit"]["message"], "cursor": next_cursor}
+                    count += 1
+                    if limit and count >= limit:
+                        break
+            finally:
+                await commits.aclose()
+
+        return StreamingResponse(stream_ndjson(lines()), media_type = "application/x-ndjson")
+
+    result = await gh.get_commit_history_page(
+        repo_name = repo_name, branch = branch, file_path = file_path,
+        limit = limit, since = since, until = until, cursor = cursor
+    )
+    if result is None:
         raise HTTPException(status_code=404, detail="Repository or branch or file not found")
-    return commit_history
+
+    commit_history, next_cursor = result
+    return negotiated_response(request, commit_history, headers = {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@router.post(
+    "/file_timeline",
+    tags = ["Lấy lịch sử commit"]
+)
+async def get_file_timeline(
+    request: Request,
+    repo_name: str,
+    file_path: str,
+    branch: str = None,
+    limit: int = None,
+    include_content: bool = True,
+    stream: bool = False,
+    access_token: str = Depends(get_access_token)
+):
+    """
+    Lấy các phiên bản của một file qua lịch sử commit, từ mới nhất đến cũ nhất
+
+    - **limit**: Số phiên bản tối đa (không cung cấp sẽ lấy toàn bộ)
+    - **include_content**: Có trả về nội dung file ở từng phiên bản hay không
+    - **stream**: Trả về NDJSON, mỗi dòng một phiên bản ngay khi được dựng lại
+
+    Chỉ nội dung mới nhất được tải; các phiên bản cũ hơn được dựng lại bằng cách áp ngược patch của từng commit
+    và kiểm tra theo blob SHA. File đổi tên vẫn được theo dõi qua tên cũ.
+    """
+    gh = github_pool.get(access_token)
+    versions = await gh.iter_file_timeline(repo_name = repo_name, file_path = file_path, branch = branch, limit = limit)
+    if versions is None:
+        raise HTTPException(status_code=404, detail="Repository or branch or file not found")
+
+    async def items():
+        try:
+            async for version in versions:
+                if not include_content:
+                    version.pop("content")
+                yield version
+        finally:
+            await versions.aclose()
+
+    if stream:
+        return StreamingResponse(stream_ndjson(items()), media_type = "application/x-ndjson")
+
+    return negotiated_response(request, [version async for version in items()])
 
 @router.post(
     "/get_changes",
     tags = ["Tổng hợp nội dung thay đổi qua các commit"]
 )
 async def get_commit_changes(
+    request: Request,
     repo_name: str, 
     branch: str = None, 
     file_path: str = None, 
     commit_id: str = None,
+    output_diff: bool = True,
+    include_file_content: bool = True,
+    start_id: str = None,
+    end_id: str = None,
     access_token: str = Depends(get_access_token)
 ):
     """
@@ -99,14 +331,31 @@ async def get_commit_changes(
     - **include_file_content**: Có bao gồm nội dung file trước và sau khi thay đổi hay không
     - **start_id**: Commit mới nhất (nếu không cung cấp sẽ dùng commit mới nhất trong lịch sử)
     - **end_id**: Commit cũ nhất (nếu không cung cấp sẽ dùng commit cũ nhất trong lịch sử)
+
+    Khi có start_id hoặc end_id, kết quả là thay đổi gộp của cả range
+    end_id..start_id (tính cả end_id), với content_before / content_after
+    cho từng file.
     """
-    gh = GitHubRepo(access_token = access_token)
-    changes = await gh.get_commit_changes(
-        repo_name = repo_name,
-        branch = branch,
-        file_path = file_path,
-        commit_id = commit_id
-    )
+    gh = github_pool.get(access_token)
+    if start_id is not None or end_id is not None:
+        changes = await gh.get_range_changes(
+            repo_name = repo_name,
+            branch = branch,
+            file_path = file_path,
+            start_id = start_id,
+            end_id = end_id,
+            output_diff = output_diff,
+            include_file_content = include_file_content
+        )
+    else:
+        changes = await gh.get_commit_changes(
+            repo_name = repo_name,
+            branch = branch,
+            file_path = file_path,
+            commit_id = commit_id,
+            include_file_content = include_file_content,
+            output_diff = output_diff
+        )
     
     if changes is None:
         raise HTTPException(
@@ -114,4 +363,154 @@ async def get_commit_changes(
             detail="Repository, branch, commit hoặc file không tìm thấy"
         )
     
-    return changes
\ No newline at end of file
+    return negotiated_response(request, changes)
+
+@router.post(
+    "/summarize",
+    tags = ["Tóm tắt repository"]
+)
+async def summarize_repo(
+    repo_name: str,
+    provider: str,
+    model_name: str,
+    branch: str = None,
+    extensions: list[str] = None,
+    query: str = None,
+    stream: bool = False,
+    cache_control: str = Header(None),
+    access_token: str = Depends(get_access_token)
+):
+    """
+    Phân tích từng file của repository bằng LLM (song song) rồi gộp thành JSON cấu trúc project
+
+    - **extensions**: Các loại file cần phân tích (mặc định `["py"]`)
+    - **query**: Prompt (không bắt buộc) cần kiểm tra trên cấu trúc project, dùng `SUMMARIZE_PROMPT`
+    - **stream**: Trả về NDJSON tiến độ: `{"type": "start"}`, mỗi file xong một dòng `{"type": "file", "done", "total"}`, cuối cùng là `{"type": "result"}`
+    - Header `Cache-Control: no-cache`: phân tích lại mọi file, bỏ qua kết quả đã cache theo blob SHA
+
+    Kết quả từng file được cache theo blob SHA: lần chạy sau chỉ phân tích các file đã thay đổi.
+    """
+    gh = github_pool.get(access_token)
+    events = await service_base.retrieve_repo_info(
+        gh,
+        repo_name = repo_name,
+        branch = branch,
+        provider = provider,
+        model_name = model_name,
+        extensions = extensions,
+        query = query,
+        refresh_cache = "no-cache" in (cache_control or "").lower()
+    )
+    if events is None:
+        raise HTTPException(status_code=404, detail="Repository or branch not found")
+
+    if stream:
+        async def ndjson():
+            try:
+                async for event in events:
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            finally:
+                await events.aclose()
+
+        return StreamingResponse(ndjson(), media_type = "application/x-ndjson")
+
+    try:
+        async for event in events:
+            if event["type"] == "result":
+                return event
+    finally:
+        await events.aclose()
+    raise HTTPException(status_code=502, detail="Summary did not produce a result")
+
+@router.post(
+    "/search",
+    tags = ["Tìm kiếm code"]
+)
+async def search_code(
+    repo_name: str,
+    q: str,
+    branch: str = None,
+    regex: bool = False,
+    case_sensitive: bool = False,
+    paths: list[str] = None,
+    limit: int = 100,
+    access_token: str = Depends(get_access_token)
+):
+    """
+    Tìm kiếm chuỗi hoặc regex trong các file của repository, dùng trigram index theo commit
+
+    - **q**: Chuỗi cần tìm (hoặc regex nếu `regex=true`)
+    - **paths**: Các glob đường dẫn cần tìm (body, ví dụ `["src/**/*.py", "*.md"]`)
+    - **limit**: Số dòng kết quả tối đa (không vượt quá `SEARCH_MAX_RESULTS`)
+
+    Lần tìm đầu tiên trên một commit sẽ index các file text của commit đó; khi branch có commit mới,
+    chỉ các file đã thay đổi được tải và index thêm.
+    """
+    gh = github_pool.get(access_token)
+    result = await search_index.search(
+        gh,
+        repo_name = repo_name,
+        query = q,
+        branch = branch,
+        regex = regex,
+        case_sensitive = case_sensitive,
+        paths = paths,
+        limit = limit
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="Repository or branch not found")
+    return result
+
+@router.post(
+    "/webhook/github",
+    tags = ["Webhook GitHub"],
+    status_code = 202
+)
+async def github_webhook(
+    request: Request,
+    x_github_event: str = Header(None),
+    x_hub_signature_256: str = Header(None),
+    x_github_delivery: str = Header(None)
+):
+    """
+    Nhận webhook `push`, `create`, `delete` của GitHub (content type `application/json`)
+
+    Chữ ký `X-Hub-Signature-256` được kiểm tra bằng `GITHUB_WEBHOOK_SECRET`. Cache branch / lịch sử commit của ref
+    bị ảnh hưởng được xoá ngay; với `push`, tree mới và nội dung các file thay đổi được tải trước ở background.
+    """
+    if not webhook_processor.secret:
+        raise HTTPException(status_code=503, detail="Webhook secret not configured")
+    body = await request.body()
+    if not verify_signature(webhook_processor.secret, body, x_hub_signature_256):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    if x_github_event not in HANDLED_EVENTS:
+        return {"event": x_github_event, "delivery": x_github_delivery, "ignored": True}
+    try:
+        summary = webhook_processor.handle(x_github_event, json.loads(body))
+    except ValueError as e:
+        # Body không phải JSON, hoặc thiếu repository.full_name / ref
+        raise HTTPException(status_code=400, detail=f"Invalid webhook payload: {e}")
+    return {"delivery": x_github_delivery, **summary}
+
+@router.get(
+    "/cache_stats",
+    tags = ["Thống kê cache"]
+)
+async def cache_stats(admin_token = Depends(get_admin_access)):
+    if admin_token.credentials != superuser_auth.SUPERUSER_TOKEN:
+        raise HTTPException(status_code=403, detail="Superuser token required")
+
+    return {
+        "blob_cache": blob_cache.stats(),
+        "metadata_cache": metadata_cache.stats(),
+        "llm_cache": completion_cache.stats(),
+        "summary_cache": summary_cache.stats(),
+        "search_index": search_index.stats(),
+        "retrieval_index": retrieval_indexes.stats(),
+        "webhook": webhook_processor.stats(),
+        "github_scheduler": github_scheduler.stats(),
+        "github_singleflight": github_flights.stats(),
+        "llm_singleflight": llm_flights.stats(),
+        "llm_routing": llm_router.stats()
+    }
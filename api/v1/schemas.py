@@ -0,0 +1,15 @@
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+from configs.config import settings
+
+
+class ChatJob(BaseModel):
+    prompt: str
+    provider: Literal["gemini", "openai", "claude", "deepseek"]
+    model_name: str
+    history: Optional[List[Dict]] = None
+
+
+class ChatBatchRequest(BaseModel):
+    jobs: List[ChatJob] = Field(min_length = 1, max_length = settings.LLM_BATCH_MAX_JOBS)
+    stream: bool = False
@@ -0,0 +1,73 @@
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class UpstreamProfile:
+    """Latency and failures injected by a fake upstream server"""
+    latency: float = 0.0        # giây, cộng vào mỗi response
+    jitter: float = 0.0         # giây, ngẫu nhiên đều trong [0, jitter]
+    error_rate: float = 0.0     # tỉ lệ request trả về error_status
+    error_status: int = 503
+    seed: int = 0
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+
+    def delay(self):
+        return self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def fails(self):
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+
+def add_profile_arguments(parser, prefix = ""):
+    parser.add_argument(f"--{prefix}latency", type = float, default = 0.0, help = "seconds added to every response")
+    parser.add_argument(f"--{prefix}jitter", type = float, default = 0.0, help = "extra uniform random latency (seconds)")
+    parser.add_argument(f"--{prefix}error-rate", type = float, default = 0.0, help = "fraction of requests answered with an error")
+    parser.add_argument(f"--{prefix}error-status", type = int, default = 503)
+
+
+def profile_from_args(args, prefix = ""):
+    prefix = prefix.replace("-", "_")
+    return UpstreamProfile(
+        latency = getattr(args, f"{prefix}latency"),
+        jitter = getattr(args, f"{prefix}jitter"),
+        error_rate = getattr(args, f"{prefix}error_rate"),
+        error_status = getattr(args, f"{prefix}error_status"),
+    )
+
+
+def instrumented_app(profile):
+    """aiohttp app that counts calls per route and applies ``profile`` to every route but ``/_bench``.
+
+    ``GET /_bench/calls`` returns the counts; ``?reset=1`` also clears them.
+    """
+    calls = Counter()
+
+    @web.middleware
+    async def inject(request, handler):
+        if request.path.startswith("/_bench/"):
+            return await handler(request)
+        resource = request.match_info.route.resource
+        calls[f"{request.method} {resource.canonical if resource is not None else request.path}"] += 1
+        delay = profile.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        if profile.fails():
+            return web.json_response({"message": "Injected failure"}, status = profile.error_status)
+        return await handler(request)
+
+    async def bench_calls(request):
+        counts = dict(calls)
+        if request.query.get("reset"):
+            calls.clear()
+        return web.json_response(counts)
+
+    app = web.Application(middlewares = [inject], client_max_size = 64 * 1024 * 1024)
+    app.router.add_get("/_bench/calls", bench_calls)
+    return app
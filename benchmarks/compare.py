@@ -0,0 +1,73 @@
+"""Compare two ``benchmarks.load`` result files and flag regressions.
+
+    python -m benchmarks.compare base.json head.json --threshold 0.10
+
+Exits with status 1 when a scenario got slower (p50 / p95 / p99 above
+``threshold``), lost throughput, made more upstream calls per request,
+or returned more errors; or when the peak RSS grew above ``threshold``.
+"""
+import argparse
+import json
+import sys
+
+
+def relative(base, head):
+    if base in (None, 0) or head is None:
+        return None
+    return (head - base) / base
+
+
+def compare(base, head, threshold, min_delta):
+    """Yield ``(scenario, metric, base, head, change, regressed)``"""
+    for name, new in head["scenarios"].items():
+        old = base["scenarios"].get(name)
+        if old is None:
+            continue
+        for quantile in ("p50", "p95", "p99"):
+            before, after = old["latency"][quantile], new["latency"][quantile]
+            change = relative(before, after)
+            # Chênh lệch tuyệt đối quá nhỏ (vài ms) là nhiễu, không tính là regression
+            regressed = change is not None and change > threshold and after - before > min_delta
+            yield name, f"latency.{quantile}", before, after, change, regressed
+
+        change = relative(old["throughput_rps"], new["throughput_rps"])
+        yield name, "throughput_rps", old["throughput_rps"], new["throughput_rps"], change, change is not None and change < -threshold
+
+        for upstream, after in new["upstream_calls_per_request"].items():
+            before = old["upstream_calls_per_request"].get(upstream, 0)
+            yield name, f"upstream.{upstream}", before, after, relative(before, after), after > before * (1 + threshold) and after - before >= 0.5
+
+        yield name, "errors", old["errors"], new["errors"], relative(old["errors"], new["errors"]), new["errors"] > old["errors"]
+
+    change = relative(base.get("app_peak_rss_bytes"), head.get("app_peak_rss_bytes"))
+    yield "*", "app_peak_rss_bytes", base.get("app_peak_rss_bytes"), head.get("app_peak_rss_bytes"), change, change is not None and change > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type = float, default = 0.10, help = "relative change counted as a regression")
+    parser.add_argument("--min-delta", type = float, default = 0.002, help = "ignore latency changes smaller than this (seconds)")
+    parser.add_argument("--all", action = "store_true", help = "print every metric, not only regressions")
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+
+    print(f"base {base['meta']['git_commit']}  head {head['meta']['git_commit']}")
+    for key in sorted((set(base["meta"]["config"]) | set(head["meta"]["config"])) - {"output"}):
+        if base["meta"]["config"].get(key) != head["meta"]["config"].get(key):
+            print(f"warning: {key} differs ({base['meta']['config'].get(key)} vs {head['meta']['config'].get(key)})")
+    regressions = 0
+    for name, metric, before, after, change, regressed in compare(base, head, args.threshold, args.min_delta):
+        regressions += regressed
+        if regressed or args.all:
+            shown = f"{change:+.1%}" if change is not None else "n/a"
+            print(f"{'REGRESSION ' if regressed else '           '}{name:24} {metric:22} {before!s:>14} -> {after!s:<14} {shown}")
+    print(f"{regressions} regression(s)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""Fake GitHub REST / GraphQL API serving a ``SyntheticRepo``.
+
+Covers the endpoints the service calls (repo, branches, trees, blobs,
+contents, commits, compare, languages, tarball, GraphQL ref / tree /
+blob / history queries), with ETag revalidation and optional
+``X-RateLimit-*`` quotas per token.
+
+    python -m benchmarks.fake_github --port 9001 --files 10000 --commits 5000 --latency 0.05
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import re
+import time
+
+from aiohttp import web
+
+from .common import add_profile_arguments, instrumented_app, profile_from_args
+from .synthetic import SyntheticRepo
+
+
+COMMIT_FILES_PAGE = 300
+COMPARE_MAX_FILES = 300
+COMPARE_MAX_COMMITS = 250
+
+
+class RateLimits:
+    """Hourly request quota per token, reported like GitHub's ``X-RateLimit-*`` headers"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._windows = {}   # token -> (reset_at, remaining)
+
+    def take(self, token, spend = True):
+        """Headers for this response, or None if the token is out of quota"""
+        if not self.limit:
+            return {}
+        now = time.time()
+        reset_at, remaining = self._windows.get(token, (0, 0))
+        if reset_at <= now:
+            reset_at, remaining = int(now) + 3600, self.limit
+        if spend and remaining > 0:
+            remaining -= 1
+        elif spend:
+            return None
+        self._windows[token] = (reset_at, remaining)
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset_at),
+        }
+
+
+class FakeGitHub:
+    def __init__(self, repo, profile, rate_limit = 0):
+        self.repo = repo
+        self.profile = profile
+        self.limits = RateLimits(rate_limit)
+        self.tree_commits = {repo.tree_sha(i): i for i in range(len(repo.shas))}
+
+    # --- helpers ---
+
+    def _base_url(self, request):
+        return f"{request.scheme}://{request.host}"
+
+    def _json(self, request, body, status = 200):
+        token = request.headers.get("Authorization", "")
+        data = json.dumps(body).encode()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        # 304 không tính vào quota, giống GitHub
+        not_modified = status == 200 and request.headers.get("If-None-Match") == etag
+        headers = self.limits.take(token, spend = not not_modified)
+        if headers is None:
+            headers = self.limits.take(token, spend = False)
+            return web.json_response({"message": "API rate limit exceeded"}, status = 403, headers = headers)
+        if not_modified:
+            return web.Response(status = 304, headers = {**headers, "ETag": etag})
+        return web.Response(body = data, status = status, content_type = "application/json", headers = {**headers, "ETag": etag})
+
+    def _not_found(self, request):
+        return self._json(request, {"message": "Not Found"}, status = 404)
+
+    def _check_repo(self, request):
+        return f"{request.match_info['owner']}/{request.match_info['repo']}" == self.repo.full_name
+
+    # --- REST ---
+
+    async def user(self, request):
+        return self._json(request, {"login": self.repo.owner, "id": 1, "type": "User"})
+
+    async def get_repo(self, request):
+        if not self._check_repo(request):
+            return self._not_found(request)
+        base = self._base_url(request)
+        return self._json(request, {
+            "id": 1,
+            "name": self.repo.name,
+            "full_name": self.repo.full_name,
+            "owner": {"login": self.repo.owner, "id": 1, "type": "User"},
+            "private": False,
+            "default_branch": self.repo.default_branch,
+            "url": f"{base}/repos/{self.repo.full_name}",
+            "html_url": f"https://github.com/{self.repo.full_name}",
+            "languages_url": f"{base}/repos/{self.repo.full_name}/languages",
+        })
+
+    async def branches(self, request):
+        if not self._check_repo(request):
+            return self._not_found(request)
+        per_page, page = int(request.query.get("per_page", 30)), int(request.query.get("page", 1))
+        names = sorted(self.repo.branches)[(page - 1) * per_page:page * per_page]
+        return self._json(request, [
+            {"name": name, "commit": {"sha": self.repo.shas[self.repo.branches[name]]}, "protected": False}
+            for name in names
+        ])
+
+    async def branch(self, request):
+        commit = self.repo.branches.get(request.match_info["branch"])
+        if not self._check_repo(request) or commit is None:
+            return self._not_found(request)
+        return self._json(request, {"name": request.match_info["branch"], "commit": self.repo.commit_summary(commit)})
+
+    async def tree(self, request):
+        sha = request.match_info["sha"]
+        commit = self.tree_commits.get(sha, self.repo.resolve(sha))
+        if not self._check_repo(request) or commit is None:
+            return self._not_found(request)
+        entries = self.repo.tree(commit)
+        if not request.query.get("recursive"):
+            entries = [entry for entry in entries if "/" not in entry["path"]]
+        return self._json(request, {"sha": self.repo.tree_sha(commit), "tree": entries, "truncated": False})
+
+    async def blob(self, request):
+        sha = request.match_info["sha"]
+        data = self.repo.blob(sha)
+        if not self._check_repo(request) or data is None:
+            return self._not_found(request)
+        if request.headers.get("Accept") == "application/vnd.github.raw":
+            headers = self.limits.take(request.headers.get("Authorization", ""))
+            if headers is None:
+                return web.json_response({"message": "API rate limit exceeded"}, status = 403)
+            return web.Response(body = data, headers = headers)
+        return self._json(request, {
+            "sha": sha, "size": len(data), "encoding": "base64",
+            "content": base64.b64encode(data).decode(),
+        })
+
+    async def contents(self, request):
+        path = request.match_info["path"]
+        commit = self.repo.resolve(request.query.get("ref"))
+        file = self.repo.file_index.get(path)
+        if not self._check_repo(request) or commit is None or file is None:
+            return self._not_found(request)
+        data = self.repo.content(file, self.repo.version(file, commit))
+        base = self._base_url(request)
+        return self._json(request, {
+            "type": "file", "encoding": "base64", "size": len(data),
+            "name": path.rsplit("/", 1)[-1], "path": path,
+            "sha": self.repo.blob_sha(file, self.repo.version(file, commit)),
+            "url": f"{base}/repos/{self.repo.full_name}/contents/{path}",
+            "content": base64.b64encode(data).decode(),
+        })
+
+    async def commits(self, request):
+        query = request.query
+        head = self.repo.resolve(query.get("sha"))
+        if not self._check_repo(request) or head is None:
+            return self._not_found(request)
+        per_page, page = min(100, int(query.get("per_page", 30))), int(query.get("page", 1))
+        history = self.repo.history(head, query.get("path"), query.get("since"), query.get("until"))
+        return self._json(request, [
+            self.repo.commit_summary(commit)
+            for commit in itertools.islice(history, (page - 1) * per_page, page * per_page)
+        ])
+
+    async def commit(self, request):
+        commit = self.repo.resolve(request.match_info["ref"])
+        if not self._check_repo(request) or commit is None:
+            return self._not_found(request)
+        page = int(request.query.get("page", 1))
+        files = self.repo.commit_files(commit)
+        return self._json(request, {
+            **self.repo.commit_summary(commit),
+            "stats": {
+                "additions": sum(file["additions"] for file in files),
+                "deletions": sum(file["deletions"] for file in files),
+                "total": sum(file["changes"] for file in files),
+            },
+            "files": files[(page - 1) * COMMIT_FILES_PAGE:page * COMMIT_FILES_PAGE],
+        })
+
+    async def compare(self, request):
+        base_ref, _, head_ref = request.match_info["basehead"].partition("...")
+        base, head = self.repo.resolve(base_ref), self.repo.resolve(head_ref)
+        if not self._check_repo(request) or base is None or head is None:
+            return self._not_found(request)
+        ahead = max(0, head - base)
+        return self._json(request, {
+            "status": "identical" if head == base else "ahead" if head > base else "behind",
+            "ahead_by": ahead,
+            "behind_by": max(0, base - head),
+            "total_commits": ahead,
+            "base_commit": self.repo.commit_summary(base),
+            "merge_base_commit": self.repo.commit_summary(min(base, head)),
+            "commits": [self.repo.commit_summary(i) for i in range(base + 1, head + 1)][:COMPARE_MAX_COMMITS],
+            "files": self.repo.compare(base, head)[:COMPARE_MAX_FILES] if head > base else [],
+        })
+
+    async def languages(self, request):
+        if not self._check_repo(request):
+            return self._not_found(request)
+        return self._json(request, self.repo.languages())
+
+    async def tarball(self, request):
+        commit = self.repo.resolve(request.match_info["ref"])
+        if not self._check_repo(request) or commit is None:
+            return self._not_found(request)
+        data = self.repo.tarball(commit)
+        response = web.StreamResponse(headers = {"Content-Type": "application/x-gzip"})
+        await response.prepare(request)
+        for start in range(0, len(data), 64 * 1024):
+            await response.write(data[start:start + 64 * 1024])
+        await response.write_eof()
+        return response
+
+    # --- GraphQL ---
+
+    def _tree_entries(self, commit, path, depth):
+        entries = []
+        for name, kind, oid, size in self.repo.children(commit, path):
+            child = f"{path}/{name}" if path else name
+            if kind == "blob":
+                obj = {"byteSize": size}
+            else:
+                obj = {"entries": self._tree_entries(commit, child, depth - 1)} if depth > 1 else {}
+            entries.append({"name": name, "type": kind, "oid": oid, "object": obj})
+        return entries
+
+    def _blob_object(self, expression):
+        rev, _, path = expression.partition(":")
+        commit, file = self.repo.resolve(rev), self.repo.file_index.get(path)
+        if commit is not None and file is None and path.rstrip("/") in self.repo.layout:
+            # Thư mục: fragment `... on Blob` của GitHub trả về object rỗng
+            return {}
+        if commit is None or file is None:
+            return None
+        version = self.repo.version(file, commit)
+        data = self.repo.content(file, version)
+        binary = self.repo.is_binary(file)
+        return {
+            "oid": self.repo.blob_sha(file, version),
+            "byteSize": len(data),
+            "isBinary": binary,
+            "isTruncated": False,
+            "text": None if binary else data.decode(),
+        }
+
+    def _history(self, variables):
+        head = self.repo.resolve(variables["rev"])
+        if head is None:
+            return None
+        offset = int(variables.get("after") or 0)
+        first = variables["first"]
+        history = self.repo.history(head, variables.get("path"), variables.get("since"), variables.get("until"))
+        commits = list(itertools.islice(history, offset, offset + first + 1))
+        nodes = [
+            {
+                "oid": self.repo.shas[commit],
+                "message": summary["commit"]["message"],
+                "author": summary["commit"]["author"],
+                "changedFilesIfAvailable": len(self.repo.changes[commit]),
+            }
+            for commit, summary in ((commit, self.repo.commit_summary(commit)) for commit in commits[:first])
+        ]
+        return {"history": {
+            "pageInfo": {"hasNextPage": len(commits) > first, "endCursor": str(offset + len(nodes))},
+            "nodes": nodes,
+        }}
+
+    async def graphql(self, request):
+        payload = await request.json()
+        query, variables = payload["query"], payload.get("variables") or {}
+        if (variables.get("owner"), variables.get("name")) != (self.repo.owner, self.repo.name):
+            return self._json(request, {"data": {"repository": None}, "errors": [{"type": "NOT_FOUND", "message": "Could not resolve to a Repository"}]})
+
+        repository = {}
+        if "history(" in query:
+            repository["object"] = self._history(variables)
+            return self._json(request, {"data": {"repository": repository}})
+
+        subtrees = re.findall(r't(\d+): object\(oid: "([0-9a-f]+)"\)', query)
+        roots = len(subtrees) or 1
+        depth = query.count("entries {") // roots
+
+        for key in ("defaultBranchRef", "ref"):
+            if (key == "ref" and "ref(qualifiedName" not in query) or (key == "defaultBranchRef" and key not in query):
+                continue
+            commit = self.repo.resolve(variables.get("ref"))
+            if commit is None:
+                repository[key] = None
+                continue
+            tree = {"oid": self.repo.tree_sha(commit)}
+            if depth:
+                tree["entries"] = self._tree_entries(commit, "", depth)
+            name = variables["ref"].removeprefix("refs/heads/") if key == "ref" else self.repo.default_branch
+            target = {"oid": self.repo.shas[commit], "tree": tree}
+            # Commit.file(path:): file đọc từ đúng commit mà ref trỏ tới
+            for alias, variable in re.findall(r"f(\d+): file\(path: \$(p\d+)\)", query):
+                found = self._blob_object(f"{self.repo.shas[commit]}:{variables[variable]}")
+                target[f"f{alias}"] = {"object": found} if found is not None else None
+            repository[key] = {"name": name, "target": target}
+
+        for alias, oid in subtrees:
+            found = self.repo.subtree(oid)
+            repository[f"t{alias}"] = {"entries": self._tree_entries(*found, depth)} if found else None
+        for alias, variable in re.findall(r"f(\d+): object\(expression: \$(p\d+)\)", query):
+            repository[f"f{alias}"] = self._blob_object(variables[variable])
+        if "object(expression: $expr)" in query:
+            repository["object"] = {"oid": "0" * 40} if self._blob_object(variables["expr"]) else None
+
+        return self._json(request, {"data": {"repository": repository}})
+
+    def app(self):
+        app = instrumented_app(self.profile)
+        prefix = "/repos/{owner}/{repo}"
+        app.add_routes([
+            web.get("/user", self.user),
+            web.get(prefix, self.get_repo),
+            web.get(f"{prefix}/branches", self.branches),
+            web.get(f"{prefix}/branches/{{branch}}", self.branch),
+            web.get(f"{prefix}/git/trees/{{sha}}", self.tree),
+            web.get(f"{prefix}/git/blobs/{{sha}}", self.blob),
+            web.get(f"{prefix}/contents/{{path:.+}}", self.contents),
+            web.get(f"{prefix}/commits", self.commits),
+            web.get(f"{prefix}/commits/{{ref}}", self.commit),
+            web.get(f"{prefix}/compare/{{basehead}}", self.compare),
+            web.get(f"{prefix}/languages", self.languages),
+            web.get(f"{prefix}/tarball/{{ref}}", self.tarball),
+            web.post("/graphql", self.graphql),
+        ])
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Fake GitHub API serving a synthetic repository")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 9001)
+    parser.add_argument("--files", type = int, default = 1000)
+    parser.add_argument("--commits", type = int, default = 500)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--rate-limit", type = int, default = 0, help = "requests per hour per token (0: no quota headers)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    repo = SyntheticRepo(files = args.files, commits = args.commits, seed = args.seed)
+    fake = FakeGitHub(repo, profile_from_args(args), rate_limit = args.rate_limit)
+    web.run_app(fake.app(), host = args.host, port = args.port, print = None, access_log = None)
+
+
+if __name__ == "__main__":
+    main()
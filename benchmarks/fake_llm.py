@@ -0,0 +1,137 @@
+"""Fake OpenAI / DeepSeek / Gemini / Claude completion APIs.
+
+Each provider lives under its own prefix so one server stands in for all
+four (``/openai/v1``, ``/deepseek``, ``/gemini/v1``, ``/claude/v1``).
+Answers are deterministic in the request body; ``--tokens`` and
+``--token-delay`` shape the generation time, streamed or not. Prompts
+asking for the ``JSON format`` (the per-file extraction of ``/summarize``)
+get a JSON answer.
+
+    python -m benchmarks.fake_llm --port 9002 --latency 0.3 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+
+from aiohttp import web
+
+from .common import add_profile_arguments, instrumented_app, profile_from_args
+
+
+class FakeLLM:
+    def __init__(self, profile, tokens = 50, token_delay = 0.0):
+        self.profile = profile
+        self.tokens = tokens
+        self.token_delay = token_delay
+
+    def _answer(self, body):
+        seed = hashlib.sha256(json.dumps(body, sort_keys = True).encode()).hexdigest()[:8]
+        return [f"{'answer' if i == 0 else 'token'}{seed if i == 0 else i} " for i in range(self.tokens)]
+
+    @staticmethod
+    def _texts(body):
+        """Every prompt text of an OpenAI / Gemini / Claude request body"""
+        parts = [part for message in body.get("messages", []) for part in message["content"]] if "messages" in body else []
+        parts += [part for content in body.get("contents", []) for part in content["parts"]]
+        parts += body.get("system", []) if isinstance(body.get("system"), list) else []
+        return [part if isinstance(part, str) else part.get("text", "") for part in parts]
+
+    async def _complete(self, body):
+        tokens = self._answer(body)
+        if self.token_delay:
+            await asyncio.sleep(self.token_delay * len(tokens))
+        if any("JSON format" in text for text in self._texts(body)):
+            # Prompt trích xuất từng file của /summarize: trả về JSON đọc được
+            return json.dumps([{"function_name": tokens[0].strip(), "describe": "".join(tokens[1:]).strip(), "input_parameters": {}, "return_value": None}])
+        return "".join(tokens)
+
+    async def _stream(self, request, events):
+        """Send ``events`` (already-encoded SSE strings per token) paced by ``token_delay``"""
+        response = web.StreamResponse(headers = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        for event in events:
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            await response.write(event.encode())
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def _sse(data, event = None):
+        return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        if body.get("stream"):
+            tokens = self._answer(body)
+            events = [self._sse({"choices": [{"index": 0, "delta": {"content": token}}]}) for token in tokens]
+            events += [self._sse({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}), "data: [DONE]\n\n"]
+            return await self._stream(request, events)
+        text = await self._complete(body)
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": self.tokens, "total_tokens": 10 + self.tokens},
+        })
+
+    async def gemini(self, request):
+        body = await request.json()
+        _, _, method = request.match_info["call"].partition(":")
+        if method == "streamGenerateContent":
+            tokens = self._answer(body)
+            events = [self._sse({"candidates": [{"content": {"role": "model", "parts": [{"text": token}]}}]}) for token in tokens]
+            return await self._stream(request, events)
+        if method != "generateContent":
+            return web.json_response({"error": {"message": f"Unknown method {method}"}}, status = 404)
+        text = await self._complete(body)
+        return web.json_response({"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]})
+
+    async def claude(self, request):
+        body = await request.json()
+        if body.get("stream"):
+            tokens = self._answer(body)
+            events = [self._sse({"type": "message_start", "message": {"id": "msg_bench", "model": body.get("model")}}, "message_start")]
+            events += [
+                self._sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+                for token in tokens
+            ]
+            events.append(self._sse({"type": "message_stop"}, "message_stop"))
+            return await self._stream(request, events)
+        text = await self._complete(body)
+        return web.json_response({
+            "id": "msg_bench",
+            "type": "message",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 10, "output_tokens": self.tokens},
+        })
+
+    def app(self):
+        app = instrumented_app(self.profile)
+        app.add_routes([
+            web.post("/openai/v1/chat/completions", self.chat_completions),
+            web.post("/deepseek/chat/completions", self.chat_completions),
+            web.post("/gemini/v1/models/{call}", self.gemini),
+            web.post("/claude/v1/messages", self.claude),
+        ])
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Fake LLM provider APIs")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 9002)
+    parser.add_argument("--tokens", type = int, default = 50, help = "tokens per answer")
+    parser.add_argument("--token-delay", type = float, default = 0.0, help = "seconds per generated token")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeLLM(profile_from_args(args), tokens = args.tokens, token_delay = args.token_delay)
+    web.run_app(fake.app(), host = args.host, port = args.port, print = None, access_log = None)
+
+
+if __name__ == "__main__":
+    main()
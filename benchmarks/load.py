@@ -0,0 +1,394 @@
+"""Load driver: start the fakes and the API, exercise every ``/api/v1`` endpoint, report.
+
+For each scenario the first request runs alone (cold), the rest run with
+``--concurrency`` workers. Reported per scenario: throughput, latency
+percentiles, time to first byte, status codes, upstream calls counted by
+the fake servers, and the API process RSS; plus the peak RSS of the run.
+Results are written as JSON (``--output``) for ``benchmarks.compare``.
+
+    python -m benchmarks.load --files 10000 --commits 5000 --github-latency 0.05 --output base.json
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+import aiohttp
+
+from .common import add_profile_arguments
+from .synthetic import SyntheticRepo
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GITHUB_TOKEN = "bench-token"
+ADMIN_TOKEN = "bench-admin"
+WEBHOOK_SECRET = "bench-webhook"
+MODELS = {
+    "openai": "gpt-4o-mini",
+    "claude": "claude-3-5-sonnet-20241022",
+    "gemini": "gemini-1.5-flash",
+    "deepseek": "deepseek-chat",
+}
+
+
+@dataclass
+class Sample:
+    latency: float
+    ttfb: float
+    status: int
+    size: int
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def process_memory(pid):
+    """``(rss, peak rss)`` in bytes from /proc (Linux), or ``(None, None)``"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def git_revision():
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd = ROOT, capture_output = True, text = True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return git("rev-parse", "HEAD"), bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def build_scenarios(repo, batch_size):
+    """name -> ``build(i)`` returning the i-th request of the scenario"""
+    name = repo.full_name
+    auth = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
+    text_files = [path for path in repo.paths if not path.endswith(".png")]
+    commits = len(repo.shas)
+
+    def github(path, params = None, body = None):
+        # params / body có thể là hàm của một Random riêng cho từng request (chọn file, commit ngẫu nhiên)
+        def build(i):
+            rng = random.Random(i)
+            return {
+                "method": "POST", "path": f"/api/v1{path}",
+                "params": params(rng) if callable(params) else params,
+                "json": body(rng) if callable(body) else body,
+                "headers": auth,
+            }
+        return build
+
+    def chat(provider, stream = False, grounded = False):
+        def build(i):
+            params = {"prompt": f"Question {i} about {name}", "provider": provider, "model_name": MODELS[provider], "stream": str(stream).lower()}
+            if grounded:
+                # Chat dựa trên code của repo: câu hỏi nhắc tới một file để BM25 có đoạn code để lấy
+                params.update(prompt = f"What does file{random.Random(i).randrange(len(repo.paths))} edit?", repo_name = name, branch = "main")
+            return {"method": "POST", "path": "/api/v1/chat", "params": params, "json": None, "headers": auth if grounded else {}}
+        return build
+
+    def push(i):
+        # Push của commit cuối lên main, ký như GitHub; mỗi delivery xoá cache của branch và tải trước file thay đổi
+        head = commits - 1
+        payload = {
+            "ref": "refs/heads/main", "before": repo.shas[head - 1], "after": repo.shas[head],
+            "repository": {"full_name": name},
+            "commits": [{"id": repo.shas[head], "modified": [change["filename"] for change in repo.commit_files(head)]}],
+        }
+        body = json.dumps(payload).encode()
+        return {
+            "method": "POST", "path": "/api/v1/webhook/github", "params": None, "json": None, "data": body,
+            "headers": {
+                "Content-Type": "application/json",
+                "X-GitHub-Event": "push",
+                "X-GitHub-Delivery": f"bench-{i}",
+                "X-Hub-Signature-256": "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest(),
+            },
+        }
+
+    def window(rng, size):
+        start = rng.randrange(max(1, commits - size))
+        return repo.shas[start], repo.shas[min(commits - 1, start + size)]
+
+    scenarios = {
+        "branch": github("/branch", {"repo_name": name}),
+        "branch_default": github("/branch", {"repo_name": name, "default": "true"}),
+        "structure": github("/structure", {"repo_name": name, "branch": "main"}),
+        "get_content": github("/get_content", {"repo_name": name, "branch": "main"}, lambda rng: {"files": rng.sample(text_files, min(10, len(text_files)))}),
+        "get_content_archive": github("/get_content", {"repo_name": name, "branch": "main", "archive": "true"}, lambda rng: {"files": rng.sample(text_files, min(10, len(text_files)))}),
+        "commit_history": github("/get_commit_history", {"repo_name": name, "limit": 100}),
+        "commit_history_file": github("/get_commit_history", lambda rng: {"repo_name": name, "file_path": rng.choice(text_files), "limit": 20}),
+        "commit_history_stream": github("/get_commit_history", {"repo_name": name, "limit": min(commits, 1000), "stream": "true"}),
+        "file_timeline": github("/file_timeline", lambda rng: {"repo_name": name, "file_path": rng.choice(text_files), "limit": 20}),
+        "file_timeline_full": github("/file_timeline", lambda rng: {"repo_name": name, "file_path": rng.choice(text_files), "stream": "true"}),
+        "file_timeline_metadata": github("/file_timeline", lambda rng: {"repo_name": name, "file_path": rng.choice(text_files), "include_content": "false"}),
+        "changes_latest": github("/get_changes", {"repo_name": name, "branch": "main"}),
+        "changes_commit": github("/get_changes", lambda rng: {"repo_name": name, "commit_id": rng.choice(repo.shas[1:] or repo.shas)}),
+        "changes_range": github("/get_changes", lambda rng: dict(zip(("end_id", "start_id"), window(rng, 20)), repo_name = name, output_diff = "true")),
+        **{f"chat_{provider}": chat(provider) for provider in MODELS},
+        "chat_stream_openai": chat("openai", stream = True),
+        "chat_stream_claude": chat("claude", stream = True),
+        "chat_repo_openai": chat("openai", grounded = True),
+        "chat_repo_stream_claude": chat("claude", stream = True, grounded = True),
+        "chat_batch": lambda i: {
+            "method": "POST", "path": "/api/v1/chat/batch", "params": None, "headers": {},
+            "json": {"jobs": [
+                {"prompt": f"Batch {i} job {j}", "provider": provider, "model_name": MODELS[provider]}
+                for j, provider in zip(range(batch_size), list(MODELS) * batch_size)
+            ]},
+        },
+        # Lần đầu phân tích mọi file .py (cold), các lần sau dùng kết quả đã cache theo blob SHA
+        "summarize": github("/summarize", {"repo_name": name, "branch": "main", "provider": "openai", "model_name": MODELS["openai"]}),
+        "summarize_query": github("/summarize", lambda rng: {
+            "repo_name": name, "branch": "main", "provider": "openai", "model_name": MODELS["openai"], "query": f"Where is file{rng.randrange(len(repo.paths))} parsed?"
+        }),
+        "summarize_stream": github("/summarize", {"repo_name": name, "branch": "main", "provider": "openai", "model_name": MODELS["openai"], "stream": "true"}),
+        # Lần đầu index các file text của commit, các lần sau chỉ tra trigram
+        "search": github("/search", lambda rng: {"repo_name": name, "branch": "main", "q": f"of file {rng.randrange(len(repo.paths))}\n"}),
+        "search_regex": github("/search", lambda rng: {"repo_name": name, "branch": "main", "q": rf"edited at {rng.randrange(10)}\d\b", "regex": "true"}),
+        "search_paths": github("/search", {"repo_name": name, "branch": "main", "q": "version ="}, ["src/pkg0/**/*.py"]),
+        "webhook_push": push,
+        "cache_stats": lambda i: {"method": "GET", "path": "/api/v1/cache_stats", "params": None, "json": None, "headers": {"Authorization": f"Bearer {ADMIN_TOKEN}"}},
+        "metrics": lambda i: {"method": "GET", "path": "/metrics", "params": None, "json": None, "headers": {}},
+    }
+    return scenarios
+
+
+async def send(session, base_url, request):
+    started = time.perf_counter()
+    ttfb, size = None, 0
+    try:
+        async with session.request(
+            request["method"], f"{base_url}{request['path']}",
+            params = request["params"], json = request["json"], data = request.get("data"), headers = request["headers"]
+        ) as response:
+            async for chunk in response.content.iter_any():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                size += len(chunk)
+            status = response.status
+    except aiohttp.ClientError:
+        status = 0
+    latency = time.perf_counter() - started
+    return Sample(latency, ttfb if ttfb is not None else latency, status, size)
+
+
+async def upstream_calls(session, url, reset = False):
+    async with session.get(f"{url}/_bench/calls", params = {"reset": "1"} if reset else None) as response:
+        return await response.json()
+
+
+async def run_scenario(session, urls, build, requests, concurrency, app_pid):
+    for name in ("github", "llm"):
+        await upstream_calls(session, urls[name], reset = True)
+
+    cold = await send(session, urls["api"], build(0))
+    samples, pending = [], iter(range(1, requests))
+
+    async def worker():
+        for i in pending:
+            samples.append(await send(session, urls["api"], build(i)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    calls = {name: await upstream_calls(session, urls[name]) for name in ("github", "llm")}
+    everything = [cold] + samples
+    latencies = [sample.latency for sample in samples] or [cold.latency]
+    statuses = {}
+    for sample in everything:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+    rss, _ = process_memory(app_pid)
+
+    return {
+        "requests": len(everything),
+        "errors": sum(not 200 <= sample.status < 300 for sample in everything),
+        "status_codes": statuses,
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(samples) / wall, 2) if samples and wall else None,
+        "latency": {
+            "cold": round(cold.latency, 5),
+            "mean": round(sum(latencies) / len(latencies), 5),
+            "p50": round(percentile(latencies, 0.50), 5),
+            "p95": round(percentile(latencies, 0.95), 5),
+            "p99": round(percentile(latencies, 0.99), 5),
+            "max": round(max(latencies), 5),
+        },
+        "ttfb": {
+            "p50": round(percentile([sample.ttfb for sample in everything], 0.50), 5),
+            "p95": round(percentile([sample.ttfb for sample in everything], 0.95), 5),
+        },
+        "bytes_per_request": sum(sample.size for sample in everything) // len(everything),
+        "upstream_calls": calls,
+        "upstream_calls_per_request": {
+            name: round(sum(counts.values()) / len(everything), 3) for name, counts in calls.items()
+        },
+        "rss_bytes": rss,
+    }
+
+
+def spawn(args, env = None):
+    return subprocess.Popen(
+        [sys.executable, *args], cwd = ROOT, env = env,
+        stdout = subprocess.DEVNULL, stderr = None if os.environ.get("BENCH_VERBOSE") else subprocess.DEVNULL
+    )
+
+
+async def wait_ready(session, url, process, timeout = 300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def profile_args(args, prefix):
+    """Forward the ``--<prefix>-latency`` ... options to a fake server"""
+    values, forwarded = vars(args), []
+    for name in ("latency", "jitter", "error-rate", "error-status"):
+        forwarded += [f"--{name}", str(values[f"{prefix}_{name.replace('-', '_')}"])]
+    return forwarded
+
+
+async def run(args):
+    ports = {"github": free_port(), "llm": free_port(), "api": free_port()}
+    urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+    workdir = tempfile.mkdtemp(prefix = "bench-")
+
+    env = {
+        **os.environ,
+        "GITHUB_API_URL": urls["github"],
+        "GITHUB_GRAPHQL_URL": f"{urls['github']}/graphql",
+        "GITHUB_BACKEND": args.backend,
+        "OPENAI_API_URL": f"{urls['llm']}/openai/v1",
+        "DEEPSEEK_API_URL": f"{urls['llm']}/deepseek",
+        "GEMINI_API_URL": f"{urls['llm']}/gemini/v1",
+        "CLAUDE_API_URL": f"{urls['llm']}/claude/v1",
+        "OPENAI_TOKEN": "bench", "CLAUDE_TOKEN": "bench", "GEMINI_TOKEN": "bench", "DEEPSEEK_TOKEN": "bench",
+        "SUPER_USER_TOKEN": ADMIN_TOKEN,
+        "GITHUB_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "SNAPSHOT_DIR": os.path.join(workdir, "snapshots"),
+        "LOG_LEVEL": "WARNING",
+    }
+    processes = {
+        "github": spawn([
+            "-m", "benchmarks.fake_github", "--port", str(ports["github"]),
+            "--files", str(args.files), "--commits", str(args.commits), "--seed", str(args.seed),
+            "--rate-limit", str(args.github_rate_limit), *profile_args(args, "github"),
+        ]),
+        "llm": spawn([
+            "-m", "benchmarks.fake_llm", "--port", str(ports["llm"]),
+            "--tokens", str(args.llm_tokens), "--token-delay", str(args.llm_token_delay), *profile_args(args, "llm"),
+        ]),
+    }
+    repo = SyntheticRepo(files = args.files, commits = args.commits, seed = args.seed)
+    scenarios = build_scenarios(repo, args.batch_size)
+    selected = [name for name in scenarios if not args.scenarios or name in args.scenarios]
+
+    try:
+        connector = aiohttp.TCPConnector(limit = args.concurrency + 4)
+        timeout = aiohttp.ClientTimeout(total = args.timeout)
+        async with aiohttp.ClientSession(connector = connector, timeout = timeout) as session:
+            for name in ("github", "llm"):
+                await wait_ready(session, f"{urls[name]}/_bench/calls", processes[name])
+            processes["api"] = spawn(
+                ["-m", "uvicorn", "main:app", "--port", str(ports["api"]), "--log-level", "warning", "--no-access-log"],
+                env = env
+            )
+            await wait_ready(session, f"{urls['api']}/metrics", processes["api"])
+
+            results = {}
+            for name in selected:
+                results[name] = await run_scenario(session, urls, scenarios[name], args.requests, args.concurrency, processes["api"].pid)
+                report_line(name, results[name])
+            _, peak = process_memory(processes["api"].pid)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+
+    commit, dirty = git_revision()
+    return {
+        "meta": {
+            "git_commit": commit,
+            "git_dirty": dirty,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+        },
+        "app_peak_rss_bytes": peak,
+        "scenarios": results,
+    }
+
+
+def report_line(name, result):
+    latency = result["latency"]
+    calls = result["upstream_calls_per_request"]
+    print(
+        f"{name:24} {result['throughput_rps'] or 0:9.1f} req/s  p50 {latency['p50'] * 1000:8.1f}ms  "
+        f"p95 {latency['p95'] * 1000:8.1f}ms  p99 {latency['p99'] * 1000:8.1f}ms  cold {latency['cold'] * 1000:8.1f}ms  "
+        f"gh/req {calls['github']:7.2f}  llm/req {calls['llm']:6.2f}  errors {result['errors']}",
+        file = sys.stderr
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the API against local fake GitHub and LLM servers")
+    parser.add_argument("--files", type = int, default = 1000, help = "files in the synthetic repo (10 to 100000)")
+    parser.add_argument("--commits", type = int, default = 500, help = "commits in the synthetic repo (100 to 50000)")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--backend", choices = ("rest", "graphql"), default = "rest", help = "GITHUB_BACKEND of the API")
+    parser.add_argument("--requests", type = int, default = 100, help = "requests per scenario")
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--batch-size", type = int, default = 10, help = "jobs per /chat/batch request")
+    parser.add_argument("--timeout", type = float, default = 300, help = "per-request timeout (seconds)")
+    parser.add_argument("--scenarios", nargs = "*", help = "run only these scenarios")
+    parser.add_argument("--github-rate-limit", type = int, default = 0, help = "fake GitHub quota per token and hour (0: none)")
+    parser.add_argument("--llm-tokens", type = int, default = 50)
+    parser.add_argument("--llm-token-delay", type = float, default = 0.0)
+    add_profile_arguments(parser, "github-")
+    add_profile_arguments(parser, "llm-")
+    parser.add_argument("--output", default = "-", help = "JSON results file ('-' for stdout)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    data = json.dumps(results, indent = 2)
+    if args.output == "-":
+        print(data)
+    else:
+        with open(args.output, "w") as output:
+            output.write(data + "\n")
+
+
+if __name__ == "__main__":
+    main()
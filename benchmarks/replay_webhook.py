@@ -0,0 +1,50 @@
+"""Replay recorded GitHub webhook deliveries against a running API.
+
+Each file is either the raw payload (``--event`` names the event) or a
+delivery recorded as ``{"headers": {...}, "payload": {...}}``, e.g. copied
+from the repository's "Recent Deliveries" page. Payloads are re-signed with
+``--secret`` (GITHUB_WEBHOOK_SECRET of the API).
+
+    python -m benchmarks.replay_webhook push.json --event push --secret s3cret
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import uuid
+
+import requests
+
+
+def load_delivery(path, event):
+    with open(path) as file:
+        data = json.load(file)
+    if "payload" in data and "headers" in data:
+        headers = {key.lower(): value for key, value in data["headers"].items()}
+        return headers.get("x-github-event", event), data["payload"]
+    return event, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Replay GitHub webhook deliveries")
+    parser.add_argument("files", nargs = "+")
+    parser.add_argument("--url", default = "http://127.0.0.1:8000/api/v1/webhook/github")
+    parser.add_argument("--secret", required = True)
+    parser.add_argument("--event", default = "push", help = "event of raw payload files")
+    args = parser.parse_args()
+
+    for path in args.files:
+        event, payload = load_delivery(path, args.event)
+        body = json.dumps(payload).encode()
+        signature = "sha256=" + hmac.new(args.secret.encode(), body, hashlib.sha256).hexdigest()
+        response = requests.post(args.url, data = body, headers = {
+            "Content-Type": "application/json",
+            "X-GitHub-Event": event,
+            "X-GitHub-Delivery": str(uuid.uuid4()),
+            "X-Hub-Signature-256": signature,
+        })
+        print(f"{path}: {response.status_code} {response.text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Time the encoding of large responses and measure their size on the wire.
+
+Payloads have the shape of ``/get_content`` (text files of a local
+directory, by default this repository), ``/get_commit_history`` and
+``/get_changes`` (from ``SyntheticRepo``). Each is encoded the way FastAPI
+did before (``jsonable_encoder`` + ``json.dumps``) and with the current
+response layer (orjson / MessagePack), then compressed with every encoding
+of ``api.responses``:
+
+    python -m benchmarks.serialization --dir . --commits 2000 --repeat 5
+"""
+import argparse
+import json
+import os
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from api.responses import COMPRESSORS, LEVELS, compress, dump_json, dump_msgpack
+from benchmarks.synthetic import SyntheticRepo
+
+
+def read_tree(root, max_files, max_file_size = 1024 * 1024):
+    contents = {}
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            if len(contents) >= max_files or os.path.getsize(path) > max_file_size:
+                continue
+            with open(path, "rb") as file:
+                data = file.read()
+            try:
+                contents[os.path.relpath(path, root)] = None if b"\0" in data[:8192] else data.decode("utf-8")
+            except UnicodeDecodeError:
+                contents[os.path.relpath(path, root)] = None
+    return contents
+
+
+def payloads(args):
+    repo = SyntheticRepo(files = args.files, commits = args.commits)
+    head = repo.resolve("main")
+    history = [repo.commit_summary(i) for i in range(head, max(head - args.commits, -1), -1)]
+    changes = {"commits": [
+        {"sha": repo.shas[i], "message": repo.commit_summary(i)["commit"]["message"], "files": repo.commit_files(i)}
+        for i in range(head, max(head - 200, 0), -1)
+    ]}
+    return {"get_content": read_tree(args.dir, args.max_files), "get_commit_history": history, "get_changes": changes}
+
+
+def fastapi_json(content):
+    # Đường cũ của FastAPI: jsonable_encoder rồi JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii = False, allow_nan = False, indent = None, separators = (",", ":")
+    ).encode("utf-8")
+
+
+def timed(function, value, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(value)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark response serialization and compression")
+    parser.add_argument("--dir", default = ".", help = "directory read as the /get_content payload")
+    parser.add_argument("--max-files", type = int, default = 5000)
+    parser.add_argument("--files", type = int, default = 1000, help = "files of the synthetic repository")
+    parser.add_argument("--commits", type = int, default = 2000)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", help = "write the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, content in payloads(args).items():
+        baseline, baseline_time = timed(fastapi_json, content, args.repeat)
+        rows = {"json (before)": (baseline, baseline_time)}
+        rows["orjson"] = timed(dump_json, content, args.repeat)
+        rows["msgpack"] = timed(dump_msgpack, content, args.repeat)
+
+        print(f"\n{name}: {len(baseline) / 1e6:.2f} MB of JSON")
+        print(f"  {'encoder':<16}{'encode ms':>11}{'bytes':>12}")
+        for encoder, (body, seconds) in rows.items():
+            print(f"  {encoder:<16}{seconds * 1000:>11.1f}{len(body):>12}")
+
+        print(f"  {'orjson +':<16}{'compress ms':>11}{'bytes':>12}{'ratio':>8}")
+        compressed = {}
+        for encoding in COMPRESSORS:
+            body, seconds = timed(lambda data: compress(encoding, data), rows["orjson"][0], args.repeat)
+            compressed[encoding] = {"level": LEVELS[encoding], "ms": round(seconds * 1000, 2), "bytes": len(body)}
+            print(f"  {encoding:<16}{seconds * 1000:>11.1f}{len(body):>12}{len(rows['orjson'][0]) / len(body):>8.1f}")
+
+        results[name] = {
+            "encoders": {encoder: {"ms": round(seconds * 1000, 2), "bytes": len(body)} for encoder, (body, seconds) in rows.items()},
+            "compression": compressed,
+        }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent = 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import bisect
+import difflib
+import hashlib
+import io
+import random
+import tarfile
+import time
+from collections import OrderedDict
+
+
+EPOCH = 1704067200   # 2024-01-01T00:00:00Z, commit i được tạo sau đó i giờ
+BINARY_HEADER = b"\x89PNG\r\n\x1a\n"
+# Phần mở rộng theo i % 50: ~2% file nhị phân, ~10% markdown, ~10% json, còn lại python
+LANGUAGES = {"py": "Python", "md": "Markdown", "json": "JSON"}
+
+
+def sha1(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def blob_sha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def iso(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class SyntheticRepo:
+    """Deterministic linear history of a generated repository.
+
+    Commit 0 adds every file; each later commit edits 1-3 files. File
+    contents, blob SHAs, patches and trees are derived on demand from
+    ``(file, version)`` where the version is the last commit that touched
+    the file, so 100k files x 50k commits stay cheap. The same arguments
+    always produce the same SHAs, which lets the load driver pick real
+    commits and paths without asking the server.
+    """
+
+    def __init__(self, files = 1000, commits = 500, owner = "bench", name = "repo", seed = 0):
+        self.owner, self.name = owner, name
+        self.full_name = f"{owner}/{name}"
+        self.paths = [self._path(i) for i in range(files)]
+        self.file_index = {path: i for i, path in enumerate(self.paths)}
+
+        rng = random.Random(seed)
+        self.changes = [range(files)] + [
+            sorted(rng.sample(range(files), min(files, 1 + rng.randrange(3)))) for _ in range(1, commits)
+        ]
+        self.touches = [[0] for _ in range(files)]
+        for commit in range(1, commits):
+            for file in self.changes[commit]:
+                self.touches[file].append(commit)
+
+        self.shas = [sha1(f"{seed}:{self.full_name}:commit:{i}") for i in range(commits)]
+        self.commit_index = {sha: i for i, sha in enumerate(self.shas)}
+        self.branches = {"main": commits - 1, "dev": commits // 2}
+        self.default_branch = "main"
+
+        # Cây thư mục: dir -> [(name, file index hoặc None nếu là thư mục con, đường dẫn con)]
+        self.layout = {"": []}
+        for file, path in enumerate(self.paths):
+            parent = ""
+            for part in path.split("/")[:-1]:
+                child = f"{parent}/{part}" if parent else part
+                if child not in self.layout:
+                    self.layout[child] = []
+                    self.layout[parent].append((part, None, child))
+                parent = child
+            self.layout[parent].append((path.rsplit("/", 1)[-1], file, path))
+
+        self._blob_shas = {}   # (file, version) -> (blob sha, size)
+        self._blobs = {}       # blob sha -> (file, version)
+        self._trees = OrderedDict()
+        self._tree_oids = {}   # tree oid -> (commit, dir)
+        self._tarball = (None, None)
+
+    @staticmethod
+    def _path(i):
+        kind = i % 50
+        ext = "png" if kind == 0 else "md" if kind <= 5 else "json" if kind <= 10 else "py"
+        return f"src/pkg{i // 1000}/mod{(i // 50) % 20}/file{i}.{ext}"
+
+    # --- nội dung file ---
+
+    def is_binary(self, file):
+        return self.paths[file].endswith(".png")
+
+    def version(self, file, commit):
+        touches = self.touches[file]
+        return touches[bisect.bisect_right(touches, commit) - 1]
+
+    def content(self, file, version):
+        if self.is_binary(file):
+            return BINARY_HEADER + version.to_bytes(4, "big") + bytes(range(64))
+        body = 5 + file % 40
+        lines = [f"# {self.paths[file]}"]
+        lines += [
+            f"line {j} of file {file} edited at {version}" if version and j == version % body else f"line {j} of file {file}"
+            for j in range(body)
+        ]
+        lines.append(f"version = {version}")
+        return ("\n".join(lines) + "\n").encode()
+
+    def blob_info(self, file, version):
+        """``(blob sha, size)`` of a file version"""
+        key = (file, version)
+        info = self._blob_shas.get(key)
+        if info is None:
+            data = self.content(file, version)
+            info = self._blob_shas[key] = (blob_sha(data), len(data))
+            self._blobs[info[0]] = key
+        return info
+
+    def blob_sha(self, file, version):
+        return self.blob_info(file, version)[0]
+
+    def blob(self, sha):
+        """Content of a blob seen in an earlier tree / commit payload, or None"""
+        key = self._blobs.get(sha)
+        return self.content(*key) if key is not None else None
+
+    # --- ref và commit ---
+
+    def resolve(self, ref):
+        if ref in (None, "", "HEAD"):
+            return self.branches[self.default_branch]
+        ref = ref.removeprefix("refs/heads/")
+        if ref in self.branches:
+            return self.branches[ref]
+        return self.commit_index.get(ref)
+
+    def date(self, commit):
+        return iso(EPOCH + commit * 3600)
+
+    def tree_sha(self, commit):
+        return sha1(f"tree:{self.shas[commit]}")
+
+    def commit_summary(self, commit):
+        author = {"name": f"dev{commit % 7}", "email": f"dev{commit % 7}@example.com", "date": self.date(commit)}
+        return {
+            "sha": self.shas[commit],
+            "commit": {
+                "message": f"Change {commit}: update {len(self.changes[commit])} files",
+                "author": author,
+                "committer": author,
+                "tree": {"sha": self.tree_sha(commit)},
+            },
+            "parents": [{"sha": self.shas[commit - 1]}] if commit else [],
+        }
+
+    def file_change(self, file, before, after):
+        """GitHub-style entry of ``file`` going from version ``before`` (None: added) to ``after``"""
+        entry = {
+            "sha": self.blob_sha(file, after),
+            "filename": self.paths[file],
+            "status": "added" if before is None else "modified",
+            "additions": 0,
+            "deletions": 0,
+            "changes": 0,
+        }
+        if not self.is_binary(file):
+            old = self.content(file, before).decode().splitlines() if before is not None else []
+            new = self.content(file, after).decode().splitlines()
+            lines = list(difflib.unified_diff(old, new, lineterm = ""))[2:]
+            entry["additions"] = sum(line.startswith("+") for line in lines)
+            entry["deletions"] = sum(line.startswith("-") for line in lines)
+            entry["changes"] = entry["additions"] + entry["deletions"]
+            entry["patch"] = "\n".join(lines)
+        return entry
+
+    def commit_files(self, commit):
+        if commit == 0:
+            return [self.file_change(file, None, 0) for file in self.changes[0]]
+        return [self.file_change(file, self.version(file, commit - 1), commit) for file in self.changes[commit]]
+
+    def history(self, commit, path = None, since = None, until = None):
+        """Commit indices reachable from ``commit``, newest first, filtered like ``GET /commits``"""
+        if path and path in self.file_index:
+            touches = self.touches[self.file_index[path]]
+            candidates = reversed(touches[:bisect.bisect_right(touches, commit)])
+        elif path:
+            prefix = path.rstrip("/") + "/"
+            candidates = (
+                i for i in range(commit, -1, -1)
+                if any(self.paths[file].startswith(prefix) for file in self.changes[i])
+            )
+        else:
+            candidates = range(commit, -1, -1)
+
+        for i in candidates:
+            date = self.date(i)
+            if until and date > until:
+                continue
+            if since and date < since:
+                return
+            yield i
+
+    def compare(self, base, head):
+        """Files changed between two commits of the history, net of intermediate edits"""
+        files = sorted({file for commit in range(base + 1, head + 1) for file in self.changes[commit]})
+        return [self.file_change(file, self.version(file, base), self.version(file, head)) for file in files]
+
+    # --- tree ---
+
+    def tree(self, commit):
+        """Recursive tree entries (GitHub ``git/trees?recursive=1`` shape) of a commit"""
+        entries = self._trees.get(commit)
+        if entries is None:
+            entries = []
+            for file, path in enumerate(self.paths):
+                sha, size = self.blob_info(file, self.version(file, commit))
+                entries.append({"path": path, "mode": "100644", "type": "blob", "sha": sha, "size": size})
+            entries += [
+                {"path": path, "mode": "040000", "type": "tree", "sha": self.subtree_oid(commit, path)}
+                for path in self.layout if path
+            ]
+            self._trees[commit] = entries
+            if len(self._trees) > 4:
+                self._trees.popitem(last = False)
+        return entries
+
+    def subtree_oid(self, commit, path):
+        oid = sha1(f"tree:{self.shas[commit]}:{path}")
+        self._tree_oids[oid] = (commit, path)
+        return oid
+
+    def subtree(self, oid):
+        return self._tree_oids.get(oid)
+
+    def children(self, commit, path):
+        """Direct entries ``(name, kind, oid, size)`` of the directory ``path`` ("" for the root)"""
+        entries = []
+        for name, file, child in self.layout.get(path, ()):
+            if file is None:
+                entries.append((name, "tree", self.subtree_oid(commit, child), 0))
+            else:
+                entries.append((name, "blob", *self.blob_info(file, self.version(file, commit))))
+        return entries
+
+    def languages(self):
+        totals = {}
+        for file, path in enumerate(self.paths):
+            language = LANGUAGES.get(path.rsplit(".", 1)[-1])
+            if language:
+                totals[language] = totals.get(language, 0) + len(self.content(file, 0))
+        return totals
+
+    def tarball(self, commit):
+        """``.tar.gz`` of the commit, laid out like GitHub's (``owner-repo-sha/...``)"""
+        cached_commit, data = self._tarball
+        if cached_commit != commit:
+            buffer = io.BytesIO()
+            root = f"{self.owner}-{self.name}-{self.shas[commit][:7]}"
+            with tarfile.open(fileobj = buffer, mode = "w:gz", compresslevel = 1) as tar:
+                for file, path in enumerate(self.paths):
+                    data = self.content(file, self.version(file, commit))
+                    info = tarfile.TarInfo(f"{root}/{path}")
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+            data = buffer.getvalue()
+            self._tarball = (commit, data)
+        return data
@@ -11,6 +11,129 @@ class Settings(BaseSettings):
     DEEPSEEK_TOKEN: str = os.getenv("DEEPSEEK_TOKEN")
     GEMINI_TOKEN: str = os.getenv("GEMINI_TOKEN")
 
+    OPENAI_API_URL: str = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1")
+    DEEPSEEK_API_URL: str = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com")
+    GEMINI_API_URL: str = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1")
+    CLAUDE_API_URL: str = os.getenv("CLAUDE_API_URL", "https://api.anthropic.com/v1")
+
+    # Kết nối tới từng nhà cung cấp LLM: timeout, số kết nối keep-alive và số request đồng thời
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", 120))
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 256))
+
+    # Model dự phòng theo "provider:model" (JSON), ví dụ {"openai:gpt-4o-mini": "claude:claude-3-5-sonnet-20241022"}
+    LLM_FALLBACKS: str = os.getenv("LLM_FALLBACKS")
+    # Hedging: gửi thêm request tới model dự phòng khi model chính chạy lâu hơn p95 của nó
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+    LLM_LATENCY_WINDOW: int = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+
+    # /chat/batch: số job tối đa, số job chạy song song cho mỗi provider, số lần thử lại khi 429/5xx,
+    # thời gian chờ Retry-After tối đa (giây) trước khi bỏ cuộc
+    LLM_BATCH_MAX_JOBS: int = int(os.getenv("LLM_BATCH_MAX_JOBS", 500))
+    LLM_BATCH_CONCURRENCY: int = int(os.getenv("LLM_BATCH_CONCURRENCY", 16))
+    LLM_RETRIES: int = int(os.getenv("LLM_RETRIES", 3))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+    LLM_RETRY_MAX_WAIT: float = float(os.getenv("LLM_RETRY_MAX_WAIT", 60))
+
+    # Cache câu trả lời LLM (opt-in): TTL (giây), dung lượng bộ nhớ, thư mục lưu bền (tuỳ chọn)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", 3600))
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    LLM_CACHE_DIR: str = os.getenv("LLM_CACHE_DIR")
+    # Prompt caching phía provider (Claude cache_control, OpenAI prompt_cache_key) cho prefix đủ dài
+    LLM_PROMPT_CACHE_MIN_CHARS: int = int(os.getenv("LLM_PROMPT_CACHE_MIN_CHARS", 4096))
+
+    # Tóm tắt repository (/summarize): số lời gọi LLM song song, số ký tự tối đa của mỗi phần file,
+    # số file tối đa và cache kết quả từng file theo blob SHA (bộ nhớ, thư mục lưu bền tuỳ chọn)
+    SUMMARY_CONCURRENCY: int = int(os.getenv("SUMMARY_CONCURRENCY", 8))
+    SUMMARY_CHUNK_CHARS: int = int(os.getenv("SUMMARY_CHUNK_CHARS", 24000))
+    SUMMARY_MAX_FILES: int = int(os.getenv("SUMMARY_MAX_FILES", 2000))
+    SUMMARY_CACHE_MAX_BYTES: int = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    SUMMARY_CACHE_DIR: str = os.getenv("SUMMARY_CACHE_DIR")
+
+    # Tìm kiếm code (/search): dung lượng tối đa của các trigram index trong bộ nhớ, số commit giữ lại
+    # cho mỗi repo, số file tối đa được index, số kết quả tối đa và số ký tự tối đa của mỗi dòng trả về
+    SEARCH_INDEX_MAX_BYTES: int = int(os.getenv("SEARCH_INDEX_MAX_BYTES", 512 * 1024 * 1024))
+    SEARCH_MAX_COMMITS: int = int(os.getenv("SEARCH_MAX_COMMITS", 4))
+    SEARCH_MAX_FILES: int = int(os.getenv("SEARCH_MAX_FILES", 50000))
+    SEARCH_MAX_RESULTS: int = int(os.getenv("SEARCH_MAX_RESULTS", 1000))
+    SEARCH_MAX_LINE_CHARS: int = int(os.getenv("SEARCH_MAX_LINE_CHARS", 500))
+
+    # Chat theo repository (/chat với repo_name): số dòng mỗi chunk, số chunk lấy ra, ngân sách token cho
+    # phần code chèn vào prompt, số file tối đa được index và số BM25 index (theo commit) giữ trong bộ nhớ
+    RAG_CHUNK_LINES: int = int(os.getenv("RAG_CHUNK_LINES", 40))
+    RAG_TOP_K: int = int(os.getenv("RAG_TOP_K", 8))
+    RAG_CONTEXT_TOKENS: int = int(os.getenv("RAG_CONTEXT_TOKENS", 6000))
+    RAG_MAX_FILES: int = int(os.getenv("RAG_MAX_FILES", 20000))
+    RAG_INDEX_CACHE_SIZE: int = int(os.getenv("RAG_INDEX_CACHE_SIZE", 8))
+
+    GITHUB_API_URL: str = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+    # Backend gọi GitHub: "rest", "graphql" (gộp tree, nội dung file và lịch sử commit vào ít query)
+    # hoặc "mirror" (đọc branch, tree, file, lịch sử và diff từ bare mirror trên đĩa)
+    GITHUB_BACKEND: str = os.getenv("GITHUB_BACKEND", "rest")
+    GITHUB_GRAPHQL_URL: str = os.getenv("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
+    GITHUB_GRAPHQL_BATCH: int = int(os.getenv("GITHUB_GRAPHQL_BATCH", 50))
+    GITHUB_GRAPHQL_TREE_DEPTH: int = int(os.getenv("GITHUB_GRAPHQL_TREE_DEPTH", 4))
+
+    # Bare mirror: thư mục lưu, chu kỳ fetch tối thiểu (giây) và URL clone
+    MIRROR_DIR: str = os.getenv("MIRROR_DIR")
+    MIRROR_REFRESH_INTERVAL: float = float(os.getenv("MIRROR_REFRESH_INTERVAL", 60))
+    MIRROR_REMOTE_URL: str = os.getenv("MIRROR_REMOTE_URL", "https://github.com/{full_name}.git")
+
+    # Số commit tối đa khi phải duyệt từng commit của một range trong /get_changes
+    RANGE_MAX_COMMITS: int = int(os.getenv("RANGE_MAX_COMMITS", 1000))
+
+    # Pool client GitHub theo access token
+    GITHUB_CLIENT_TTL: float = float(os.getenv("GITHUB_CLIENT_TTL", 900))
+    GITHUB_CLIENT_POOL_SIZE: int = int(os.getenv("GITHUB_CLIENT_POOL_SIZE", 256))
+
+    # Scheduler request GitHub theo token: số request song song tối đa, phần quota giữ lại cho
+    # request tương tác, thời gian chờ rate limit tối đa (giây) trước khi trả 429 và số lần thử lại
+    GITHUB_TOKEN_MAX_IN_FLIGHT: int = int(os.getenv("GITHUB_TOKEN_MAX_IN_FLIGHT", 32))
+    GITHUB_BULK_RESERVE: int = int(os.getenv("GITHUB_BULK_RESERVE", 500))
+    GITHUB_RATE_LIMIT_MAX_WAIT: float = float(os.getenv("GITHUB_RATE_LIMIT_MAX_WAIT", 10))
+    GITHUB_RATE_LIMIT_RETRIES: int = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", 3))
+
+    # Số request GitHub chạy song song tối đa cho mỗi lần lấy nội dung file
+    GITHUB_MAX_CONCURRENCY: int = int(os.getenv("GITHUB_MAX_CONCURRENCY", 16))
+    GITHUB_MAX_FILE_SIZE: int = int(os.getenv("GITHUB_MAX_FILE_SIZE", 1024 * 1024))
+
+    # Cache blob theo SHA: LRU trong bộ nhớ, tuỳ chọn tràn xuống đĩa nếu có BLOB_CACHE_DIR
+    BLOB_CACHE_MAX_BYTES: int = int(os.getenv("BLOB_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    BLOB_CACHE_DIR: str = os.getenv("BLOB_CACHE_DIR")
+    BLOB_CACHE_DISK_MAX_BYTES: int = int(os.getenv("BLOB_CACHE_DISK_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+    # Entry trên đĩa nhỏ hơn ngưỡng này được đưa lại lên bộ nhớ khi đọc
+    BLOB_CACHE_PROMOTE_THRESHOLD: int = int(os.getenv("BLOB_CACHE_PROMOTE_THRESHOLD", 256 * 1024))
+
+    # Snapshot toàn bộ repo từ tarball, lưu trên đĩa theo commit SHA
+    SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR")
+    SNAPSHOT_MAX_OPEN: int = int(os.getenv("SNAPSHOT_MAX_OPEN", 32))
+    ARCHIVE_MAX_FILE_SIZE: int = int(os.getenv("ARCHIVE_MAX_FILE_SIZE", 10 * 1024 * 1024))
+
+    # Cache metadata (repo, branch, tree, commit) theo ETag; trong TTL không revalidate
+    GITHUB_METADATA_TTL: float = float(os.getenv("GITHUB_METADATA_TTL", 60))
+    METADATA_CACHE_MAX_BYTES: int = int(os.getenv("METADATA_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+    # Webhook GitHub (/webhook/github): secret để kiểm tra chữ ký, số worker pre-warm, số ref chờ tối đa
+    # trong hàng đợi và số blob tối đa được tải trước cho mỗi lần push
+    GITHUB_WEBHOOK_SECRET: str = os.getenv("GITHUB_WEBHOOK_SECRET")
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", 2))
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+    WEBHOOK_PREWARM_MAX_FILES: int = int(os.getenv("WEBHOOK_PREWARM_MAX_FILES", 500))
+
+    # Nén response theo Accept-Encoding: các encoding theo thứ tự ưu tiên và kích thước body tối thiểu được nén;
+    # /get_content với từ CONTENT_STREAM_MIN_FILES file trở lên được stream từng file thay vì dựng cả dict
+    COMPRESSION_ENCODINGS: str = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    CONTENT_STREAM_MIN_FILES: int = int(os.getenv("CONTENT_STREAM_MIN_FILES", 100))
+
+    # Log: mức log và định dạng ("json" mỗi dòng một object, hoặc "text")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+
 settings = Settings()
 
 class SUPERUSER(BaseSettings):
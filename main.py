@@ -1,11 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from api import observability
+from api.responses import CompressionMiddleware, FastJSONResponse
 from api.v1 import endpoints
+from services.service_http import close_sessions
+from services.service_logging import setup_logging, stop_logging
+from services.service_mirror import mirror_store
+from services.service_scheduler import GitHubRateLimited
+from services.service_webhook import webhook_processor
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    webhook_processor.start()
+    yield
+    await webhook_processor.stop()
+    await close_sessions()
+    await mirror_store.close()
+    stop_logging()
 
 
 app = FastAPI(
+    lifespan = lifespan,
+    default_response_class = FastJSONResponse,
     swagger_ui_parameters = {"syntaxHighlight.theme": "obsidian"},
     title = "Smart API",
     version = "0.1.0"
 )
 
+@app.exception_handler(GitHubRateLimited)
+async def github_rate_limited(request: Request, exc: GitHubRateLimited):
+    # Hết quota GitHub: trả 429 kèm Retry-After thay vì 404 chung chung
+    return JSONResponse(
+        status_code = 429,
+        content = {"detail": f"GitHub rate limit exceeded, retry after {exc.retry_after}s"},
+        headers = {"Retry-After": str(exc.retry_after)}
+    )
+
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(observability.RequestMetricsMiddleware)
+
+app.include_router(router = observability.router)
 app.include_router(router = endpoints.router, prefix = "/api/v1")
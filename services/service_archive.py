@@ -0,0 +1,228 @@
+import asyncio
+import io
+import json
+import logging
+import mmap
+import os
+import tarfile
+import tempfile
+import weakref
+from collections import OrderedDict
+
+from configs.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def file_extension(path):
+    name = path.rsplit('/', 1)[-1]
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+class _AsyncStreamReader(io.RawIOBase):
+    """Blocking file object over an aiohttp response, read from a worker thread"""
+
+    def __init__(self, stream, loop):
+        self.stream = stream
+        self.loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = asyncio.run_coroutine_threadsafe(self.stream.read(len(buffer)), self.loop).result()
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class RepoSnapshot:
+    """Text files of one commit packed into a single file and read through mmap.
+
+    ``index`` maps path -> [offset, length], or None for files that are
+    binary or larger than ARCHIVE_MAX_FILE_SIZE. Files whose extension is in
+    ``skipped_extensions`` were not extracted at all.
+
+    Callers hold a reader (``acquire`` / ``release``) while reading; a
+    snapshot retired by ``SnapshotStore`` is closed once its last reader
+    releases it.
+    """
+
+    def __init__(self, pack_path, index, skipped_extensions):
+        self.index = index
+        self.skipped_extensions = set(skipped_extensions)
+        self.readers = 0
+        self.retired = False
+        self._file = open(pack_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ) if size else None
+
+    def covers(self, forbidden_extensions):
+        """True if every extension skipped while extracting is also forbidden now"""
+        return self.skipped_extensions <= set(forbidden_extensions or ())
+
+    def text_files(self):
+        return [path for path, entry in self.index.items() if entry is not None]
+
+    def read(self, path):
+        entry = self.index.get(path)
+        if entry is None:
+            return None
+        offset, length = entry
+        if length == 0:
+            return ""
+        return self._mm[offset:offset + length].decode("utf-8")
+
+    def acquire(self):
+        self.readers += 1
+        return self
+
+    def release(self):
+        self.readers -= 1
+        if self.retired and self.readers == 0:
+            self.close()
+
+    def retire(self):
+        self.retired = True
+        if self.readers == 0:
+            self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+def _extract(fileobj, pack_path, skipped_extensions, max_file_size):
+    index = {}
+    with open(pack_path, "wb") as pack, tarfile.open(fileobj = fileobj, mode = "r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            # Bỏ thư mục gốc "<owner>-<repo>-<sha>/" của tarball
+            path = member.name.split('/', 1)[1] if '/' in member.name else member.name
+
+            # File có extension bị cấm hoặc quá lớn: bỏ qua, không đọc dữ liệu
+            if file_extension(path) in skipped_extensions:
+                continue
+            if member.size > max_file_size:
+                index[path] = None
+                continue
+
+            data = tar.extractfile(member).read()
+            # Nhận diện file nhị phân ngay trong lúc stream
+            if b"\0" in data[:8192]:
+                index[path] = None
+                continue
+            try:
+                data.decode("utf-8")
+            except UnicodeDecodeError:
+                index[path] = None
+                continue
+
+            index[path] = [pack.tell(), len(data)]
+            pack.write(data)
+    return index
+
+
+class SnapshotStore:
+    """On-disk repository snapshots keyed by (repo, commit SHA).
+
+    A snapshot is built by streaming the commit's tarball through an
+    incremental extractor, so a whole repository costs one download instead
+    of one contents-API call per file. Commits are immutable, so snapshots
+    are shared by every token that can resolve the commit.
+    """
+
+    def __init__(self, root, max_open):
+        self.root = root
+        self.max_open = max_open
+        self._open = OrderedDict()   # (full_name, sha) -> RepoSnapshot
+        # Lock chỉ sống khi còn coroutine giữ nó, không tích luỹ theo mỗi commit
+        self._locks = weakref.WeakValueDictionary()
+
+    def _paths(self, full_name, commit_sha):
+        folder = os.path.join(self.root, full_name.replace('/', '__'))
+        return os.path.join(folder, f"{commit_sha}.pack"), os.path.join(folder, f"{commit_sha}.json")
+
+    async def get(self, gh, full_name, commit_sha, forbidden_extensions = None):
+        """Snapshot of the commit covering ``forbidden_extensions``, acquired for the caller (``release()`` it when done)"""
+        key = (full_name, commit_sha)
+        snapshot = self._open.get(key)
+        if snapshot is not None and snapshot.covers(forbidden_extensions):
+            self._open.move_to_end(key)
+            return snapshot.acquire()
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock:
+            old = self._open.get(key)
+            snapshot = old or await asyncio.to_thread(self._load, full_name, commit_sha)
+            if snapshot is None or not snapshot.covers(forbidden_extensions):
+                # Chỉ bỏ qua những extension mà cả snapshot cũ lẫn request hiện tại đều cấm
+                skipped = set(forbidden_extensions or ())
+                if snapshot is not None:
+                    skipped &= snapshot.skipped_extensions
+                try:
+                    built = await self._build(gh, full_name, commit_sha, skipped)
+                finally:
+                    # Snapshot đọc từ đĩa chưa ai dùng; snapshot đang mở vẫn phục vụ các request
+                    # đang đọc (và được giữ lại nếu build lỗi) cho tới khi được thay thế
+                    if snapshot is not None and snapshot is not old:
+                        snapshot.close()
+                snapshot = built
+
+            if old is not None and old is not snapshot:
+                old.retire()
+            self._open[key] = snapshot
+            self._open.move_to_end(key)
+            while len(self._open) > self.max_open:
+                _, evicted = self._open.popitem(last = False)
+                evicted.retire()
+            return snapshot.acquire()
+
+    def _load(self, full_name, commit_sha):
+        pack_path, index_path = self._paths(full_name, commit_sha)
+        try:
+            with open(index_path) as f:
+                meta = json.load(f)
+            return RepoSnapshot(pack_path, meta["index"], meta["skipped_extensions"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    async def _build(self, gh, full_name, commit_sha, skipped_extensions):
+        pack_path, index_path = self._paths(full_name, commit_sha)
+        folder = os.path.dirname(pack_path)
+        os.makedirs(folder, exist_ok = True)
+        fd, tmp_pack = tempfile.mkstemp(dir = folder)
+        os.close(fd)
+
+        logger.debug(f"Downloading tarball of {full_name}@{commit_sha}")
+        try:
+            async with gh.stream(f"/repos/{full_name}/tarball/{commit_sha}") as response:
+                response.raise_for_status()
+                reader = io.BufferedReader(
+                    _AsyncStreamReader(response.content, asyncio.get_running_loop()),
+                    buffer_size = 1024 * 1024
+                )
+                index = await asyncio.to_thread(
+                    _extract, reader, tmp_pack, skipped_extensions, settings.ARCHIVE_MAX_FILE_SIZE
+                )
+        except BaseException:
+            os.remove(tmp_pack)
+            raise
+
+        os.replace(tmp_pack, pack_path)
+        fd, tmp_index = tempfile.mkstemp(dir = folder)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"index": index, "skipped_extensions": sorted(skipped_extensions)}, f)
+        os.replace(tmp_index, index_path)
+
+        logger.info(f"Snapshot of {full_name}@{commit_sha}: {len(index)} files")
+        return RepoSnapshot(pack_path, index, skipped_extensions)
+
+
+snapshot_store = SnapshotStore(
+    root = settings.SNAPSHOT_DIR or os.path.join(tempfile.gettempdir(), "repo-snapshots"),
+    max_open = settings.SNAPSHOT_MAX_OPEN
+)
@@ -1,32 +1,45 @@
-# from utils.openai_prompts import CHECK_PROMPT, SUMMARIZE_PROMPT
+import ast
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
 from typing import Literal, List, Dict, Optional
-from .service_llm import llm_answer
+from configs.config import settings
+from utils.openai_prompts import SYSTEM_PROMPT, SUMMARIZE_PROMPT
+from .service_archive import file_extension
+from .service_cache import summary_cache
+from .service_hedge import llm_router
+from .service_http import get_limiter
+from .service_llm import retry_after
+from .service_retrieval import retrieval_indexes
 from openai.types import ChatModel
 from fastapi import HTTPException
 
-async def chat_llm(
-    user_query: str,
-    provider: Literal["gemini", "openai", "claude", "deepseek"] = "openai",
-    model_name: str = "4o-mini",
-    history: Optional[List[Dict]] = None
-):
-    MODEL_VALIDATION = {
-        "openai": list(ChatModel.__args__),
-        "deepseek": ["deepseek-reasoner", "deepseek-chat"],
-        "gemini": ["gemini-2.0-flash", "gemini-2.0-flash-lite", "gemini-1.5-flash", "gemini-1.5-pro"],
-        "claude": ["claude-3-7-sonnet-20250219", "claude-3-5-sonnet-20241022", 
-                   "claude-3-5-sonnet-20240620", "claude-3-sonnet-20240229"]
-    }
+MODEL_VALIDATION = {
+    "openai": list(ChatModel.__args__),
+    "deepseek": ["deepseek-reasoner", "deepseek-chat"],
+    "gemini": ["gemini-2.0-flash", "gemini-2.0-flash-lite", "gemini-1.5-flash", "gemini-1.5-pro"],
+    "claude": ["claude-3-7-sonnet-20250219", "claude-3-5-sonnet-20241022", 
+               "claude-3-5-sonnet-20240620", "claude-3-sonnet-20240229"]
+}
 
+def validate_model(provider, model_name):
     if provider not in MODEL_VALIDATION:    raise ValueError(f"Not supported provider: {provider}")
     if model_name not in MODEL_VALIDATION[provider]:
         raise HTTPException(
             status_code=400,
             detail=f"Model {model_name} does not exist for provider {provider}."
         )
-    
+
+def build_messages(user_query: str, history: Optional[List[Dict]] = None, context: Optional[str] = None):
+    if context:
+        # Code lấy từ repository đi cùng câu hỏi, trong cùng message của người dùng
+        user_query = f"{context}\n\nQuestion: {user_query}"
+
     if not history:
-        messages = [
+        return [
         {
             "role": "system",
             "content": [
@@ -46,30 +59,334 @@ async def chat_llm(
             ]
         }
     ]
-        return await llm_answer(
-            messages = messages,
-            provider = provider,
-            model_name = model_name
-        )
 
-    else:
-        history.append(
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": user_query
-                    }
-                ]
-            }
-        )
+    history.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": user_query
+                }
+            ]
+        }
+    )
+    return history
+
+async def chat_llm(
+    user_query: str,
+    provider: Literal["gemini", "openai", "claude", "deepseek"] = "openai",
+    model_name: str = "4o-mini",
+    history: Optional[List[Dict]] = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    context: Optional[str] = None
+):
+    validate_model(provider, model_name)
+
+    return await llm_router.answer(
+        messages = build_messages(user_query, history, context),
+        provider = provider,
+        model_name = model_name,
+        use_cache = use_cache,
+        refresh_cache = refresh_cache
+    )
+
+def chat_llm_stream(
+    user_query: str,
+    provider: Literal["gemini", "openai", "claude", "deepseek"] = "openai",
+    model_name: str = "4o-mini",
+    history: Optional[List[Dict]] = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    context: Optional[str] = None
+):
+    """Validate eagerly, then return the normalized event stream of ``llm_stream`` (with failover)"""
+    validate_model(provider, model_name)
+
+    return llm_router.stream(
+        messages = build_messages(user_query, history, context),
+        provider = provider,
+        model_name = model_name,
+        use_cache = use_cache,
+        refresh_cache = refresh_cache
+    )
+
+async def chat_repo(
+    gh,
+    user_query: str,
+    repo_name: str,
+    branch: str = None,
+    provider: Literal["gemini", "openai", "claude", "deepseek"] = "openai",
+    model_name: str = "4o-mini",
+    history: Optional[List[Dict]] = None,
+    top_k: int = None,
+    stream: bool = False,
+    use_cache: bool = True,
+    refresh_cache: bool = False
+):
+    """Chat grounded in a repository: the BM25 top-k chunks for ``user_query`` go into the prompt (None if not found).
+
+    Returns the answer dict, or with ``stream`` an event iterator whose
+    first event is ``{"type": "context", "sources": ...}``.
+    """
+    validate_model(provider, model_name)
+    retrieved = await retrieval_indexes.retrieve(gh, repo_name, user_query, branch = branch, top_k = top_k)
+    if retrieved is None:
+        return None
+    context = retrieved.pop("context")
 
-        return await llm_answer(
-            messages = history,
-            provider = provider,
-            model_name = model_name
+    if stream:
+        events = chat_llm_stream(
+            user_query = user_query, provider = provider, model_name = model_name, history = history,
+            use_cache = use_cache, refresh_cache = refresh_cache, context = context
         )
 
-async def retrieve_repo_info():
-    ...
\ No newline at end of file
+        async def with_sources():
+            yield {"type": "context", **retrieved}
+            async for event in events:
+                yield event
+
+        return with_sources()
+
+    output, status_code = await chat_llm(
+        user_query = user_query, provider = provider, model_name = model_name, history = history,
+        use_cache = use_cache, refresh_cache = refresh_cache, context = context
+    )
+    return {"output": output, "status_code": status_code, **retrieved}
+
+def is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+async def chat_llm_retry(job, use_cache = True, refresh_cache = False):
+    """``chat_llm`` with retries on 429/5xx (full jitter, at least the provider's ``Retry-After``); returns the per-item result dict"""
+    attempt = 0
+    while True:
+        try:
+            output, status_code = await chat_llm(
+                user_query = job["prompt"],
+                provider = job["provider"],
+                model_name = job["model_name"],
+                history = list(job.get("history") or []),
+                use_cache = use_cache,
+                refresh_cache = refresh_cache
+            )
+        except HTTPException as e:
+            return {"output": e.detail, "status_code": e.status_code, "attempts": attempt + 1}
+
+        attempt += 1
+        # Provider báo Retry-After: chờ ít nhất chừng đó, quá LLM_RETRY_MAX_WAIT thì trả lỗi luôn
+        wait = retry_after(job["provider"])
+        if not is_retryable(status_code) or attempt > settings.LLM_RETRIES or wait > settings.LLM_RETRY_MAX_WAIT:
+            return {"output": output, "status_code": status_code, "attempts": attempt}
+        await asyncio.sleep(max(wait, random.uniform(0, settings.LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1))))
+
+async def chat_llm_batch(jobs: List[Dict], use_cache: bool = True, refresh_cache: bool = False):
+    """Run chat jobs concurrently and yield ``{"index", "output", "status_code", "attempts"}`` as each finishes.
+
+    Each provider gets its own LLM_BATCH_CONCURRENCY limit, so one slow
+    provider does not hold back jobs for the others.
+    """
+    async def run(index, job):
+        async with get_limiter(f"batch:{job['provider']}", settings.LLM_BATCH_CONCURRENCY):
+            result = await chat_llm_retry(job, use_cache, refresh_cache)
+        return {"index": index, **result}
+
+    tasks = [asyncio.ensure_future(run(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # Client ngắt kết nối giữa chừng: huỷ các job còn lại
+        for task in tasks:
+            task.cancel()
+
+# Đầu dòng của một khối top-level: ranh giới ưu tiên khi phải cắt file thành nhiều phần
+BLOCK_START = re.compile(r"^(?:async\s+def\b|def\b|class\b|@)")
+
+
+def chunk_text(text, max_chars):
+    """Split a file into parts of at most ``max_chars``, cutting between top-level blocks when possible"""
+    blocks, current = [], []
+    for line in text.splitlines(keepends = True):
+        if current and BLOCK_START.match(line) and not current[-1].startswith("@"):
+            blocks.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("".join(current))
+
+    chunks, current = [], ""
+    for block in blocks:
+        if current and len(current) + len(block) > max_chars:
+            chunks.append(current)
+            current = ""
+        # Một khối dài hơn giới hạn: cắt theo dòng (dòng quá dài thì cắt ngang)
+        while len(block) > max_chars:
+            cut = block.rfind("\n", 0, max_chars) + 1 or max_chars
+            chunks.append(block[:cut])
+            block = block[cut:]
+        current += block
+    if current:
+        chunks.append(current)
+    return chunks or [""]
+
+
+def parse_summary(text):
+    """Entries of a per-file extraction answer (JSON, possibly fenced or Python-literal), or None"""
+    text = re.sub(r"^```(?:json|python)?\s*|\s*```$", "", text.strip())
+    match = re.search(r"[\[{].*[\]}]", text, re.DOTALL)
+    if match is None:
+        return None
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            value = parse(match.group(0))
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(value, dict):
+            return [value]
+        if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            return value
+    return None
+
+
+def summary_key(blob_sha, provider, model_name):
+    """Cache key of a file's extraction: the blob plus everything that shapes the answer"""
+    parts = [blob_sha, provider, model_name, SYSTEM_PROMPT, settings.SUMMARY_CHUNK_CHARS]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+async def summarize_file(path, text, provider, model_name, refresh_cache = False):
+    """Run the per-file extraction prompt over each part of the file; ``(entries, error)``"""
+    chunks = chunk_text(text, settings.SUMMARY_CHUNK_CHARS)
+    system = {"role": "system", "content": [{"type": "text", "text": SYSTEM_PROMPT}]}
+
+    async def extract(index, chunk):
+        part = f" (part {index + 1}/{len(chunks)})" if len(chunks) > 1 else ""
+        job = {
+            "prompt": f"File: {path}{part}\n```{file_extension(path)}\n{chunk}\n```",
+            "provider": provider,
+            "model_name": model_name,
+            "history": [system],
+        }
+        async with get_limiter(f"summary:{provider}", settings.SUMMARY_CONCURRENCY):
+            return await chat_llm_retry(job, refresh_cache = refresh_cache)
+
+    entries = []
+    for result in await asyncio.gather(*(extract(index, chunk) for index, chunk in enumerate(chunks))):
+        if not 200 <= result["status_code"] < 300:
+            return None, f"LLM error {result['status_code']}: {result['output']}"
+        parsed = parse_summary(result["output"])
+        if parsed is None:
+            return None, "Unparseable LLM answer"
+        entries.extend(parsed)
+    return entries, None
+
+
+async def retrieve_repo_info(
+    gh,
+    repo_name: str,
+    branch: str = None,
+    provider: str = "openai",
+    model_name: str = "gpt-4o-mini",
+    extensions: Optional[List[str]] = None,
+    query: str = None,
+    refresh_cache: bool = False
+):
+    """Resolve the repo tree, then return an async iterator of progress events (or None if not found).
+
+    Map: every matching file is fetched and run through ``SYSTEM_PROMPT``
+    (split into parts that fit SUMMARY_CHUNK_CHARS) with at most
+    SUMMARY_CONCURRENCY LLM calls in flight. Results are cached by blob SHA,
+    so re-indexing after a push only re-processes files that changed.
+    Reduce: the per-file entries are merged into the project-structure JSON,
+    optionally answered against ``query`` with ``SUMMARIZE_PROMPT``.
+
+    Events: ``{"type": "start", ...}``, one ``{"type": "file", ...}`` per
+    file as it completes, then ``{"type": "result", "structure": ..., ...}``.
+    """
+    validate_model(provider, model_name)
+    repo = await gh.get_repo(repo_name)
+    if repo is None:
+        return None
+    branch = branch or repo.default_branch
+    index = await gh.get_tree_index(repo, branch)
+    if index is None:
+        return None
+
+    extensions = {extension.lower().lstrip(".") for extension in (extensions or ["py"])}
+    files = sorted(
+        (path, sha) for path, (sha, size) in index.blobs.items()
+        if file_extension(path) in extensions and size <= settings.GITHUB_MAX_FILE_SIZE
+    )
+    truncated = len(files) > settings.SUMMARY_MAX_FILES
+    files = files[:settings.SUMMARY_MAX_FILES]
+    owner, name = repo.full_name.split("/")
+
+    async def events():
+        started = time.perf_counter()
+        structure, errors, pending = {}, {}, []
+        for path, sha in files:
+            cached = None if refresh_cache else summary_cache.get(summary_key(sha, provider, model_name))
+            if cached is not None:
+                structure[path] = json.loads(cached)
+            else:
+                pending.append((path, sha))
+
+        total, done = len(files), len(structure)
+        yield {
+            "type": "start", "repo": repo.full_name, "branch": branch, "commit": index.commit_sha,
+            "total": total, "cached": done, "truncated": truncated
+        }
+
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+
+        async def run(path, sha):
+            try:
+                async with semaphore:
+                    text = (await gh.get_blob(owner, name, sha)).decode("utf-8")
+            except UnicodeDecodeError:
+                return path, None, "Not a text file"
+            except Exception as e:
+                # Lỗi tải một file (rate limit, mạng, mirror) chỉ ghi vào errors, không dừng cả bản tóm tắt
+                return path, None, f"Download failed: {str(e) or type(e).__name__}"
+            call_started = time.perf_counter()
+            entries, error = await summarize_file(path, text, provider, model_name, refresh_cache)
+            if entries is not None:
+                summary_cache.put(summary_key(sha, provider, model_name), json.dumps(entries, ensure_ascii = False), time.perf_counter() - call_started)
+            return path, entries, error
+
+        tasks = [asyncio.ensure_future(run(path, sha)) for path, sha in pending]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                path, entries, error = await finished
+                done += 1
+                if error is None:
+                    structure[path] = entries
+                else:
+                    errors[path] = error
+                yield {"type": "file", "path": path, "status": "error" if error else "done", "error": error, "done": done, "total": total}
+        finally:
+            # Client ngắt kết nối giữa chừng: huỷ các file còn lại
+            for task in tasks:
+                task.cancel()
+
+        result = {
+            "type": "result", "repo": repo.full_name, "branch": branch, "commit": index.commit_sha,
+            "structure": dict(sorted(structure.items())), "errors": errors,
+            "processed": len(pending), "cached": total - len(pending), "truncated": truncated,
+        }
+        if query:
+            # Reduce: hỏi prompt của người dùng trên JSON cấu trúc project
+            answer = await chat_llm_retry({
+                "prompt": f"Prompt: {query}\nProject structure:\n{json.dumps(result['structure'], ensure_ascii = False)}",
+                "provider": provider,
+                "model_name": model_name,
+                "history": [{"role": "system", "content": [{"type": "text", "text": SUMMARIZE_PROMPT}]}],
+            })
+            result["answer"] = answer["output"]
+            result["answer_status_code"] = answer["status_code"]
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        yield result
+
+    return events()
\ No newline at end of file
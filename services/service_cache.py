@@ -0,0 +1,409 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from configs.config import settings
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 that git assigns to a blob with this content"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class BlobCache:
+    """Content-addressed cache of git blob bodies, keyed by blob SHA.
+
+    Blobs are immutable, so an entry never needs revalidation and can be shared
+    across branches, repositories and users: callers only learn a SHA from a
+    tree or commit they were allowed to read. Entries live in a bounded
+    in-memory LRU; when ``disk_dir`` is set, evicted and oversized entries spill
+    to disk. Disk reads and writes run in a worker thread; entries larger
+    than ``promote_threshold`` are served from disk without re-entering memory.
+    """
+
+    def __init__(self, max_bytes, disk_dir = None, disk_max_bytes = 0, promote_threshold = 256 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.promote_threshold = promote_threshold
+
+        self._memory = OrderedDict()   # sha -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()     # sha -> size
+        self._disk_bytes = 0
+        self._writing = set()          # sha đang được ghi xuống đĩa
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok = True)
+            self._load_disk_index()
+
+    def _disk_path(self, sha):
+        return os.path.join(self.disk_dir, sha[:2], sha[2:])
+
+    def _load_disk_index(self):
+        entries = []
+        for prefix in os.listdir(self.disk_dir):
+            folder = os.path.join(self.disk_dir, prefix)
+            if not re.fullmatch(r"[0-9a-f]{2}", prefix) or not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if not re.fullmatch(r"[0-9a-f]{38}", name):
+                    # File tạm của lần ghi bị dừng giữa chừng (process bị kill)
+                    if name.startswith(".tmp"):
+                        os.remove(path)
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_atime, prefix + name, stat.st_size))
+
+        for _, sha, size in sorted(entries):
+            self._disk[sha] = size
+            self._disk_bytes += size
+
+    def __contains__(self, sha):
+        with self._lock:
+            return sha in self._memory or sha in self._disk
+
+    async def get(self, sha):
+        with self._lock:
+            data = self._memory.get(sha)
+            if data is not None:
+                self._memory.move_to_end(sha)
+                self.hits += 1
+                return data
+
+            if sha not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(sha)
+
+        data = await asyncio.to_thread(self._read_disk, sha)
+        with self._lock:
+            if data is None:
+                self._drop_disk(sha)
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+
+        # Entry nhỏ được đưa lại lên bộ nhớ, entry lớn tiếp tục đọc từ đĩa
+        if len(data) < self.promote_threshold:
+            await self._put_memory(sha, data)
+        return data
+
+    async def put(self, sha, data: bytes):
+        if git_blob_sha(data) != sha:
+            return
+        if len(data) > self.max_bytes // 4:
+            await self._spill([(sha, data)])
+            return
+        await self._put_memory(sha, data)
+
+    async def _put_memory(self, sha, data):
+        spilled = []
+        with self._lock:
+            if sha in self._memory:
+                self._memory.move_to_end(sha)
+                return
+            self._memory[sha] = data
+            self._memory_bytes += len(data)
+
+            while self._memory_bytes > self.max_bytes and self._memory:
+                old_sha, old_data = self._memory.popitem(last = False)
+                self._memory_bytes -= len(old_data)
+                self.evictions += 1
+                spilled.append((old_sha, old_data))
+
+        await self._spill(spilled)
+
+    async def _spill(self, entries):
+        if self.disk_dir and entries:
+            await asyncio.to_thread(lambda: [self._write_disk(sha, data) for sha, data in entries])
+
+    def _read_disk(self, sha):
+        try:
+            with open(self._disk_path(sha), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, sha, data):
+        with self._lock:
+            # Nhiều lần put cùng SHA: chỉ một lần ghi và chỉ tính dung lượng một lần
+            if sha in self._disk or sha in self._writing:
+                return
+            self._writing.add(sha)
+
+        try:
+            path = self._disk_path(sha)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            fd, tmp_path = tempfile.mkstemp(prefix = ".tmp", dir = os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        finally:
+            with self._lock:
+                self._writing.discard(sha)
+
+        removed = []
+        with self._lock:
+            self._disk[sha] = len(data)
+            self._disk_bytes += len(data)
+            while self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_sha, size = self._disk.popitem(last = False)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+                removed.append(old_sha)
+
+        for old_sha in removed:
+            try:
+                os.remove(self._disk_path(old_sha))
+            except FileNotFoundError:
+                pass
+
+    def _drop_disk(self, sha):
+        size = self._disk.pop(sha, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+blob_cache = BlobCache(
+    max_bytes = settings.BLOB_CACHE_MAX_BYTES,
+    disk_dir = settings.BLOB_CACHE_DIR,
+    disk_max_bytes = settings.BLOB_CACHE_DISK_MAX_BYTES,
+    promote_threshold = settings.BLOB_CACHE_PROMOTE_THRESHOLD
+)
+
+
+class MetadataEntry:
+    __slots__ = ("body", "etag", "last_modified", "size", "fetched_at")
+
+    def __init__(self, body, etag, last_modified, size):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        self.fetched_at = time.monotonic()
+
+
+class MetadataCache:
+    """Cache of GitHub JSON responses with their ETag / Last-Modified validators.
+
+    Keys are ``(token_key, url)`` so that one user's view of a private
+    repository is never served to another token. Within ``ttl`` seconds an
+    entry is served without contacting GitHub; after that it is revalidated
+    with a conditional request, and a 304 (which does not count against the
+    rate limit) just renews it.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_fresh(self, key, ttl):
+        entry = self.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < ttl:
+            with self._lock:
+                self.hits += 1
+            return entry
+        return None
+
+    def put(self, key, body, etag, last_modified, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self.misses += 1
+
+            self._entries[key] = MetadataEntry(body, etag, last_modified, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last = False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def renew(self, entry):
+        """Mark an entry as fresh again after a 304 Not Modified"""
+        with self._lock:
+            entry.fetched_at = time.monotonic()
+            self.revalidated += 1
+
+    def invalidate(self, match):
+        """Drop the entries (of every token) whose URL satisfies ``match``; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if match(key[1])]
+            for key in keys:
+                self._bytes -= self._entries.pop(key).size
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.revalidated + self.misses
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.revalidated) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+metadata_cache = MetadataCache(max_bytes = settings.METADATA_CACHE_MAX_BYTES)
+
+
+class CompletionCache:
+    """TTL + LRU cache of LLM completions, keyed by a canonical request hash.
+
+    Entries are bounded by ``max_bytes`` in memory; with ``disk_dir`` they are
+    also written to disk (one JSON file per key) so they survive restarts.
+    Each entry remembers how long the upstream call took, which is reported
+    as latency saved on every hit.
+    """
+
+    def __init__(self, max_bytes, ttl, disk_dir = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()   # key -> (text, latency, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok = True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key[2:])
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key)) as f:
+                entry = json.load(f)
+            return entry["text"], entry["latency"], entry["stored_at"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def get(self, key):
+        """Cached completion text, or None if missing or older than the TTL"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None and time.time() - entry[2] < self.ttl:
+                self._put_memory(key, entry)
+
+        with self._lock:
+            if entry is None or time.time() - entry[2] >= self.ttl:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, key, text, latency):
+        entry = (text, latency, time.time())
+        self._put_memory(key, entry)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path))
+            with os.fdopen(fd, "w") as f:
+                json.dump({"text": text, "latency": latency, "stored_at": entry[2]}, f, ensure_ascii = False)
+            os.replace(tmp_path, path)
+
+    def _put_memory(self, key, entry):
+        size = len(entry[0].encode("utf-8"))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0].encode("utf-8"))
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last = False)
+                self._bytes -= len(evicted[0].encode("utf-8"))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self.saved_seconds, 3),
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+completion_cache = CompletionCache(
+    max_bytes = settings.LLM_CACHE_MAX_BYTES,
+    ttl = settings.LLM_CACHE_TTL,
+    disk_dir = settings.LLM_CACHE_DIR
+)
+
+# Kết quả phân tích từng file của /summarize: khoá theo blob SHA nên không bao giờ hết hạn
+summary_cache = CompletionCache(
+    max_bytes = settings.SUMMARY_CACHE_MAX_BYTES,
+    ttl = float("inf"),
+    disk_dir = settings.SUMMARY_CACHE_DIR
+)
@@ -1,22 +1,74 @@
 import asyncio
 import aiohttp
-from github import Github, Auth
-from github.GithubException import UnknownObjectException, GithubException
+import base64
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import quote, urlencode
+from github import Github
+from github.Repository import Repository
 
+import logging
 import re
-from ghapi.all import GhApi
+import time
+from collections import OrderedDict, deque
+from fastapi import HTTPException
+from configs.config import settings
+from .service_cache import blob_cache, metadata_cache, git_blob_sha
+from .service_archive import snapshot_store, file_extension
+from .service_http import get_session
+from .service_graphql import GitHubGraphQL
+from .service_metrics import upstream_call, github_operation
+from .service_mirror import mirror_store, GitError
+from .service_scheduler import github_scheduler, GitHubRateLimited, INTERACTIVE, BULK
+from .service_singleflight import github_flights
+from utils.patch import apply_patch, make_patch, PatchError
+
+logger = logging.getLogger(__name__)
+
+
+# Tài nguyên định danh bằng SHA (tree, commit) không bao giờ thay đổi
+IMMUTABLE_TTL = float("inf")
+# Số file tối đa trong một trang của payload commit / trong kết quả compare
+COMMIT_FILES_PAGE = 300
+COMPARE_MAX_FILES = 300
+# Số repo gần đây nhớ cho mỗi token
+RECENT_REPOS = 256
+# Chỉ dùng để dựng object PyGithub từ payload đã tải: không có token, không gửi request nào
+RAW_OBJECTS = Github(base_url = settings.GITHUB_API_URL, lazy = True)
+# Khoá cache metadata dùng chung cho mọi token (tree theo SHA, branch): quyền đọc đã kiểm tra qua get_repo
+SHARED_KEY = "shared"
+
+
+@dataclass
+class TreeIndex:
+    """Recursive tree of one commit, indexed by path -> (blob_sha, size)"""
+    commit_sha: str
+    blobs: dict
+    truncated: bool = False
+
+    def contains(self, path):
+        """True if ``path`` is a file or a directory of this tree"""
+        path = path.rstrip('/')
+        prefix = path + '/'
+        return path in self.blobs or any(p.startswith(prefix) for p in self.blobs)
 
 
 class GitHubRepo:
     def __init__(self, access_token):
         self.access_token = access_token
-        self.github = self.login()
-        self.user = self.github.get_user().login
-        self.api  = GhApi(token = access_token)
+        self.token_key = hashlib.sha256(access_token.encode()).hexdigest()
+        # Login của user chỉ được lấy khi cần (repo_name không có owner)
+        self.user = None
+        self.graphql = GitHubGraphQL(self) if settings.GITHUB_BACKEND == "graphql" else None
+        # Backend mirror: quyền truy cập vẫn kiểm tra qua API (get_repo), dữ liệu đọc từ git local
+        self.mirror = mirror_store if settings.GITHUB_BACKEND == "mirror" else None
+        # Các repo token này đọc được gần đây (chữ thường), dùng để chọn token khi pre-warm từ webhook
+        self.recent_repos = OrderedDict()
 
-    def login(self):
-        auth = Auth.Token(self.access_token)
-        return Github(auth=auth)
+    def close(self):
+        """Nothing to release: HTTP sessions are shared by every client (service_http)"""
 
     def regex_handling(self, repo_name):
         pattern = r"github\.com/([^/]+/[^/.]+)"
@@ -26,338 +78,1118 @@ class GitHubRepo:
         
         return repo_name
 
+    async def get_login(self):
+        if self.user is None:
+            self.user = (await self._get_json("/user"))["login"]
+        return self.user
+
+    async def full_repo_name(self, repo_name):
+        """Normalize a repo URL or bare name to ``owner/name``"""
+        repo_name = self.regex_handling(repo_name = repo_name)
+        if "/" not in repo_name:
+            repo_name = f"{await self.get_login()}/{repo_name}"
+        return repo_name
+
+    def _headers(self, accept = "application/vnd.github+json"):
+        return {
+            "Authorization": f"Bearer {self.access_token}",
+            "Accept": accept,
+            "X-GitHub-Api-Version": "2022-11-28"
+        }
+
+    async def _get_json(self, path, params = None, ttl = None, priority = INTERACTIVE, shared = False):
+        """GET a GitHub REST resource through the ETag metadata cache.
+
+        Fresh entries (younger than ``ttl``) are returned without a request;
+        stale ones are revalidated with If-None-Match / If-Modified-Since.
+        Requests go through the rate-limit scheduler at ``priority``;
+        concurrent identical requests of the same token share one call.
+        ``shared`` entries are cached once for every token: only for
+        resources of a repo whose access the caller checked with get_repo.
+        """
+        url = f"{settings.GITHUB_API_URL}{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        key = (SHARED_KEY if shared else self.token_key, url)
+        ttl = settings.GITHUB_METADATA_TTL if ttl is None else ttl
+
+        entry = metadata_cache.get_fresh(key, ttl)
+        if entry is not None:
+            return entry.body
+
+        headers = self._headers()
+        entry = metadata_cache.get(key)
+        if entry is not None:
+            if entry.etag: headers["If-None-Match"] = entry.etag
+            if entry.last_modified: headers["If-Modified-Since"] = entry.last_modified
+
+        async def send():
+            with upstream_call("github", github_operation(path)) as call:
+                async with get_session("github").get(url, headers = headers) as response:
+                    call.status = response.status
+                    await github_scheduler.observe(self.token_key, response)
+                    if response.status == 304 and entry is not None:
+                        metadata_cache.renew(entry)
+                        return entry.body
+
+                    response.raise_for_status()
+                    raw = await response.read()
+                    body = json.loads(raw)
+                    metadata_cache.put(
+                        key, body,
+                        etag = response.headers.get("ETag"),
+                        last_modified = response.headers.get("Last-Modified"),
+                        size = len(raw)
+                    )
+                    return body
+
+        return await github_flights.do(
+            ("json", key[0], url),
+            lambda: github_scheduler.run(self.token_key, send, priority)
+        )
+
+    async def _get_raw(self, path, priority = INTERACTIVE):
+        headers = self._headers("application/vnd.github.raw")
+
+        async def send():
+            with upstream_call("github", github_operation(path)) as call:
+                async with get_session("github").get(f"{settings.GITHUB_API_URL}{path}", headers = headers) as response:
+                    call.status = response.status
+                    await github_scheduler.observe(self.token_key, response)
+                    response.raise_for_status()
+                    return await response.read()
+
+        return await github_flights.do(("raw", self.token_key, path), lambda: github_scheduler.run(self.token_key, send, priority))
+
+    @asynccontextmanager
+    async def stream(self, path, priority = INTERACTIVE):
+        """Streaming GET (e.g. tarballs); redirects to codeload are followed.
+
+        Counts against the token's budget like every other call, so a token
+        out of quota raises ``GitHubRateLimited`` instead of downloading.
+        """
+        async with github_scheduler.slot(self.token_key, priority):
+            # Thời gian đo gồm cả lúc caller đọc hết stream
+            with upstream_call("github", github_operation(path)) as call:
+                async with get_session("github").get(
+                    f"{settings.GITHUB_API_URL}{path}",
+                    headers = self._headers(),
+                    timeout = aiohttp.ClientTimeout(total = None, sock_read = 60)
+                ) as response:
+                    call.status = response.status
+                    await github_scheduler.observe(self.token_key, response)
+                    yield response
+
+    async def _get_paginated(self, path, params = None, per_page = 100):
+        items, page = [], 1
+        while True:
+            batch = await self._get_json(path, {**(params or {}), "per_page": per_page, "page": page})
+            items.extend(batch)
+            if len(batch) < per_page:
+                return items
+            page += 1
+
     async def get_repo(self, repo_name):
         """Async version of get_repo"""
-        if "/" not in repo_name:
-            repo_name = f"{self.user}/{repo_name}"
-        
-        repo_name = self.regex_handling(repo_name = repo_name)
+        repo_name = await self.full_repo_name(repo_name)
 
-        print(f"Trying to get repo: {repo_name}")
+        logger.debug(f"Trying to get repo: {repo_name}")
         try:
-            return await asyncio.to_thread(self.github.get_repo, repo_name)
-        except UnknownObjectException as e:
-            print(f"Error finding repo {repo_name}: {str(e)}")
+            raw = await self._get_json(f"/repos/{repo_name}")
+        except aiohttp.ClientResponseError as e:
+            # Token sai / hết hạn, hoặc không được phép đọc (SSO, IP allow list): lỗi của client, không phải 500
+            if e.status in (401, 403):
+                raise HTTPException(status_code=e.status, detail=f"GitHub rejected the access token for {repo_name}: {e.message}")
+            if e.status != 404: raise
+            logger.warning(f"Error finding repo {repo_name}: {str(e)}")
             return None
 
+        self.recent_repos[raw["full_name"].lower()] = None
+        self.recent_repos.move_to_end(raw["full_name"].lower())
+        if len(self.recent_repos) > RECENT_REPOS:
+            self.recent_repos.popitem(last = False)
+        return RAW_OBJECTS.create_from_raw_data(Repository, raw)
+
     async def get_branches(self, repo_name, default = False):
         repo = await self.get_repo(repo_name)
         if repo is None:
             return None
         
-        if default: return await asyncio.to_thread(lambda: repo.default_branch)
-        branches = await asyncio.to_thread(repo.get_branches)
-        return [branch.name for branch in branches]
+        if default: return repo.default_branch
+        if self.mirror is not None:
+            mirror = await self.mirror.get(self, repo.full_name)
+            return await mirror.branches()
+        branches = await self._get_paginated(f"/repos/{repo.full_name}/branches")
+        return [branch["name"] for branch in branches]
     
+    async def resolve_commit(self, repo, branch):
+        """Commit SHA at the head of ``branch``, or None if the branch does not exist"""
+        try:
+            logger.debug(f"Getting branch {branch} for repo {repo.full_name}")
+            if self.mirror is not None:
+                _, commit_sha = await self.mirror.resolve(self, repo.full_name, f"refs/heads/{branch}")
+                return commit_sha
+            branch_obj = await self._get_json(f"/repos/{repo.full_name}/branches/{quote(branch)}", shared = True)
+        except GitHubRateLimited:
+            raise
+        except Exception as e: 
+            logger.warning(f"Error getting branch {branch}: {str(e)}")
+            return None
+
+        return branch_obj["commit"]["sha"]
+
+    async def get_tree_index(self, repo, branch):
+        """Resolve the branch and its recursive tree once, indexed by path"""
+        commit_sha = await self.resolve_commit(repo, branch)
+        if commit_sha is None:
+            return None
+        return await self.get_commit_tree_index(repo, commit_sha)
+
+    async def get_commit_tree_index(self, repo, commit_sha):
+        logger.debug(f"Getting tree for commit: {commit_sha}")
+
+        if self.mirror is not None:
+            try:
+                mirror, commit_sha = await self.mirror.resolve(self, repo.full_name, commit_sha)
+                if commit_sha is None:
+                    return None
+                return TreeIndex(commit_sha = commit_sha, blobs = await mirror.tree(commit_sha))
+            except GitError as e:
+                logger.warning(f"Error getting git tree: {str(e)}")
+                return None
+
+        try:
+            tree = await self._get_json(
+                f"/repos/{repo.full_name}/git/trees/{commit_sha}",
+                {"recursive": 1},
+                ttl = IMMUTABLE_TTL,
+                shared = True
+            )
+        except aiohttp.ClientResponseError as e:
+            logger.warning(f"Error getting git tree: {str(e)}")
+            return None
+
+        truncated = bool(tree.get("truncated"))
+        if truncated:
+            logger.info(f"Tree for commit {commit_sha} is truncated")
+
+        return TreeIndex(
+            commit_sha = commit_sha,
+            blobs = {item["path"]: (item["sha"], item.get("size", 0)) for item in tree["tree"] if item["type"] == 'blob'},
+            truncated = truncated
+        )
+
     async def get_structure(self, repo_name, branch = None):
+        if self.graphql is not None:
+            # Branch mặc định và tree trong cùng một query
+            owner, name = (await self.full_repo_name(repo_name)).split('/')
+            tree = await self.graphql.get_tree(owner, name, branch)
+            return list(tree[1]) if tree is not None else None
+
         repo = await self.get_repo(repo_name = repo_name)
         if repo is None: 
-            print(f"Repository {repo_name} not found")
+            logger.info(f"Repository {repo_name} not found")
             return None
 
         if branch is None: 
-            branch = await asyncio.to_thread(lambda: repo.default_branch)
-            print(f"Using default branch: {branch}")
+            branch = repo.default_branch
+            logger.debug(f"Using default branch: {branch}")
 
-        try:
-            print(f"Getting branch {branch} for repo {repo_name}")
-            branch_obj = await asyncio.to_thread(lambda: repo.get_branch(branch))
-        except Exception as e: 
-            print(f"Error getting branch {branch}: {str(e)}")
+        index = await self.get_tree_index(repo, branch)
+        if index is None:
+            return None
+
+        return list(index.blobs)
+
+    async def _download_blob(self, owner, repo, sha, priority = INTERACTIVE):
+        if self.mirror is not None:
+            data = await (await self.mirror.get(self, f"{owner}/{repo}")).read_blob(sha)
+        else:
+            # Tải blob ở dạng raw, không phải decode base64
+            data = await self._get_raw(f"/repos/{owner}/{repo}/git/blobs/{sha}", priority)
+        await blob_cache.put(sha, data)
+        return data
+
+    async def get_blob(self, owner, repo, sha, priority = INTERACTIVE):
+        """Blob body as bytes, served from the SHA-keyed blob cache when possible"""
+        data = await blob_cache.get(sha)
+        if data is None:
+            data = await self._download_blob(owner, repo, sha, priority)
+        return data
+
+    async def _fetch_file(self, repo, index, file, forbidden_extensions, semaphore):
+        # Kiểm tra extension có bị cấm không
+        if forbidden_extensions:
+            file_ext = file.split('.')[-1].lower() if '.' in file else ''
+            if file_ext in forbidden_extensions:
+                logger.info(f"File {file} has forbidden extension {file_ext}")
+                return None
+
+        # Kiểm tra file có tồn tại trong repo không
+        entry = index.blobs.get(file)
+        if entry is None and not index.truncated:
+            logger.info(f"File {file} not found in repository {repo.full_name}")
             return None
 
-        commit_sha = branch_obj.commit.sha
-        print(f"Getting tree for commit: {commit_sha}")
+        # Kiểm tra kích thước file trước khi tải
+        if entry is not None and entry[1] > settings.GITHUB_MAX_FILE_SIZE:
+            logger.info(f"File {file} is too large ({entry[1]} bytes)")
+            return None
 
         try:
-            tree = await asyncio.to_thread(lambda: repo.get_git_tree(commit_sha, recursive=True))
-        except GithubException as e:
-            print(f"Error getting git tree: {str(e)}")
+            data = await blob_cache.get(entry[0]) if entry is not None else None
+            if data is None:
+                async with semaphore:
+                    if entry is not None:
+                        owner, name = repo.full_name.split('/')
+                        data = await self._download_blob(owner, name, entry[0])
+                    else:
+                        # Tree bị cắt bớt: file có thể vẫn tồn tại, hỏi trực tiếp contents API (ghim theo commit)
+                        content = await self._get_json(
+                            f"/repos/{repo.full_name}/contents/{quote(file)}", {"ref": index.commit_sha}, ttl = IMMUTABLE_TTL
+                        )
+                        if not isinstance(content, dict) or content.get("type") != "file":
+                            logger.info(f"Path {file} is not a file")
+                            return None
+                        if content["size"] > settings.GITHUB_MAX_FILE_SIZE:
+                            logger.info(f"File {file} is too large ({content['size']} bytes)")
+                            return None
+                        data = await blob_cache.get(content["sha"])
+                        if data is None and content.get("encoding") == "base64":
+                            data = base64.b64decode(content["content"])
+                            await blob_cache.put(content["sha"], data)
+                        elif data is None:
+                            owner, name = repo.full_name.split('/')
+                            data = await self._download_blob(owner, name, content["sha"])
+        except GitHubRateLimited:
+            raise
+        except Exception as e:
+            logger.warning(f"Error getting content for {file}: {str(e)}")
+            return None
+
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            logger.info(f"File {file} is not a text file")
             return None
-        
-        files = [item.path for item in tree.tree if item.type == 'blob']
-        return files
 
-    async def get_files_content(self, repo_name, branch = None, files: list[str] = [], forbidden_extensions=None):
+    async def iter_files_content(self, repo_name, branch = None, files: list[str] = [], forbidden_extensions = None, archive = False):
+        """Resolve the repo and branch, then return ``(files, iterator of (file, content))`` (or None if not found).
 
-        if not files: 
-            print("No files provided")
+        Files are yielded as soon as they are downloaded (not in the order of
+        ``files``), with at most a few concurrency windows held in memory, so
+        callers can stream the result instead of building one dict.
+        """
+        if not files and not archive: 
+            logger.info("No files provided")
             return None
 
         # Chuẩn hóa forbidden_extensions
         if forbidden_extensions:
-            forbidden_extensions = [ext.lower() if not ext.startswith('.') else ext[1:].lower() 
-                                 for ext in forbidden_extensions]
+            forbidden_extensions = {ext.lower() if not ext.startswith('.') else ext[1:].lower() 
+                                    for ext in forbidden_extensions}
+
+        if self.graphql is not None and not archive:
+            contents = await self._get_files_graphql(repo_name, branch, files, forbidden_extensions)
+            if contents is None:
+                return None
+            return list(contents), self._iter_items(contents)
 
         repo = await self.get_repo(repo_name = repo_name)
         if repo is None: 
-            print(f"Repository {repo_name} not found")
+            logger.info(f"Repository {repo_name} not found")
             return None
 
         if branch is None: 
-            branch = await asyncio.to_thread(lambda: repo.default_branch)
-            print(f"Using default branch: {branch}")
+            branch = repo.default_branch
+            logger.debug(f"Using default branch: {branch}")
 
-        try:
-            # Kiểm tra branch tồn tại
-            await asyncio.to_thread(lambda: repo.get_branch(branch))
-        except Exception as e:
-            print(f"Branch {branch} not found: {str(e)}")
+        if archive:
+            return await self._iter_files_from_archive(repo, branch, files, forbidden_extensions)
+
+        # Lấy branch và tree đúng một lần cho toàn bộ danh sách file
+        index = await self.get_tree_index(repo, branch)
+        if index is None:
+            logger.info(f"Could not get structure for repository {repo_name} branch {branch}")
             return None
-        
-        available_files = await self.get_structure(repo_name = repo_name, branch = branch)
-        if available_files is None:
-            print(f"Could not get structure for repository {repo_name} branch {branch}")
+
+        files = list(dict.fromkeys(files))
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+        window = 2 * settings.GITHUB_MAX_CONCURRENCY
+
+        async def fetch(file):
+            return file, await self._fetch_file(repo, index, file, forbidden_extensions, semaphore)
+
+        async def walk():
+            remaining, pending, found = iter(files), set(), 0
+            try:
+                while True:
+                    # Chỉ tải trước tối đa `window` file: client đọc chậm thì dừng tải
+                    for file in remaining:
+                        pending.add(asyncio.ensure_future(fetch(file)))
+                        if len(pending) >= window:
+                            break
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        file, content = task.result()
+                        found += content is not None
+                        yield file, content
+            finally:
+                for task in pending:
+                    task.cancel()
+            logger.info(f"Retrieved {found}/{len(files)} files from {repo_name}")
+
+        return files, walk()
+
+    @staticmethod
+    async def _iter_items(contents):
+        for item in contents.items():
+            yield item
+
+    async def get_files_content(self, repo_name, branch = None, files: list[str] = [], forbidden_extensions=None, archive = False):
+        result = await self.iter_files_content(
+            repo_name, branch = branch, files = files, forbidden_extensions = forbidden_extensions, archive = archive
+        )
+        if result is None:
             return None
+        files, items = result
+        contents = {file: content async for file, content in items}
+        return {file: contents[file] for file in files}
 
-        file_contents = {}
+    async def _get_files_graphql(self, repo_name, branch, files, forbidden_extensions):
+        owner, name = (await self.full_repo_name(repo_name)).split('/')
+        files = list(dict.fromkeys(files))
+        wanted = [
+            file for file in files
+            if not (forbidden_extensions and file_extension(file) in forbidden_extensions)
+        ]
 
-        for file in files:
-            # Kiểm tra file có tồn tại trong repo không
-            if file not in available_files:
-                print(f"File {file} not found in repository {repo_name}")
-                file_contents[file] = None
-                continue
+        contents = await self.graphql.get_files(owner, name, branch, wanted, settings.GITHUB_MAX_FILE_SIZE)
+        if contents is None:
+            logger.info(f"Repository {repo_name} or branch {branch} not found")
+            return None
+        return {file: contents.get(file) for file in files}
 
-            # Kiểm tra extension có bị cấm không
-            if forbidden_extensions:
-                file_ext = file.split('.')[-1].lower() if '.' in file else ''
-                if file_ext in forbidden_extensions:
-                    print(f"File {file} has forbidden extension {file_ext}")
-                    file_contents[file] = None
-                    continue
+    async def _iter_files_from_archive(self, repo, branch, files, forbidden_extensions):
+        """Serve files from a tarball snapshot of the branch head (one download per commit)"""
+        commit_sha = await self.resolve_commit(repo, branch)
+        if commit_sha is None:
+            return None
 
-            try:
-                content = await asyncio.to_thread(lambda: repo.get_contents(file, ref=branch))
-                
-                # Kiểm tra kích thước file
-                if content.size > 1024 * 1024:  # Lớn hơn 1MB
-                    print(f"File {file} is too large ({content.size} bytes)")
-                    file_contents[file] = None
-                    continue
+        try:
+            snapshot = await snapshot_store.get(self, repo.full_name, commit_sha, forbidden_extensions)
+        except GitHubRateLimited:
+            raise
+        except Exception as e:
+            logger.warning(f"Error building snapshot of {repo.full_name}@{commit_sha}: {str(e)}")
+            return None
 
-                try:
-                    file_contents[file] = content.decoded_content.decode("utf-8")
-                    print(f"Successfully retrieved content for {file}")
-                except UnicodeDecodeError:
-                    print(f"File {file} is not a text file")
-                    file_contents[file] = None
-            except Exception as e:
-                print(f"Error getting content for {file}: {str(e)}")
-                file_contents[file] = None
+        # Không chỉ định files: trả về toàn bộ file văn bản của snapshot
+        files = list(dict.fromkeys(files)) if files else snapshot.text_files()
+        skipped = forbidden_extensions or set()
 
-        return file_contents
+        if not files:
+            snapshot.release()
+            return files, self._iter_items({})
 
-    async def get_langauges(self, repo_name):
-        if "/" not in repo_name: repo_name = f"{self.user}/{repo_name}"
+        async def walk():
+            # Giữ snapshot tới khi stream xong: bị đẩy khỏi SnapshotStore thì chỉ đóng sau đó
+            try:
+                for file in files:
+                    yield file, None if file_extension(file) in skipped else snapshot.read(file)
+            finally:
+                snapshot.release()
+
+        return files, walk()
 
+    async def get_langauges(self, repo_name):
         repo = await self.get_repo(repo_name = repo_name)
         if repo is None: return None
 
         try:
-            languages = await asyncio.to_thread(repo.get_languages)
+            languages = await self._get_json(f"/repos/{repo.full_name}/languages")
             total_bytes = sum(languages.values())
             if total_bytes == 0: return {}
             return {
                 lang: (bytes_count / total_bytes) * 100 for lang, bytes_count in languages.items()
             }
         except Exception as e:
-            print(f"Error getting languages: {e}")
+            logger.warning(f"Error getting languages: {e}")
             return None
 
-    async def get_commit_history(self, repo_name, branch=None, file_path=None):
-        repo_name = self.regex_handling(repo_name = repo_name)
-        
+    # Bộ lọc của query được ghi vào cursor: cursor chỉ dùng lại được với đúng query đó
+    CURSOR_FILTERS = ("path", "since", "until")
+
+    @classmethod
+    def _encode_cursor(cls, commit_sha, page, offset, per_page, params):
+        filters = {key: params[key] for key in cls.CURSOR_FILTERS if params.get(key)}
+        raw = json.dumps({"sha": commit_sha, "page": page, "offset": offset, "per_page": per_page, "filters": filters})
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        """``(sha, page, offset, per_page, filters)`` of a cursor; HTTP 400 if it is malformed or out of range"""
         try:
-            # Xử lý repo_name để lấy owner và repo
-            owner, repo = repo_name.split('/') if '/' in repo_name else (self.user, repo_name)
-            
+            data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            page, offset, per_page, filters = data["page"], data["offset"], data["per_page"], data["filters"]
+            # SHA đi thẳng vào lệnh git khi dùng mirror: chỉ chấp nhận SHA đầy đủ
+            if not re.fullmatch(r"[0-9a-f]{40}", data["sha"]):
+                raise ValueError(data["sha"])
+            # REST dùng số trang, GraphQL dùng endCursor (có thể là None ở trang đầu)
+            if (page is not None and not isinstance(page, (int, str))) or (isinstance(page, int) and page < 1):
+                raise ValueError(page)
+            # per_page đi thẳng vào request GitHub: giữ trong giới hạn 1..100 của API
+            if type(per_page) is not int or type(offset) is not int or not 1 <= per_page <= 100 or not 0 <= offset < per_page:
+                raise ValueError(per_page, offset)
+            if not isinstance(filters, dict) or not all(isinstance(filters.get(key, ""), str) for key in filters):
+                raise TypeError(filters)
+            return data["sha"], page, offset, per_page, filters
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    async def _list_commits(self, full_name, params, page, per_page, ttl = None, priority = INTERACTIVE):
+        """One page of ``GET /repos/{full_name}/commits`` (read from the mirror when enabled)"""
+        if self.mirror is not None:
+            return await (await self.mirror.get(self, full_name)).list_commits(params, page, per_page)
+        return await self._get_json(
+            f"/repos/{full_name}/commits", {**params, "per_page": per_page, "page": page},
+            ttl = ttl, priority = priority
+        )
+
+    async def _iter_commit_pages(self, full_name, params, page, per_page, ttl = None):
+        """Yield successive pages, always fetching the next page while the current one is consumed.
+
+        History walks are bulk traffic: interactive calls of the same token go first.
+        """
+        fetch = lambda n: asyncio.ensure_future(
+            self._list_commits(full_name, params, n, per_page, ttl = ttl, priority = BULK)
+        )
+        pending = fetch(page)
+        try:
+            while pending is not None:
+                batch = await pending
+                pending = fetch(page + 1) if len(batch) == per_page else None
+                yield page, batch
+                page += 1
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def iter_commit_history(self, repo_name, branch=None, file_path=None, since=None, until=None, cursor=None, limit=None):
+        """Resolve the query, then return an async iterator of ``(commit, cursor)`` (or None if not found).
+
+        The history is pinned to the head commit SHA at the first call, so
+        every page is immutable and cursors stay valid while the branch moves.
+        ``cursor`` of each item resumes right after that commit; it is None
+        after the last commit of the history.
+        """
+        repo = await self.get_repo(repo_name)
+        if repo is None:
+            logger.info(f"Repository {repo_name} not found")
+            return None
+
+        if cursor is not None:
+            commit_sha, page, offset, per_page, filters = self._decode_cursor(cursor)
+        else:
             # Xác định branch nếu không được cung cấp
             if branch is None:
-                repo_obj = await self.get_repo(repo_name)
-                if repo_obj is None:
-                    print(f"Repository {repo_name} not found")
-                    return None
-                
-                branch = await asyncio.to_thread(lambda: repo_obj.default_branch)
-                print(f"Using default branch: {branch}")
+                branch = repo.default_branch
+                logger.debug(f"Using default branch: {branch}")
+            commit_sha = await self.resolve_commit(repo, branch)
+            if commit_sha is None:
+                return None
+            page = None if self.graphql is not None else 1
+            offset, per_page = 0, min(limit, 100) if limit else 100
 
-            if file_path is None:
-                # Lấy lịch sử commit của toàn bộ repo
-                try:
-                    commits = await asyncio.to_thread(
-                        lambda: list(self.github.get_repo(repo_name).get_commits(sha=branch))
-                    )
-                    commit_history = {
-                        commit.sha: commit.commit.message
-                        for commit in commits
-                    }
-                    print(f"Retrieved {len(commit_history)} commits from repository")
-                    return commit_history
-                except Exception as e:
-                    print(f"Error getting repository commit history: {str(e)}")
-                    return None
+        params = {"sha": commit_sha}
+        if file_path is not None:
+            # Kiểm tra file có tồn tại không, dựa trên tree đã được cache
+            if self.graphql is not None:
+                owner, name = repo.full_name.split('/')
+                exists = await self.graphql.path_exists(owner, name, commit_sha, file_path.rstrip('/'))
             else:
-                # Kiểm tra file có tồn tại không
-                try:
-                    file_content = self.api.repos.get_content(
-                        owner=owner,
-                        repo=repo,
-                        path=file_path,
-                        ref=branch
-                    )
-                    print(f"Found file: {file_path}")
-                except Exception as e:
-                    print(f"File {file_path} not found: {str(e)}")
-                    return None
-                    
-                # Lấy lịch sử commit của file với phân trang
-                try:
-                    all_commits = []
-                    page = 1
-                    per_page = 100  # Số lượng commit tối đa cho mỗi trang
-                    
-                    while True:
-                        commits = self.api.repos.list_commits(
-                            owner=owner,
-                            repo=repo,
-                            sha=branch,
-                            path=file_path,
-                            per_page=per_page,
-                            page=page
-                        )
-                        
-                        if not commits:  # Không còn commit nào nữa
-                            break
-                            
-                        all_commits.extend(commits)
-                        print(f"Retrieved {len(commits)} commits from page {page}")
-                        
-                        if len(commits) < per_page:  # Đã lấy hết tất cả commit
-                            break
-                            
-                        page += 1
-                    
-                    commit_history = {
-                        commit['sha']: commit['commit']['message']
-                        for commit in all_commits
-                    }
-                    
-                    print(f"Total commits retrieved for file: {len(commit_history)}")
-                    return commit_history
-                    
-                except Exception as e:
-                    print(f"Error getting commit history for file {file_path}: {str(e)}")
-                    return None
+                index = await self.get_commit_tree_index(repo, commit_sha)
+                exists = index is not None and index.contains(file_path)
+            if not exists:
+                logger.info(f"File {file_path} not found in {repo_name} at {commit_sha}")
+                return None
+            params["path"] = file_path
+        if since: params["since"] = since
+        if until: params["until"] = until
+        if cursor is not None and filters != {key: params[key] for key in self.CURSOR_FILTERS if params.get(key)}:
+            # Trang / vị trí của cursor chỉ đúng với file_path, since, until đã tạo ra nó
+            raise HTTPException(status_code=400, detail="Cursor does not match file_path, since and until of the query")
+
+        if self.graphql is not None:
+            return self._walk_graphql_history(repo.full_name, commit_sha, params, page, offset, per_page)
 
+        async def walk():
+            pages = self._iter_commit_pages(repo.full_name, params, page, per_page, ttl = IMMUTABLE_TTL)
+            try:
+                async for number, batch in pages:
+                    last_page = len(batch) < per_page
+                    for i in range(offset if number == page else 0, len(batch)):
+                        if i + 1 < len(batch):
+                            next_cursor = self._encode_cursor(commit_sha, number, i + 1, per_page, params)
+                        elif not last_page:
+                            next_cursor = self._encode_cursor(commit_sha, number + 1, 0, per_page, params)
+                        else:
+                            next_cursor = None
+                        yield batch[i], next_cursor
+            finally:
+                await pages.aclose()
+
+        return walk()
+
+    async def _walk_graphql_history(self, full_name, commit_sha, params, after, offset, per_page):
+        """GraphQL counterpart of the REST walk: 100-node pages with author and changed-file counts"""
+        owner, name = full_name.split('/')
+        fetch = lambda cursor: asyncio.ensure_future(self.graphql.history_page(
+            owner, name, commit_sha, per_page, after = cursor,
+            path = params.get("path"), since = params.get("since"), until = params.get("until")
+        ))
+        pending = fetch(after)
+        try:
+            while pending is not None:
+                result = await pending
+                if result is None:
+                    return
+                nodes, end_cursor = result
+                pending = fetch(end_cursor) if end_cursor else None
+
+                for i in range(offset, len(nodes)):
+                    if i + 1 < len(nodes):
+                        next_cursor = self._encode_cursor(commit_sha, after, i + 1, per_page, params)
+                    elif end_cursor:
+                        next_cursor = self._encode_cursor(commit_sha, end_cursor, 0, per_page, params)
+                    else:
+                        next_cursor = None
+                    yield nodes[i], next_cursor
+                after, offset = end_cursor, 0
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def get_commit_history_page(self, repo_name, branch=None, file_path=None, limit=None, since=None, until=None, cursor=None):
+        """Up to ``limit`` commits as ``({sha: message}, next_cursor)``, or None if not found"""
+        commits = await self.iter_commit_history(
+            repo_name, branch = branch, file_path = file_path,
+            since = since, until = until, cursor = cursor, limit = limit
+        )
+        if commits is None:
+            return None
+
+        commit_history, next_cursor = {}, None
+        try:
+            async for commit, next_cursor in commits:
+                commit_history[commit['sha']] = commit['commit']['message']
+                if limit and len(commit_history) >= limit:
+                    break
+        except GitHubRateLimited:
+            raise
         except Exception as e:
-            print(f"Error in get_commit_history: {str(e)}")
+            logger.warning(f"Error getting commit history: {str(e)}")
             return None
+        finally:
+            await commits.aclose()
+
+        logger.info(f"Retrieved {len(commit_history)} commits from {repo_name}")
+        return commit_history, next_cursor
+
+    async def get_commit_history(self, repo_name, branch=None, file_path=None, limit=None, since=None, until=None):
+        result = await self.get_commit_history_page(
+            repo_name, branch = branch, file_path = file_path,
+            limit = limit, since = since, until = until
+        )
+        return result[0] if result is not None else None
+
+    async def get_commit(self, full_name, ref, priority = INTERACTIVE):
+        """Commit payload with all changed files (the API pages them 300 at a time)"""
+        if self.mirror is not None:
+            mirror, sha = await self.mirror.resolve(self, full_name, ref)
+            if sha is None:
+                raise GitError(f"Commit {ref} not found in {full_name}")
+            return await mirror.commit(sha)
+
+        path = f"/repos/{full_name}/commits/{quote(ref)}"
+        # Commit định danh bằng SHA đầy đủ không bao giờ thay đổi
+        ttl = IMMUTABLE_TTL if re.fullmatch(r"[0-9a-f]{40}", ref) else None
+
+        commit = await self._get_json(path, ttl = ttl, priority = priority)
+        files, page = list(commit.get("files", [])), 1
+        while len(files) == page * COMMIT_FILES_PAGE:
+            page += 1
+            files.extend((await self._get_json(path, {"page": page}, ttl = ttl, priority = priority)).get("files", []))
+        return {**commit, "files": files}
+
+    async def _blob_texts(self, owner, repo, shas):
+        """Decoded text per blob SHA (None if unavailable); each distinct SHA is downloaded once"""
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+
+        async def fetch(sha):
+            try:
+                data = await blob_cache.get(sha)
+                if data is None:
+                    async with semaphore:
+                        data = await self._download_blob(owner, repo, sha)
+                return data.decode("utf-8")
+            except GitHubRateLimited:
+                raise
+            except Exception as e:
+                logger.warning(f"Error getting blob {sha}: {str(e)}")
+                return None
+
+        unique = [sha for sha in dict.fromkeys(shas) if sha]
+        return dict(zip(unique, await asyncio.gather(*(fetch(sha) for sha in unique))))
+
+    @staticmethod
+    def _in_path(filename, file_path):
+        file_path = file_path.rstrip('/')
+        return filename == file_path or filename.startswith(file_path + '/')
+
+    @classmethod
+    def _files_in_path(cls, files, file_path):
+        """Files (or renames from files) under ``file_path``; every file if it is empty"""
+        if not file_path:
+            return files
+        return {
+            name: file for name, file in files.items()
+            if cls._in_path(name, file_path) or cls._in_path(file.get("previous_filename") or "", file_path)
+        }
 
     async def get_commit_changes(
         self, 
         repo_name, 
         branch=None, 
         file_path=None, 
-        commit_id=None
+        commit_id=None,
+        include_file_content=True,
+        output_diff=True
     ):
-        repo_name = self.regex_handling(repo_name=repo_name)
-        
+        repo_obj = await self.get_repo(repo_name)
+        if not repo_obj:
+            logger.info(f"Repository {repo_name} not found")
+            return None
+        owner, repo = repo_obj.full_name.split('/')
+
         try:
-            owner, repo = repo_name.split('/') if '/' in repo_name else (self.user, repo_name)
-            
-            # Xác định branch mặc định
-            if branch is None:
-                repo_obj = await self.get_repo(repo_name)
-                if not repo_obj:
-                    print(f"Repository {repo_name} not found")
+            # Xác định commit mục tiêu: commit mới nhất của branch (và file_path) nếu không chỉ định
+            if commit_id is None:
+                if branch is None:
+                    branch = repo_obj.default_branch
+                    logger.debug(f"Using default branch: {branch}")
+                params = {"sha": branch}
+                if self.mirror is not None:
+                    # Mirror: chỉ đưa SHA đã resolve vào lệnh git, không đưa tên branch do client gửi
+                    params["sha"] = await self.resolve_commit(repo_obj, branch)
+                    if params["sha"] is None:
+                        logger.info(f"Branch {branch} not found")
+                        return None
+                if file_path:
+                    params["path"] = file_path
+                latest = await self._list_commits(repo_obj.full_name, params, 1, 1)
+                if not latest:
+                    logger.info("No commit history found")
                     return None
-                branch = repo_obj.default_branch
-                print(f"Using default branch: {branch}")
-
-            # Lấy lịch sử commit
-            commit_history = await self.get_commit_history(
-                repo_name=repo_name,
-                branch=branch,
-                file_path=file_path
-            )
-            
-            if not commit_history:
-                print("No commit history found")
-                return None
+                commit_id = latest[0]["sha"]
 
-            # Xác định commit mục tiêu
-            target_commit = commit_id if commit_id else next(iter(commit_history))
-            if target_commit not in commit_history:
-                print(f"Commit {target_commit} not found")
-                return None
+            commit = await self.get_commit(repo_obj.full_name, commit_id)
+        except GitHubRateLimited:
+            raise
+        except Exception as e:
+            logger.warning(f"Error getting commit {commit_id}: {str(e)}")
+            return None
 
-            # Lấy thông tin commit
-            try:
-                commit = await asyncio.to_thread(
-                    lambda: self.api.repos.get_commit(
-                        owner=owner,
-                        repo=repo,
-                        ref=target_commit
-                    )
-                )
-            except Exception as e:
-                print(f"Error getting commit: {str(e)}")
-                return None
+        # Lọc các file thuộc file/thư mục đích (nếu có)
+        files = commit["files"]
+        if file_path:
+            files = [file for file in files if self._in_path(file["filename"], file_path)]
+        if not files:
+            return None
+
+        contents = [None] * len(files)
+        if include_file_content:
+            # Lấy nội dung file tại commit này, theo blob SHA có sẵn trong payload commit
+            texts = await self._blob_texts(owner, repo, [file["sha"] for file in files if file["status"] != "removed"])
+            contents = [
+                (texts.get(file["sha"]) or "") if file["status"] != "removed" else ""
+                for file in files
+            ]
 
-            # Chuẩn hóa đường dẫn thư mục
-            normalized_path = file_path.rstrip('/') + '/' if file_path else ''
-            
-            # Xử lý từng file trong commit
-            result = {
-                "commit_id": target_commit,
-                "message": commit.commit.message,
-                "date": commit.commit.author.date,
-                "author": {
-                    "name": commit.commit.author.name,
-                    "email": commit.commit.author.email
-                },
-                "files": {}
+        return {
+            "commit_id": commit["sha"],
+            "message": commit["commit"]["message"],
+            "date": commit["commit"]["author"]["date"],
+            "author": {
+                "name": commit["commit"]["author"]["name"],
+                "email": commit["commit"]["author"]["email"]
+            },
+            "files": {
+                file["filename"]: {
+                    "status": file["status"],
+                    "changes": file["changes"],
+                    "additions": file["additions"],
+                    "deletions": file["deletions"],
+                    "content": content,
+                    "patch": file.get("patch") if output_diff else None
+                }
+                for file, content in zip(files, contents)
             }
+        }
+
+    @staticmethod
+    def _net_status(first_status, last_status, previous_filename):
+        if first_status == "added":
+            return None if last_status == "removed" else "added"
+        if last_status == "removed":
+            return "removed"
+        return "renamed" if previous_filename else "modified"
+
+    async def _walk_range(self, full_name, head_sha, end_sha):
+        """Commits from ``head_sha`` back to ``end_sha`` (inclusive) with their payloads, oldest first"""
+        commits = []
+        pages = self._iter_commit_pages(full_name, {"sha": head_sha}, 1, 100, ttl = IMMUTABLE_TTL)
+        try:
+            async for _, batch in pages:
+                for commit in batch:
+                    commits.append(commit["sha"])
+                    if commit["sha"] == end_sha:
+                        break
+                    if len(commits) >= settings.RANGE_MAX_COMMITS:
+                        raise HTTPException(status_code=400, detail=f"Commit range exceeds {settings.RANGE_MAX_COMMITS} commits")
+                else:
+                    continue
+                break
+        finally:
+            await pages.aclose()
+
+        # Payload từng commit được cache vĩnh viễn theo SHA: các range chồng nhau gần như miễn phí
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
 
-            for file in commit.files:
+        async def fetch(sha):
+            async with semaphore:
+                return await self.get_commit(full_name, sha, priority = BULK)
+
+        return list(reversed(await asyncio.gather(*(fetch(sha) for sha in commits))))
+
+    def _merge_commit_files(self, payloads):
+        """Net status (and rename source) of every file touched by ``payloads``, oldest first"""
+        merged = {}
+        for commit in payloads:
+            for file in commit["files"]:
+                name, previous = file["filename"], file.get("previous_filename")
+                entry = merged.pop(previous, None) if file["status"] == "renamed" and previous else merged.pop(name, None)
+                if entry is None:
+                    entry = {"first_status": file["status"], "previous_filename": previous}
+                elif file["status"] == "renamed" and entry["previous_filename"] is None:
+                    entry["previous_filename"] = previous
+                entry["status"] = file["status"]
+                merged[name] = entry
+
+        files = {}
+        for name, entry in merged.items():
+            status = self._net_status(entry["first_status"], entry["status"], entry["previous_filename"])
+            if status is not None:
+                files[name] = {"status": status, "previous_filename": entry["previous_filename"] if status == "renamed" else None}
+        return files
+
+    async def _net_file_changes(self, repo_obj, base_sha, head_sha, merged, output_diff):
+        """Stats and one patch per file from its blobs at ``base_sha`` and ``head_sha``, like a compare.
+
+        Files whose blob is the same at both ends (changed, then reverted)
+        are dropped; binary files get zero stats and no patch, as on GitHub.
+        """
+        owner, repo = repo_obj.full_name.split('/')
+        base_index = await self.get_commit_tree_index(repo_obj, base_sha) if base_sha else None
+        head_index = await self.get_commit_tree_index(repo_obj, head_sha)
+        if head_index is None or (base_sha and base_index is None):
+            raise GitError(f"Tree of {base_sha}..{head_sha} not found")
+
+        ends = {}
+        for name, file in merged.items():
+            before = base_index.blobs.get(file["previous_filename"] or name, (None,))[0] if base_index else None
+            after = head_index.blobs.get(name, (None,))[0]
+            if before == after and file["status"] != "renamed":
+                continue
+            ends[name] = before, after
+        texts = await self._blob_texts(owner, repo, [sha for shas in ends.values() for sha in shas])
+
+        files = {}
+        for name, (before, after) in ends.items():
+            file = merged[name]
+            old_text = texts.get(before) if before else ""
+            new_text = texts.get(after) if after else ""
+            patch, additions, deletions = None, 0, 0
+            if old_text is not None and new_text is not None:
+                patch, additions, deletions = make_patch(old_text, new_text)
+            files[name] = {
+                "status": file["status"],
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions,
+                "patch": (patch or None) if output_diff else None
+            }
+            if file["previous_filename"]:
+                files[name]["previous_filename"] = file["previous_filename"]
+        return files
+
+    async def get_range_changes(
+        self,
+        repo_name,
+        branch=None,
+        file_path=None,
+        start_id=None,
+        end_id=None,
+        output_diff=True,
+        include_file_content=False
+    ):
+        """Net changes of the commits ``end_id`` (oldest, inclusive) .. ``start_id`` (newest).
+
+        Uses one compare call when the range fits in its 300-file limit,
+        otherwise walks the range and merges per-commit file changes locally.
+        """
+        repo_obj = await self.get_repo(repo_name)
+        if not repo_obj:
+            logger.info(f"Repository {repo_name} not found")
+            return None
+        full_name = repo_obj.full_name
+        owner, repo = full_name.split('/')
+
+        try:
+            if start_id is None:
+                if branch is None:
+                    branch = repo_obj.default_branch
+                    logger.debug(f"Using default branch: {branch}")
+                start_id = await self.resolve_commit(repo_obj, branch)
+                if start_id is None:
+                    return None
+            head_sha = (await self.get_commit(full_name, start_id))["sha"]
+
+            end_sha = base_sha = None
+            if end_id is not None:
+                end_commit = await self.get_commit(full_name, end_id)
+                end_sha = end_commit["sha"]
+                base_sha = end_commit["parents"][0]["sha"] if end_commit["parents"] else None
+
+            files = None
+            if base_sha is not None:
+                if self.mirror is not None:
+                    compare = await (await self.mirror.get(self, full_name)).compare(base_sha, head_sha)
+                else:
+                    compare = await self._get_json(f"/repos/{full_name}/compare/{base_sha}...{head_sha}", ttl = IMMUTABLE_TTL)
+                # Diff local của mirror không bị giới hạn số file như compare API
+                if self.mirror is not None or len(compare.get("files", [])) < COMPARE_MAX_FILES:
+                    commits = [{"sha": c["sha"], "message": c["commit"]["message"]} for c in compare["commits"]]
+                    total_commits = compare["total_commits"]
+                    files = {}
+                    for file in compare["files"]:
+                        files[file["filename"]] = {
+                            "status": file["status"],
+                            "additions": file["additions"],
+                            "deletions": file["deletions"],
+                            "changes": file["changes"],
+                            "patch": file.get("patch") if output_diff else None
+                        }
+                        if file.get("previous_filename"):
+                            files[file["filename"]]["previous_filename"] = file["previous_filename"]
+
+            if files is None:
+                logger.debug(f"Merging commits of range {end_sha}..{head_sha} locally")
+                payloads = await self._walk_range(full_name, head_sha, end_sha)
+                commits = [{"sha": c["sha"], "message": c["commit"]["message"]} for c in payloads]
+                total_commits = len(payloads)
+                # Chỉ tải blob của các file thuộc file_path
+                merged = self._files_in_path(self._merge_commit_files(payloads), file_path)
+                files = await self._net_file_changes(repo_obj, base_sha, head_sha, merged, output_diff)
+        except (HTTPException, GitHubRateLimited):
+            raise
+        except Exception as e:
+            logger.warning(f"Error getting changes of range {end_id}..{start_id}: {str(e)}")
+            return None
+
+        files = self._files_in_path(files, file_path)
+        if not files:
+            return None
+
+        if include_file_content:
+            # Nội dung trước/sau lấy từ tree của commit gốc và commit cuối, theo blob SHA
+            base_index = await self.get_commit_tree_index(repo_obj, base_sha) if base_sha else None
+            head_index = await self.get_commit_tree_index(repo_obj, head_sha)
+            before_sha = lambda name, file: base_index.blobs.get(file.get("previous_filename") or name, (None,))[0] if base_index else None
+            after_sha = lambda name: head_index.blobs.get(name, (None,))[0] if head_index else None
+            texts = await self._blob_texts(owner, repo, [
+                sha for name, file in files.items() for sha in (before_sha(name, file), after_sha(name))
+            ])
+            for name, file in files.items():
+                file["content_before"] = texts.get(before_sha(name, file))
+                file["content_after"] = texts.get(after_sha(name))
+
+        return {
+            "start_id": head_sha,
+            "end_id": end_sha,
+            "base_id": base_sha,
+            "total_commits": total_commits,
+            # Compare API chỉ trả về tối đa 250 commit đầu tiên của range
+            "commits_truncated": len(commits) < total_commits,
+            "commits": commits,
+            "files": files
+        }
+
+    async def iter_file_timeline(self, repo_name, file_path, branch = None, limit = None):
+        """Resolve the file at the branch head, then return an async iterator of its versions, newest first (None if not found).
+
+        Only the head content is fetched; each older version is rebuilt by
+        reverse-applying the patch of the commit that produced the next one,
+        and checked against the blob SHA of the commit payload. A version is
+        downloaded only when its patch is missing or does not reproduce it.
+        Renames are followed through ``previous_filename``. Versions go into
+        the blob cache, so they are shared with /get_content and /get_changes.
+        """
+        repo = await self.get_repo(repo_name)
+        if repo is None:
+            logger.info(f"Repository {repo_name} not found")
+            return None
+        head_sha = await self.resolve_commit(repo, branch or repo.default_branch)
+        if head_sha is None:
+            return None
+        index = await self.get_commit_tree_index(repo, head_sha)
+        if index is None or file_path not in index.blobs:
+            logger.info(f"File {file_path} not found in {repo_name} at {head_sha}")
+            return None
+        owner, name = repo.full_name.split('/')
+        prefetch = min(limit or settings.GITHUB_MAX_CONCURRENCY, settings.GITHUB_MAX_CONCURRENCY)
+
+        async def version_text(entry, rebuilt):
+            """Content after the commit of ``entry``: the rebuilt text if its blob SHA matches, else the blob"""
+            if rebuilt is not None:
+                data = rebuilt.encode("utf-8")
+                if git_blob_sha(data) == entry["sha"]:
+                    await blob_cache.put(entry["sha"], data)
+                    return rebuilt, "patch"
+                logger.info(f"Rebuilt {entry['filename']} does not match blob {entry['sha']}")
+            try:
+                return (await self.get_blob(owner, name, entry["sha"])).decode("utf-8"), "blob"
+            except UnicodeDecodeError:
+                return None, "blob"
+
+        async def walk():
+            path, ref, rebuilt, count = file_path, head_sha, None, 0
+            while path is not None:
+                pages = self._iter_commit_pages(repo.full_name, {"sha": ref, "path": path}, 1, 100, ttl = IMMUTABLE_TTL)
+                shas = (commit["sha"] async for _, batch in pages for commit in batch)
+                window, next_path = deque(), None
                 try:
-                    # Kiểm tra file thuộc thư mục đích (nếu có)
-                    if file_path:
-                        if not file.filename.startswith(normalized_path):
+                    while True:
+                        # Tải trước payload của vài commit tiếp theo trong khi xử lý commit hiện tại
+                        while len(window) < prefetch:
+                            sha = await anext(shas, None)
+                            if sha is None:
+                                break
+                            window.append(asyncio.ensure_future(self.get_commit(repo.full_name, sha, priority = BULK)))
+                        if not window:
+                            break
+
+                        commit = await window.popleft()
+                        entry = next((file for file in commit["files"] if file["filename"] == path), None)
+                        if entry is None:
                             continue
 
-                    # Lấy nội dung file tại commit này
-                    content = ""
-                    if file.status != "removed":
-                        try:
-                            content_res = await asyncio.to_thread(
-                                lambda: self.api.repos.get_content(
-                                    owner=owner,
-                                    repo=repo,
-                                    path=file.filename,
-                                    ref=target_commit
-                                )
-                            )
-                            content = self._decode_content(content_res.content)
-                        except Exception as e:
-                            print(f"Error getting content for {file.filename}: {str(e)}")
-
-                    # Thêm thông tin thay đổi
-                    result["files"][file.filename] = {
-                        "status": file.status,
-                        "changes": file.changes,
-                        "additions": file.additions,
-                        "deletions": file.deletions,
-                        "content": content,
-                        "patch": getattr(file, "patch", None)
-                    }
-
-                except Exception as e:
-                    print(f"Error processing {file.filename}: {str(e)}")
-
-            return result if result["files"] else None
+                        if entry["status"] == "removed":
+                            content, source, after = None, None, ""
+                        else:
+                            content, source = await version_text(entry, rebuilt)
+                            after = content
+                        yield {
+                            "commit_id": commit["sha"],
+                            "message": commit["commit"]["message"],
+                            "date": commit["commit"]["author"]["date"],
+                            "author": {
+                                "name": commit["commit"]["author"]["name"],
+                                "email": commit["commit"]["author"]["email"]
+                            },
+                            "path": path,
+                            "status": entry["status"],
+                            "blob_sha": entry["sha"] if entry["status"] != "removed" else None,
+                            "source": source,
+                            "content": content,
+                            "patch": entry.get("patch")
+                        }
+                        count += 1
+                        if limit and count >= limit:
+                            return
 
-        except Exception as e:
-            print(f"Critical error: {str(e)}")
-            return None
\ No newline at end of file
+                        # Phiên bản trước commit này: đảo ngược patch (file mới thêm thì không có)
+                        rebuilt = None
+                        if entry["status"] != "added" and after is not None and entry.get("patch") is not None:
+                            try:
+                                rebuilt = apply_patch(after, entry["patch"], reverse = True)
+                            except PatchError as e:
+                                logger.info(f"Cannot reverse patch of {path} at {commit['sha']}: {str(e)}")
+                        elif entry["status"] == "renamed" and "patch" not in entry:
+                            rebuilt = after
+
+                        if entry["status"] == "renamed" and entry.get("previous_filename"):
+                            # Lịch sử theo path không đi qua rename: đi tiếp từ commit cha với tên cũ
+                            next_path = entry["previous_filename"]
+                            ref = commit["parents"][0]["sha"] if commit.get("parents") else None
+                            break
+                finally:
+                    for future in window:
+                        future.cancel()
+                    await shas.aclose()
+                    await pages.aclose()
+                path = next_path if ref is not None else None
+
+        return walk()
+
+
+class GitHubClientPool:
+    """Authenticated ``GitHubRepo`` clients reused per access token.
+
+    Keeps each token's resolved login and recently read repositories
+    across requests; HTTP connections are pooled per upstream by
+    service_http and shared by every client. Clients idle for longer than
+    ``ttl`` seconds, or beyond ``max_size`` tokens, are dropped.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clients = OrderedDict()  # token_key -> (client, last_used)
+
+    def get(self, access_token):
+        now = time.monotonic()
+        self._expire(now)
+
+        token_key = hashlib.sha256(access_token.encode()).hexdigest()
+        entry = self._clients.pop(token_key, None)
+        client = entry[0] if entry is not None else GitHubRepo(access_token = access_token)
+        self._clients[token_key] = (client, now)
+
+        while len(self._clients) > self.max_size:
+            _, (old_client, _) = self._clients.popitem(last = False)
+            old_client.close()
+        return client
+
+    def client_for(self, full_name):
+        """Most recently used client that has read ``full_name`` (else one for GITHUB_TOKEN, or None)"""
+        for client, _ in reversed(self._clients.values()):
+            if full_name.lower() in client.recent_repos:
+                return client
+        return self.get(settings.GITHUB_TOKEN) if settings.GITHUB_TOKEN else None
+
+    def _expire(self, now):
+        while self._clients:
+            token_key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.ttl:
+                break
+            del self._clients[token_key]
+            client.close()
+
+
+github_pool = GitHubClientPool(
+    ttl = settings.GITHUB_CLIENT_TTL,
+    max_size = settings.GITHUB_CLIENT_POOL_SIZE
+)
@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+
+from configs.config import settings
+from .service_cache import blob_cache
+from .service_http import get_session
+from .service_metrics import upstream_call
+from .service_scheduler import github_scheduler, INTERACTIVE, BULK
+from .service_singleflight import github_flights
+
+logger = logging.getLogger(__name__)
+
+
+# Lỗi GitHub trả về khi một query quá tốn kém: cần chia nhỏ query rồi gửi lại
+COST_ERROR_TYPES = {"MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED", "TIMEOUT"}
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class GraphQLCostError(GraphQLError):
+    pass
+
+
+def _tree_selection(depth):
+    inner = "... on Blob { byteSize }"
+    if depth > 1:
+        inner += f" ... on Tree {{ {_tree_selection(depth - 1)} }}"
+    return f"entries {{ name type oid object {{ {inner} }} }}"
+
+
+HISTORY_QUERY = """
+query($owner: String!, $name: String!, $rev: String!, $first: Int!, $after: String,
+      $path: String, $since: GitTimestamp, $until: GitTimestamp) {
+  repository(owner: $owner, name: $name) {
+    object(expression: $rev) {
+      ... on Commit {
+        history(first: $first, after: $after, path: $path, since: $since, until: $until) {
+          pageInfo { hasNextPage endCursor }
+          nodes { oid message author { name email date } changedFilesIfAvailable }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class GitHubGraphQL:
+    """GraphQL execution backend for ``GitHubRepo`` (GITHUB_BACKEND=graphql).
+
+    Folds what REST needs many calls for into few queries: ref resolution,
+    the (depth-limited) tree and the first blob texts share one query, and
+    the rest is batched with aliases. Batches that GitHub rejects as too
+    expensive are split in half and retried.
+    """
+
+    def __init__(self, gh):
+        self.gh = gh
+
+    async def execute(self, query, variables = None, priority = INTERACTIVE):
+        payload = {"query": query, "variables": variables or {}}
+
+        async def send():
+            with upstream_call("github", "/graphql") as call:
+                async with get_session("github").post(settings.GITHUB_GRAPHQL_URL, json = payload, headers = self.gh._headers()) as response:
+                    call.status = response.status
+                    await github_scheduler.observe(self.gh.token_key, response, resource = "graphql")
+                    if response.status in (502, 504):
+                        raise GraphQLCostError(f"GraphQL query timed out ({response.status})")
+                    response.raise_for_status()
+                    return await response.json()
+
+        result = await github_flights.do(
+            ("graphql", self.gh.token_key, json.dumps(payload, sort_keys = True)),
+            lambda: github_scheduler.run(self.gh.token_key, send, priority, resource = "graphql")
+        )
+
+        errors = result.get("errors")
+        if errors:
+            if any(error.get("type") in COST_ERROR_TYPES for error in errors):
+                raise GraphQLCostError(errors[0].get("message"))
+            if result.get("data") is None:
+                raise GraphQLError(errors[0].get("message"))
+        return result["data"]
+
+    async def _split(self, batch, run):
+        """Run ``batch``; on a cost error, split it in half and retry both halves"""
+        try:
+            return await run(batch)
+        except GraphQLCostError:
+            if len(batch) == 1:
+                raise
+            mid = len(batch) // 2
+            left, right = await asyncio.gather(self._split(batch[:mid], run), self._split(batch[mid:], run))
+            return {**left, **right}
+
+    async def _batched(self, items, run):
+        size = settings.GITHUB_GRAPHQL_BATCH
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+
+        async def guarded(batch):
+            async with semaphore:
+                return await self._split(batch, run)
+
+        results = {}
+        for part in await asyncio.gather(*(guarded(items[i:i + size]) for i in range(0, len(items), size))):
+            results.update(part)
+        return results
+
+    @staticmethod
+    def _ref_selection(branch, tree_fields = "oid", commit_fields = ""):
+        ref = "defaultBranchRef" if branch is None else "ref(qualifiedName: $ref)"
+        return f"{ref} {{ name target {{ oid ... on Commit {{ tree {{ {tree_fields} }} {commit_fields} }} }} }}"
+
+    @staticmethod
+    def _blob_fields():
+        return "... on Blob { oid byteSize isBinary isTruncated text }"
+
+    def _collect_entries(self, entries, prefix, blobs, pending):
+        for entry in entries:
+            path = f"{prefix}{entry['name']}"
+            obj = entry.get("object") or {}
+            if entry["type"] == "blob":
+                blobs[path] = (entry["oid"], obj.get("byteSize", 0))
+            elif entry["type"] == "tree":
+                if "entries" in obj:
+                    self._collect_entries(obj["entries"], f"{path}/", blobs, pending)
+                else:
+                    # Vượt quá độ sâu của query: lấy tiếp ở lượt sau
+                    pending.append((entry["oid"], f"{path}/"))
+
+    async def get_tree(self, owner, name, branch = None):
+        """``(commit_oid, {path: (blob_oid, size)})`` for the branch head, or None.
+
+        A query that GitHub rejects as too expensive is retried with half the
+        tree depth; deeper levels are then fetched as subtrees.
+        """
+        variables = {"owner": owner, "name": name}
+        if branch is not None:
+            variables["ref"] = f"refs/heads/{branch}"
+        depth = settings.GITHUB_GRAPHQL_TREE_DEPTH
+        while True:
+            query = f"""
+            query($owner: String!, $name: String!{', $ref: String!' if branch is not None else ''}) {{
+              repository(owner: $owner, name: $name) {{
+                {self._ref_selection(branch, _tree_selection(depth))}
+              }}
+            }}
+            """
+            try:
+                data = await self.execute(query, variables)
+                break
+            except GraphQLCostError:
+                if depth == 1:
+                    raise
+                depth //= 2
+                logger.info(f"Tree query of {owner}/{name} too expensive, retrying with depth {depth}")
+
+        repository = data.get("repository")
+        ref = repository and (repository.get("defaultBranchRef") if branch is None else repository.get("ref"))
+        if not ref:
+            return None
+
+        commit = ref["target"]
+        blobs, pending = {}, []
+        self._collect_entries(commit["tree"]["entries"], "", blobs, pending)
+
+        while pending:
+            subtrees, pending = pending, []
+
+            async def run(batch, depth = depth):
+                fields = " ".join(
+                    f't{i}: object(oid: "{oid}") {{ ... on Tree {{ {_tree_selection(depth)} }} }}'
+                    for i, (oid, _) in enumerate(batch)
+                )
+                try:
+                    result = await self.execute(
+                        f"query($owner: String!, $name: String!) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}",
+                        {"owner": owner, "name": name}
+                    )
+                except GraphQLCostError:
+                    # Một subtree vẫn quá nặng: giảm độ sâu, phần còn lại thành pending
+                    if len(batch) > 1 or depth == 1:
+                        raise
+                    return await run(batch, depth // 2)
+                return {subtree: result["repository"][f"t{i}"] for i, subtree in enumerate(batch)}
+
+            for (_, prefix), tree in (await self._batched(subtrees, run)).items():
+                self._collect_entries(tree["entries"], prefix, blobs, pending)
+
+        return commit["oid"], blobs
+
+    async def _parse_blob(self, path, blob, max_size):
+        if blob is None:
+            logger.info(f"File {path} not found")
+            return None
+        if "byteSize" not in blob:
+            # Thư mục / submodule: fragment `... on Blob` trả về object rỗng
+            logger.info(f"Path {path} is not a file")
+            return None
+        if blob["byteSize"] > max_size or blob["isTruncated"]:
+            logger.info(f"File {path} is too large ({blob['byteSize']} bytes)")
+            return None
+        if blob["isBinary"] or blob["text"] is None:
+            logger.info(f"File {path} is not a text file")
+            return None
+        await blob_cache.put(blob["oid"], blob["text"].encode("utf-8"))
+        return blob["text"]
+
+    async def get_files(self, owner, name, branch, paths, max_size):
+        """Texts of ``paths`` at the branch head (None for missing / binary / too large).
+
+        The ref and the first GITHUB_GRAPHQL_BATCH files come back in a
+        single query, read through ``Commit.file`` of the resolved commit;
+        the remaining files are fetched pinned to that commit, so a push
+        during the call never mixes two versions of the branch.
+        """
+        first, rest = paths[:settings.GITHUB_GRAPHQL_BATCH], paths[settings.GITHUB_GRAPHQL_BATCH:]
+        declared = ", ".join(f"$p{i}: String!" for i in range(len(first)))
+        fields = " ".join(f"f{i}: file(path: $p{i}) {{ object {{ {self._blob_fields()} }} }}" for i in range(len(first)))
+        query = f"""
+        query($owner: String!, $name: String!{', $ref: String!' if branch is not None else ''}{', ' + declared if declared else ''}) {{
+          repository(owner: $owner, name: $name) {{
+            {self._ref_selection(branch, commit_fields = fields)}
+          }}
+        }}
+        """
+        variables = {"owner": owner, "name": name}
+        if branch is not None:
+            variables["ref"] = f"refs/heads/{branch}"
+        variables.update({f"p{i}": path for i, path in enumerate(first)})
+
+        try:
+            data = await self.execute(query, variables)
+        except GraphQLCostError:
+            # Query đầu tiên quá nặng: chỉ lấy ref, các file đi theo batch
+            data = await self.execute(
+                f"query($owner: String!, $name: String!{', $ref: String!' if branch is not None else ''}) "
+                f"{{ repository(owner: $owner, name: $name) {{ {self._ref_selection(branch)} }} }}",
+                {key: value for key, value in variables.items() if not key.startswith("p")}
+            )
+            first, rest = [], paths
+
+        repository = data.get("repository")
+        ref = repository and (repository.get("defaultBranchRef") if branch is None else repository.get("ref"))
+        if not ref:
+            return None
+        commit = ref["target"]
+        commit_oid = commit["oid"]
+
+        contents = {}
+        for i, path in enumerate(first):
+            entry = commit.get(f"f{i}")
+            contents[path] = await self._parse_blob(path, entry and entry.get("object"), max_size)
+
+        async def run(batch):
+            declared = ", ".join(f"$p{i}: String!" for i in range(len(batch)))
+            fields = " ".join(f"f{i}: object(expression: $p{i}) {{ {self._blob_fields()} }}" for i in range(len(batch)))
+            result = await self.execute(
+                f"query($owner: String!, $name: String!, {declared}) {{ repository(owner: $owner, name: $name) {{ {fields} }} }}",
+                {"owner": owner, "name": name, **{f"p{i}": f"{commit_oid}:{path}" for i, path in enumerate(batch)}}
+            )
+            return {path: await self._parse_blob(path, result["repository"].get(f"f{i}"), max_size) for i, path in enumerate(batch)}
+
+        if rest:
+            contents.update(await self._batched(rest, run))
+        return contents
+
+    async def path_exists(self, owner, name, rev, path):
+        data = await self.execute(
+            "query($owner: String!, $name: String!, $expr: String!) "
+            "{ repository(owner: $owner, name: $name) { object(expression: $expr) { oid } } }",
+            {"owner": owner, "name": name, "expr": f"{rev}:{path}"}
+        )
+        repository = data.get("repository")
+        return bool(repository and repository.get("object"))
+
+    async def history_page(self, owner, name, rev, first, after = None, path = None, since = None, until = None):
+        """One page of commit history as ``(nodes, end_cursor or None)``; pages that are too expensive shrink"""
+        variables = {
+            "owner": owner, "name": name, "rev": rev, "first": first, "after": after,
+            "path": path, "since": since, "until": until
+        }
+        while True:
+            try:
+                data = await self.execute(HISTORY_QUERY, variables, priority = BULK)
+                break
+            except GraphQLCostError:
+                if variables["first"] == 1:
+                    raise
+                variables["first"] = max(1, variables["first"] // 2)
+
+        repository = data.get("repository")
+        if not repository or not repository.get("object"):
+            return None
+        history = repository["object"]["history"]
+        nodes = [
+            {
+                "sha": node["oid"],
+                "commit": {"message": node["message"], "author": node["author"]},
+                "changed_files": node.get("changedFilesIfAvailable")
+            }
+            for node in history["nodes"]
+        ]
+        page_info = history["pageInfo"]
+        return nodes, page_info["endCursor"] if page_info["hasNextPage"] else None
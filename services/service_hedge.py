@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from configs.config import settings
+from .service_llm import llm_answer, llm_stream
+
+logger = logging.getLogger(__name__)
+
+
+def is_ok(status_code):
+    return 200 <= status_code < 300
+
+
+class LatencyTracker:
+    """Rolling latency window of successful completions per (provider, model)"""
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = {}
+
+    def record(self, provider, model_name, seconds):
+        samples = self._samples.get((provider, model_name))
+        if samples is None:
+            samples = self._samples[(provider, model_name)] = deque(maxlen = self.window)
+        samples.append(seconds)
+
+    def percentile(self, provider, model_name, q, min_samples = 1):
+        samples = self._samples.get((provider, model_name))
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        return {
+            f"{provider}:{model_name}": {
+                "samples": len(samples),
+                "p50": self.percentile(provider, model_name, 0.5),
+                "p95": self.percentile(provider, model_name, 0.95),
+            }
+            for (provider, model_name), samples in self._samples.items()
+        }
+
+
+class HedgedRouter:
+    """Latency-aware routing between a primary model and its configured fallback.
+
+    ``fallbacks`` maps ``"provider:model"`` to the ``"provider:model"`` to use
+    when the primary fails. With hedging enabled, once the primary has been
+    running longer than its rolling p95 a second request goes to the
+    fallback; the first successful answer wins and the other is cancelled.
+    """
+
+    def __init__(self, fallbacks, hedge, min_samples, window):
+        self.fallbacks = {
+            tuple(primary.split(":", 1)): tuple(fallback.split(":", 1))
+            for primary, fallback in fallbacks.items()
+        }
+        self.hedge = hedge
+        self.min_samples = min_samples
+        self.latency = LatencyTracker(window)
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def fallback_for(self, provider, model_name):
+        return self.fallbacks.get((provider, model_name))
+
+    async def _timed(self, provider, model_name, kwargs):
+        started = time.perf_counter()
+        output, status_code = await llm_answer(provider = provider, model_name = model_name, **kwargs)
+        if is_ok(status_code):
+            self.latency.record(provider, model_name, time.perf_counter() - started)
+        return output, status_code
+
+    async def answer(self, provider, model_name, **kwargs):
+        """``llm_answer`` with hedging / failover to the configured fallback"""
+        self.requests += 1
+        fallback = self.fallback_for(provider, model_name)
+        if fallback is None:
+            return await self._timed(provider, model_name, kwargs)
+
+        primary, hedge = asyncio.ensure_future(self._timed(provider, model_name, kwargs)), None
+        delay = self.latency.percentile(provider, model_name, 0.95, self.min_samples) if self.hedge else None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout = delay)
+            if done:
+                output, status_code = primary.result()
+                if is_ok(status_code):
+                    return output, status_code
+                # Primary lỗi: chuyển sang model dự phòng
+                self.failovers += 1
+                logger.warning(f"{provider}:{model_name} failed ({status_code}), failing over to {':'.join(fallback)}")
+                fallback_output, fallback_status = await self._timed(*fallback, kwargs)
+                return (fallback_output, fallback_status) if is_ok(fallback_status) else (output, status_code)
+
+            # Primary chậm hơn p95: gửi thêm request tới model dự phòng, lấy câu trả lời đến trước
+            self.hedged += 1
+            hedge = asyncio.ensure_future(self._timed(*fallback, kwargs))
+            pending, first_error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                for task in done:
+                    output, status_code = task.result()
+                    if is_ok(status_code):
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return output, status_code
+                    if task is primary or first_error is None:
+                        first_error = (output, status_code)
+            return first_error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def stream(self, provider, model_name, **kwargs):
+        """``llm_stream`` that fails over to the fallback if the primary errors before its first token"""
+        self.requests += 1
+        fallback = self.fallback_for(provider, model_name)
+        events = llm_stream(provider = provider, model_name = model_name, **kwargs)
+        started = False
+        try:
+            async for event in events:
+                if event["type"] == "error" and not started and fallback is not None:
+                    self.failovers += 1
+                    logger.warning(f"{provider}:{model_name} failed ({event['status_code']}), failing over to {':'.join(fallback)}")
+                    async for fallback_event in llm_stream(provider = fallback[0], model_name = fallback[1], **kwargs):
+                        yield fallback_event
+                    return
+                started = started or event["type"] == "delta"
+                yield event
+        finally:
+            await events.aclose()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "failovers": self.failovers,
+            "latency": self.latency.stats(),
+        }
+
+
+llm_router = HedgedRouter(
+    fallbacks = json.loads(settings.LLM_FALLBACKS or "{}"),
+    hedge = settings.LLM_HEDGE_ENABLED,
+    min_samples = settings.LLM_HEDGE_MIN_SAMPLES,
+    window = settings.LLM_LATENCY_WINDOW
+)
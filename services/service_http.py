@@ -0,0 +1,38 @@
+import asyncio
+import aiohttp
+
+
+_sessions = {}
+_limiters = {}
+
+
+def get_session(name, limit = 100, timeout = None):
+    """Shared keep-alive ``aiohttp`` session for one upstream, created lazily.
+
+    Sessions are bound to the running event loop, so they are only ever
+    created from inside a request handler and closed on app shutdown.
+    """
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit = limit, keepalive_timeout = 60)
+        session = aiohttp.ClientSession(
+            connector = connector,
+            timeout = timeout or aiohttp.ClientTimeout(total = 60)
+        )
+        _sessions[name] = session
+    return session
+
+
+def get_limiter(name, limit):
+    """Semaphore bounding in-flight requests to one upstream"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = asyncio.Semaphore(limit)
+    return limiter
+
+
+async def close_sessions():
+    for session in _sessions.values():
+        if not session.closed:
+            await session.close()
+    _sessions.clear()
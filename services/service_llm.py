@@ -1,13 +1,108 @@
-import requests
+import asyncio
+import aiohttp
+import hashlib
+import json
+import time
 from configs.config import settings
+from .service_http import get_session, get_limiter
+from .service_metrics import upstream_call
+from .service_singleflight import llm_flights
+from .service_cache import completion_cache
 
-async def llm_answer(
+
+DEFAULT_GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.2
+}
+
+# Thời điểm mỗi provider nhận request trở lại, theo Retry-After của response 429/503 gần nhất
+_blocked_until = {}
+
+
+def note_retry_after(provider, headers):
+    try:
+        delay = float((headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        return   # Không có header, hoặc dạng HTTP date: để caller tự backoff
+    _blocked_until[provider] = max(_blocked_until.get(provider, 0.0), time.time() + delay)
+
+
+def retry_after(provider):
+    """Seconds until ``provider`` accepts requests again per its last ``Retry-After`` (0 if none)"""
+    return max(0.0, _blocked_until.get(provider, 0.0) - time.time())
+
+
+def llm_timeout():
+    return aiohttp.ClientTimeout(
+        total = settings.LLM_TIMEOUT,
+        sock_connect = settings.LLM_CONNECT_TIMEOUT
+    )
+
+
+def llm_stream_timeout():
+    # Stream có thể kéo dài: giới hạn khoảng nghỉ giữa hai chunk thay vì tổng thời gian
+    return aiohttp.ClientTimeout(
+        total = None,
+        sock_connect = settings.LLM_CONNECT_TIMEOUT,
+        sock_read = settings.LLM_TIMEOUT
+    )
+
+
+def content_parts(message):
+    """Content of a message as a list of ``{"type": "text", "text": ...}`` parts"""
+    content = message["content"]
+    return [{"type": "text", "text": content}] if isinstance(content, str) else content
+
+
+def prefix_chars(messages):
+    return sum(len(part.get("text", "")) for message in messages for part in content_parts(message))
+
+
+def claude_messages(messages):
+    """Split out Claude's top-level ``system`` and mark long stable prefixes for prompt caching.
+
+    Claude rejects ``system`` roles inside ``messages``. The system prompt and
+    the history before the new turn get a ``cache_control`` breakpoint when
+    they are long enough to be cached, so repeated context is billed at the
+    cache-read rate.
+    """
+    system = [dict(part) for message in messages if message["role"] == "system" for part in content_parts(message)]
+    chat = [
+        {"role": message["role"], "content": [dict(part) for part in content_parts(message)]}
+        for message in messages if message["role"] != "system"
+    ]
+
+    if system and prefix_chars([{"content": system}]) >= settings.LLM_PROMPT_CACHE_MIN_CHARS:
+        system[-1]["cache_control"] = {"type": "ephemeral"}
+    if len(chat) > 1 and prefix_chars([{"content": system}] + chat[:-1]) >= settings.LLM_PROMPT_CACHE_MIN_CHARS:
+        chat[-2]["content"][-1]["cache_control"] = {"type": "ephemeral"}
+    return system, chat
+
+
+def completion_key(provider, model_name, messages, generation_config, safety_settings):
+    """Canonical hash of everything that determines a completion"""
+    canonical = {
+        "provider": provider,
+        "model": model_name,
+        "messages": [
+            [message["role"], "".join(part.get("text", "") for part in content_parts(message))]
+            for message in messages
+        ],
+        "generation_config": generation_config or DEFAULT_GENERATION_CONFIG,
+        "safety_settings": safety_settings,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys = True, ensure_ascii = False).encode()).hexdigest()
+
+
+def build_request(
     provider = "",
     model_name= "",
     messages = [],
     generation_config = {},
-    safety_settings = []
+    safety_settings = [],
+    stream = False
 ):
+    """Provider-specific (provider, url, headers, payload, parse_output) for one completion"""
     def openai_messages_to_gemini_contents(messages):
         contents = []
         for message in messages:
@@ -22,10 +117,7 @@ async def llm_answer(
         return contents
 
     if generation_config == {}:
-        generation_config = {
-            "temperature": 0.2,
-            "top_p": 0.2
-        }
+        generation_config = DEFAULT_GENERATION_CONFIG
 
     if provider == "gemini" and safety_settings == []:
         safety_settings = [
@@ -47,9 +139,8 @@ async def llm_answer(
             }
         ]
 
-    output_text, status_code = "", 500
     if provider in ("deepseek", "openai"):
-        API_URL = "https://api.deepseek.com/chat/completions" if provider == "deepseek" else "https://api.openai.com/v1/chat/completions"
+        API_URL = f"{settings.DEEPSEEK_API_URL}/chat/completions" if provider == "deepseek" else f"{settings.OPENAI_API_URL}/chat/completions"
         API_KEY = settings.DEEPSEEK_TOKEN if provider == "deepseek" else settings.OPENAI_TOKEN
         headers = {
             "Authorization": f"Bearer {API_KEY}",
@@ -61,23 +152,20 @@ async def llm_answer(
         }
         for key, value in generation_config.items():
             data[key] = value
-        try:
-            response = requests.post(API_URL, headers=headers, json=data)
-            status_code = response.status_code
-            response.raise_for_status()
-            
-            result = response.json()
-            output_text = result['choices'][0]['message']['content']
-            
-        except requests.exceptions.HTTPError as errh:
-            output_text = str(errh)
-        except requests.exceptions.RequestException as err:
-            output_text = str(err)
-        except Exception as e:
-            output_text = str(e)
+        if provider == "openai" and prefix_chars(messages[:-1]) >= settings.LLM_PROMPT_CACHE_MIN_CHARS:
+            # OpenAI tự cache prefix dài; cùng key giúp các request chung prefix vào cùng cache
+            prefix = json.dumps(messages[:-1], sort_keys = True, ensure_ascii = False)
+            data["prompt_cache_key"] = hashlib.sha256(prefix.encode()).hexdigest()[:32]
+        if stream:
+            data["stream"] = True
+            parse_output = lambda result: (result['choices'][0]['delta'].get('content') or '') if result.get('choices') else ''
+        else:
+            parse_output = lambda result: result['choices'][0]['message']['content']
     elif provider == "gemini":
-        API_URL = f"https://generativelanguage.googleapis.com/v1/models/{model_name}:generateContent?key={settings.GEMINI_TOKEN}"
+        # Key đi qua header để không lộ trong URL (và trong thông báo lỗi)
+        API_URL = f"{settings.GEMINI_API_URL}/models/{model_name}:{'streamGenerateContent?alt=sse' if stream else 'generateContent'}"
         headers = {
+            'x-goog-api-key': settings.GEMINI_TOKEN,
             'Content-Type': 'application/json'
         }
         data = {
@@ -85,46 +173,192 @@ async def llm_answer(
             'generationConfig': generation_config,
             'safetySettings': safety_settings,
         }
-        try:
-            response = requests.post(API_URL, headers=headers, json=data)
-            status_code = response.status_code
-            response.raise_for_status()
-            
-            result = response.json()
-            output_text = result["candidates"][0]["content"]["parts"][0]["text"]
-            
-        except requests.exceptions.HTTPError as errh:
-            output_text = str(errh)
-        except requests.exceptions.RequestException as err:
-            output_text = str(err)
-        except Exception as e:
-            output_text = str(e)
+        parse_output = lambda result: "".join(
+            part.get("text", "") for part in result["candidates"][0]["content"]["parts"]
+        ) if stream else result["candidates"][0]["content"]["parts"][0]["text"]
     else: # Claude
-        
-        API_URL = "https://api.anthropic.com/v1/messages"
+        provider = "claude"
+        API_URL = f"{settings.CLAUDE_API_URL}/messages"
         headers = {
             "x-api-key": settings.CLAUDE_TOKEN,
             "anthropic-version": "2023-06-01",
             "Content-Type": "application/json"
         }
+        system, chat = claude_messages(messages)
         data = {
             "model": model_name,
             "max_tokens": 8192,
-            "messages": messages
+            "messages": chat
         }
+        if system:
+            data["system"] = system
+        if stream:
+            data["stream"] = True
+            parse_output = lambda result: result['delta'].get('text', '') if result.get('type') == 'content_block_delta' else ''
+        else:
+            parse_output = lambda result: result['content'][0]['text']
+
+    return provider, API_URL, headers, data, parse_output
+
+
+def is_deterministic(generation_config):
+    return generation_config.get("temperature") == 0
+
+
+async def llm_answer(
+    provider = "",
+    model_name= "",
+    messages = [],
+    generation_config = {},
+    safety_settings = [],
+    use_cache = True,
+    refresh_cache = False
+):
+    """One completion as ``(output_text, status_code)``.
+
+    With LLM_CACHE_ENABLED, successful completions are cached by
+    ``completion_key``; ``use_cache=False`` skips the cache entirely and
+    ``refresh_cache=True`` skips the lookup but stores the new answer.
+    """
+    provider, API_URL, headers, data, parse_output = build_request(
+        provider = provider,
+        model_name = model_name,
+        messages = messages,
+        generation_config = generation_config,
+        safety_settings = safety_settings
+    )
+
+    cache_key = None
+    if settings.LLM_CACHE_ENABLED and use_cache:
+        cache_key = completion_key(provider, model_name, messages, generation_config, safety_settings)
+        if not refresh_cache:
+            cached = completion_cache.get(cache_key)
+            if cached is not None:
+                return cached, 200
+
+    async def post():
+        output_text, status_code = "", 500
+        started = time.perf_counter()
         try:
-            response = requests.post(API_URL, headers=headers, json=data)
-            status_code = response.status_code
-            response.raise_for_status()
-            
-            result = response.json()
-            output_text = result['content'][0]['text']
-            
-        except requests.exceptions.HTTPError as errh:
+            async with get_limiter(provider, settings.LLM_MAX_CONCURRENCY):
+                session = get_session(provider, limit = settings.LLM_MAX_CONNECTIONS)
+                with upstream_call("llm", f"{provider}:{model_name}") as call:
+                    async with session.post(API_URL, headers=headers, json=data, timeout=llm_timeout()) as response:
+                        call.status = status_code = response.status
+                        response.raise_for_status()
+                        result = await response.json(content_type=None)
+
+            output_text = parse_output(result)
+            if cache_key is not None:
+                completion_cache.put(cache_key, output_text, time.perf_counter() - started)
+
+        except aiohttp.ClientResponseError as errh:
             output_text = str(errh)
-        except requests.exceptions.RequestException as err:
-            output_text = str(err)
+            note_retry_after(provider, errh.headers)
+        except asyncio.TimeoutError as err:
+            output_text, status_code = str(err) or type(err).__name__, 504
+        except aiohttp.ClientError as err:
+            output_text, status_code = str(err) or type(err).__name__, 502
         except Exception as e:
-            output_text = str(e)
+            # Upstream trả 2xx nhưng nội dung không đọc được: không coi lỗi là câu trả lời
+            output_text, status_code = str(e), 502 if status_code < 400 else status_code
+
+        return output_text, status_code
+
+    if not is_deterministic(generation_config):
+        return await post()
+
+    # Prompt giống hệt nhau với temperature 0: các request đồng thời dùng chung một lần gọi
+    key = hashlib.sha256(json.dumps([API_URL, data], sort_keys = True).encode()).hexdigest()
+    return await llm_flights.do(key, post)
+
+
+async def iter_sse(response):
+    """Yield the ``data`` payload of each Server-Sent Event in an upstream response"""
+    data_lines = []
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+async def llm_stream(
+    provider = "",
+    model_name= "",
+    messages = [],
+    generation_config = {},
+    safety_settings = [],
+    use_cache = True,
+    refresh_cache = False
+):
+    """Stream a completion as normalized events.
+
+    Every provider yields the same shapes: ``{"type": "delta", "text": ...}``
+    for each token chunk, then either ``{"type": "done", "status_code": ...}``
+    or ``{"type": "error", "status_code": ..., "message": ...}``. The upstream
+    body is read only as fast as the consumer pulls events, and closing the
+    generator (e.g. on client disconnect) closes the upstream connection.
+    A cached completion is replayed as a single delta.
+    """
+    provider, API_URL, headers, data, parse_output = build_request(
+        provider = provider,
+        model_name = model_name,
+        messages = messages,
+        generation_config = generation_config,
+        safety_settings = safety_settings,
+        stream = True
+    )
+
+    cache_key = None
+    if settings.LLM_CACHE_ENABLED and use_cache:
+        cache_key = completion_key(provider, model_name, messages, generation_config, safety_settings)
+        cached = None if refresh_cache else completion_cache.get(cache_key)
+        if cached is not None:
+            yield {"type": "delta", "text": cached}
+            yield {"type": "done", "status_code": 200}
+            return
+
+    status_code, chunks = 500, []
+    started = time.perf_counter()
+    try:
+        async with get_limiter(provider, settings.LLM_MAX_CONCURRENCY):
+            session = get_session(provider, limit = settings.LLM_MAX_CONNECTIONS)
+            with upstream_call("llm", f"{provider}:{model_name}") as call:
+                async with session.post(API_URL, headers=headers, json=data, timeout=llm_stream_timeout()) as response:
+                    call.status = status_code = response.status
+                    response.raise_for_status()
+
+                    async for payload in iter_sse(response):
+                        if payload == "[DONE]":
+                            break
+                        result = json.loads(payload)
+                        if result.get("type") == "error":
+                            raise ValueError(result["error"].get("message", payload))
+                        text = parse_output(result)
+                        if text:
+                            chunks.append(text)
+                            yield {"type": "delta", "text": text}
+
+        if cache_key is not None:
+            completion_cache.put(cache_key, "".join(chunks), time.perf_counter() - started)
+        yield {"type": "done", "status_code": status_code}
+
+    except aiohttp.ClientResponseError as errh:
+        yield {"type": "error", "status_code": status_code, "message": str(errh)}
+    except asyncio.TimeoutError as err:
+        yield {"type": "error", "status_code": 504, "message": str(err) or type(err).__name__}
+    except aiohttp.ClientError as err:
+        yield {"type": "error", "status_code": 502, "message": str(err) or type(err).__name__}
+    except Exception as e:
+        yield {"type": "error", "status_code": 502 if status_code < 400 else status_code, "message": str(e)}
+
 
-    return output_text, status_code
\ No newline at end of file
+async def sse_encode(events):
+    async for event in events:
+        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
@@ -0,0 +1,179 @@
+import bisect
+import re
+import time
+import uuid
+from contextvars import ContextVar
+
+
+# Bucket mặc định (giây) cho histogram độ trễ
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels = (), buckets = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Metrics in the Prometheus text format.
+
+    Besides counters and histograms updated on the hot path, collectors are
+    called at scrape time to turn the existing ``stats()`` of caches,
+    scheduler and router into samples, so those stay free to update.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register ``fn() -> [(name, type, help, {labels}, value)]`` read at scrape time.
+
+        ``type`` is ``counter`` for running totals (named ``*_total``) and
+        ``gauge`` for values that can go down.
+        """
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        collected = {}
+        for collect in self.collectors:
+            for name, kind, help, labels, value in collect():
+                collected.setdefault(name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, samples) in collected.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Latency of API requests", ("method", "route", "status")
+)
+request_upstream_calls = registry.histogram(
+    "http_request_upstream_calls", "Upstream calls triggered by one API request", ("route",), COUNT_BUCKETS
+)
+upstream_duration = registry.histogram(
+    "upstream_request_duration_seconds", "Latency of calls to GitHub and LLM providers", ("upstream", "operation", "status")
+)
+
+
+class RequestSpan:
+    """Upstream calls made on behalf of one API request"""
+
+    def __init__(self, request_id = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.calls = []   # (upstream, operation, status, seconds)
+
+    def summary(self):
+        by_upstream = {}
+        for upstream, _, _, seconds in self.calls:
+            count, total = by_upstream.get(upstream, (0, 0.0))
+            by_upstream[upstream] = (count + 1, total + seconds)
+        return {
+            upstream: {"calls": count, "seconds": round(total, 4)}
+            for upstream, (count, total) in by_upstream.items()
+        }
+
+
+current_span = ContextVar("current_span", default = None)
+
+
+class upstream_call:
+    """Time one upstream call: ``with upstream_call("github", op) as call: ... call.status = ...``"""
+
+    def __init__(self, upstream, operation):
+        self.upstream = upstream
+        self.operation = operation
+        self.status = "error"
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        upstream_duration.observe(seconds, upstream = self.upstream, operation = self.operation, status = self.status)
+        span = current_span.get()
+        if span is not None:
+            span.calls.append((self.upstream, self.operation, self.status, seconds))
+        return False
+
+
+# Gộp đường dẫn GitHub về dạng mẫu để label không bùng nổ theo repo / SHA / file
+GITHUB_PATH_PATTERNS = (
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{repo}"),
+    (re.compile(r"/(commits|trees|blobs|branches|compare|contents|tarball|zipball)/.+$"), r"/\1/{ref}"),
+)
+
+
+def github_operation(path):
+    for pattern, template in GITHUB_PATH_PATTERNS:
+        path = pattern.sub(template, path)
+    return path
@@ -0,0 +1,377 @@
+import asyncio
+import base64
+import logging
+import os
+import shutil
+import tempfile
+import re
+import time
+from collections import OrderedDict
+
+from configs.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Trạng thái file của git (diff --raw) -> trạng thái của GitHub REST
+FILE_STATUS = {"A": "added", "D": "removed", "M": "modified", "R": "renamed", "C": "copied", "T": "changed"}
+
+# Các trường của một commit trong `git log`, phân cách bởi NUL, mỗi commit kết thúc bằng RS
+LOG_FORMAT = "%H%x00%P%x00%an%x00%ae%x00%aI%x00%cn%x00%ce%x00%cI%x00%B%x1e"
+# Chỉ mirror branch và tag: refs/pull/* của GitHub có thể lớn hơn cả repo
+FETCH_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+# Số tree (theo commit) giữ trong bộ nhớ cho mỗi mirror
+TREE_CACHE_SIZE = 16
+# Khoảng cách tối thiểu (giây) giữa hai lần fetch vì một commit chưa có trong mirror
+MISS_REFRESH_INTERVAL = 10
+
+
+class GitError(Exception):
+    pass
+
+
+def check_rev(rev):
+    """``rev`` unchanged; a rev that git would read as an option is rejected"""
+    if not rev or rev.startswith("-"):
+        raise GitError(f"Invalid revision {rev!r}")
+    return rev
+
+
+async def run_git(git_dir, *args, env = None):
+    prefix = ("git", f"--git-dir={git_dir}") if git_dir else ("git",)
+    process = await asyncio.create_subprocess_exec(
+        *prefix, *args,
+        stdin = asyncio.subprocess.DEVNULL,
+        stdout = asyncio.subprocess.PIPE,
+        stderr = asyncio.subprocess.PIPE,
+        env = env
+    )
+    out, err = await process.communicate()
+    if process.returncode != 0:
+        raise GitError(err.decode("utf-8", "replace").strip() or f"git {args[0]} failed")
+    return out
+
+
+def _parse_log(out):
+    commits = []
+    for record in out.decode("utf-8", "replace").split("\x1e"):
+        record = record.lstrip("\n")
+        if not record:
+            continue
+        sha, parents, an, ae, ad, cn, ce, cd, message = record.split("\x00", 8)
+        commits.append({
+            "sha": sha,
+            "parents": [{"sha": parent} for parent in parents.split()],
+            "commit": {
+                "message": message.rstrip("\n"),
+                "author": {"name": an, "email": ae, "date": ad},
+                "committer": {"name": cn, "email": ce, "date": cd}
+            }
+        })
+    return commits
+
+
+def _parse_raw(out):
+    """``diff --raw -z`` -> [(status, old_sha, new_sha, path, previous_path)]"""
+    tokens = out.decode("utf-8", "replace").split("\x00")
+    entries, i = [], 0
+    while i < len(tokens) and tokens[i].startswith(":"):
+        _, _, old_sha, new_sha, status = tokens[i][1:].split(" ")
+        if status[0] in "RC":
+            entries.append((status[0], old_sha, new_sha, tokens[i + 2], tokens[i + 1]))
+            i += 3
+        else:
+            entries.append((status[0], old_sha, new_sha, tokens[i + 1], None))
+            i += 2
+    return entries
+
+
+def _parse_numstat(out):
+    """``diff --numstat -z`` -> [(additions, deletions)]; binary files count as 0"""
+    tokens = out.decode("utf-8", "replace").split("\x00")
+    stats, i = [], 0
+    while i < len(tokens) and tokens[i]:
+        additions, deletions, path = tokens[i].split("\t", 2)
+        stats.append((int(additions) if additions != "-" else 0, int(deletions) if deletions != "-" else 0))
+        i += 1 if path else 3
+    return stats
+
+
+def _split_patches(out):
+    """Per-file hunks of a ``diff -p`` output (None for binary / mode-only changes), in diff order"""
+    patches = []
+    for chunk in out.decode("utf-8", "replace").split("\ndiff --git ")[0 if out else 1:]:
+        start = chunk.find("\n@@")
+        patches.append(chunk[start + 1:].rstrip("\n") if start != -1 else None)
+    return patches
+
+
+class RepoMirror:
+    """One bare mirror on disk, read through ``git`` plumbing commands.
+
+    Results use the same shapes as the GitHub REST payloads they replace,
+    so ``GitHubRepo`` consumes them unchanged. Blob reads go through a
+    long-lived ``git cat-file --batch`` process; refs are loaded once per
+    fetch and trees are kept per commit, so repeated lookups of a branch
+    head do not spawn any process.
+    """
+
+    def __init__(self, full_name, git_dir):
+        self.full_name = full_name
+        self.git_dir = git_dir
+        self.fetched_at = 0.0
+        self.lock = asyncio.Lock()
+        self.refs = {}                 # refname -> commit SHA
+        self._commits = set()          # SHA đầy đủ đã xác nhận có trong mirror
+        self._trees = OrderedDict()    # commit SHA -> {path: (blob_sha, size)}
+        self._cat_file = None
+        self._cat_lock = asyncio.Lock()
+
+    def git(self, *args):
+        return run_git(self.git_dir, *args)
+
+    async def load_refs(self):
+        out = await self.git("for-each-ref", "--format=%(objectname) %(*objectname) %(refname)", "refs/heads", "refs/tags")
+        refs = {}
+        for line in out.decode("utf-8").splitlines():
+            # Tag annotated: lấy commit mà tag trỏ tới
+            parts = line.split(" ")
+            refs[parts[-1]] = parts[1] or parts[0]
+        self.refs = refs
+
+    async def branches(self):
+        return [ref[len("refs/heads/"):] for ref in self.refs if ref.startswith("refs/heads/")]
+
+    async def resolve(self, rev):
+        """Commit SHA of ``rev``, or None if it does not exist in the mirror"""
+        if not rev or rev.startswith("-"):
+            return None
+        for ref in (rev, f"refs/heads/{rev}", f"refs/tags/{rev}"):
+            if ref in self.refs:
+                return self.refs[ref]
+        if rev in self._commits:
+            return rev
+
+        try:
+            out = await self.git("rev-parse", "--verify", "--quiet", "--end-of-options", f"{rev}^{{commit}}")
+        except GitError:
+            return None
+        sha = out.decode().strip()
+        if re.fullmatch(r"[0-9a-f]{40}", rev):
+            self._commits.add(sha)
+        return sha
+
+    async def tree(self, commit_sha):
+        """``{path: (blob_sha, size)}`` of every blob in the commit's tree"""
+        blobs = self._trees.get(commit_sha)
+        if blobs is not None:
+            self._trees.move_to_end(commit_sha)
+            return blobs
+
+        out = await self.git("ls-tree", "-r", "-l", "-z", "--full-tree", "--end-of-options", check_rev(commit_sha))
+        blobs = {}
+        for entry in out.decode("utf-8", "replace").split("\x00"):
+            if not entry:
+                continue
+            meta, path = entry.split("\t", 1)
+            _, kind, sha, size = meta.split()
+            if kind == "blob":
+                blobs[path] = (sha, int(size))
+
+        self._trees[commit_sha] = blobs
+        while len(self._trees) > TREE_CACHE_SIZE:
+            self._trees.popitem(last = False)
+        return blobs
+
+    async def read_blob(self, sha):
+        async with self._cat_lock:
+            if self._cat_file is None or self._cat_file.returncode is not None:
+                self._cat_file = await asyncio.create_subprocess_exec(
+                    "git", f"--git-dir={self.git_dir}", "cat-file", "--batch",
+                    stdin = asyncio.subprocess.PIPE,
+                    stdout = asyncio.subprocess.PIPE,
+                    stderr = asyncio.subprocess.DEVNULL
+                )
+            try:
+                self._cat_file.stdin.write(f"{sha}\n".encode())
+                await self._cat_file.stdin.drain()
+                header = (await self._cat_file.stdout.readline()).decode().split()
+                if len(header) == 3:
+                    data = await self._cat_file.stdout.readexactly(int(header[2]) + 1)
+                    return data[:-1]
+            except BaseException:
+                # Đọc dở (bị huỷ / lỗi): phần còn lại của blob vẫn nằm trong pipe, process không dùng lại được
+                await self._kill_cat_file()
+                raise
+            raise GitError(f"Blob {sha} not found in mirror of {self.full_name}")
+
+    async def _kill_cat_file(self):
+        process, self._cat_file = self._cat_file, None
+        if process is not None and process.returncode is None:
+            # Không chờ git tự thoát: nó có thể đang bị chặn khi ghi phần blob chưa ai đọc.
+            # communicate() đọc bỏ phần còn lại tới EOF, wait() một mình sẽ treo khi pipe đang bị tạm dừng đọc
+            process.kill()
+            await process.communicate()
+
+    async def close_cat_file(self):
+        # Sau mỗi lần fetch, process cat-file cũ có thể chưa thấy pack mới
+        async with self._cat_lock:
+            await self._kill_cat_file()
+
+    async def list_commits(self, params, page, per_page):
+        """One page of ``GET /repos/{full_name}/commits``"""
+        args = ["log", f"--format={LOG_FORMAT}", f"--skip={(page - 1) * per_page}", f"-n{per_page}"]
+        if params.get("since"): args.append(f"--since={params['since']}")
+        if params.get("until"): args.append(f"--until={params['until']}")
+        # Rev luôn đứng sau --end-of-options: branch do client gửi không được thành option của git
+        args += ["--end-of-options", check_rev(params["sha"])]
+        if params.get("path"):
+            args += ["--", params["path"].rstrip('/')]
+        return _parse_log(await self.git(*args))
+
+    async def _diff_files(self, *revs, root = False):
+        revs = ("--root",) * root + ("--end-of-options",) + tuple(check_rev(rev) for rev in revs)
+        raw, numstat, patch = await asyncio.gather(
+            self.git("diff-tree", "-r", "-M", "-z", "--raw", "--no-commit-id", *revs),
+            self.git("diff-tree", "-r", "-M", "-z", "--numstat", "--no-commit-id", *revs),
+            self.git("diff-tree", "-r", "-M", "-p", "--no-color", "--no-ext-diff", "--no-commit-id", *revs)
+        )
+        files = []
+        for (status, old_sha, new_sha, path, previous), (additions, deletions), hunks in zip(
+            _parse_raw(raw), _parse_numstat(numstat), _split_patches(patch)
+        ):
+            file = {
+                "sha": old_sha if status == "D" else new_sha,
+                "filename": path,
+                "status": FILE_STATUS.get(status, "modified"),
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions
+            }
+            if hunks is not None:
+                file["patch"] = hunks
+            if previous is not None:
+                file["previous_filename"] = previous
+            files.append(file)
+        return files
+
+    async def commit(self, ref):
+        """``GET /repos/{full_name}/commits/{ref}``, or None if unknown"""
+        sha = await self.resolve(ref)
+        if sha is None:
+            return None
+        commit = _parse_log(await self.git("log", "-1", f"--format={LOG_FORMAT}", "--end-of-options", sha))[0]
+        parents = [parent["sha"] for parent in commit["parents"]]
+        # So với parent đầu tiên như GitHub; commit gốc so với tree rỗng
+        files = await self._diff_files(parents[0], sha) if parents else await self._diff_files(sha, root = True)
+        return {**commit, "files": files}
+
+    async def compare(self, base, head):
+        """``GET /repos/{full_name}/compare/{base}...{head}`` without the 300-file limit"""
+        out = await self.git(
+            "log", "--reverse", f"--format={LOG_FORMAT}", "--end-of-options", f"{check_rev(base)}..{check_rev(head)}"
+        )
+        commits = _parse_log(out)
+        return {
+            "total_commits": len(commits),
+            "commits": commits,
+            "files": await self._diff_files(base, head)
+        }
+
+
+class MirrorStore:
+    """Bare mirrors of GitHub repositories under one cache directory.
+
+    A repository's branches and tags are fetched into a bare repository on
+    first access and refreshed with an incremental ``git fetch`` at most every
+    ``refresh_interval`` seconds, or when a requested commit is missing.
+    Git objects are immutable and access is still checked through the API
+    (``GitHubRepo.get_repo``) by the caller, so mirrors are shared by all
+    tokens; the requesting token is only used to authenticate the fetch.
+    """
+
+    def __init__(self, root, refresh_interval, remote_url):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.remote_url = remote_url
+        self._mirrors = {}
+
+    def _env(self, access_token):
+        # Token đi qua biến môi trường, không lộ trong argv hay trong config của mirror
+        credentials = base64.b64encode(f"x-access-token:{access_token}".encode()).decode()
+        return {
+            **os.environ,
+            "GIT_TERMINAL_PROMPT": "0",
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}"
+        }
+
+    async def get(self, gh, full_name, refresh = False):
+        """Mirror of ``full_name``, cloned or fetched first if it is missing or stale"""
+        mirror = self._mirrors.get(full_name)
+        if mirror is None:
+            git_dir = os.path.join(self.root, f"{full_name.replace('/', '__')}.git")
+            mirror = self._mirrors.setdefault(full_name, RepoMirror(full_name, git_dir))
+
+        if not refresh and time.monotonic() - mirror.fetched_at < self.refresh_interval:
+            return mirror
+
+        async with mirror.lock:
+            if refresh or time.monotonic() - mirror.fetched_at >= self.refresh_interval:
+                await self._sync(gh, mirror)
+        return mirror
+
+    async def _sync(self, gh, mirror):
+        env = self._env(gh.access_token)
+        if os.path.isdir(mirror.git_dir):
+            logger.debug(f"Fetching mirror of {mirror.full_name}")
+            await run_git(mirror.git_dir, "fetch", "--prune", "--quiet", "origin", env = env)
+            await mirror.close_cat_file()
+        else:
+            logger.info(f"Cloning mirror of {mirror.full_name}")
+            os.makedirs(self.root, exist_ok = True)
+            tmp_dir = tempfile.mkdtemp(dir = self.root)
+            try:
+                await run_git(None, "init", "--bare", "--quiet", tmp_dir)
+                await run_git(tmp_dir, "remote", "add", "origin", self.remote_url.format(full_name = mirror.full_name))
+                await run_git(tmp_dir, "config", "--unset-all", "remote.origin.fetch")
+                for refspec in FETCH_REFSPECS:
+                    await run_git(tmp_dir, "config", "--add", "remote.origin.fetch", refspec)
+                await run_git(tmp_dir, "fetch", "--quiet", "origin", env = env)
+                os.replace(tmp_dir, mirror.git_dir)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors = True)
+                raise
+        await mirror.load_refs()
+        mirror.fetched_at = time.monotonic()
+
+    def expire(self, full_name):
+        """Fetch ``full_name`` again on its next access (e.g. after a push webhook)"""
+        mirror = self._mirrors.get(full_name)
+        if mirror is not None:
+            mirror.fetched_at = 0.0
+
+    async def close(self):
+        for mirror in self._mirrors.values():
+            await mirror.close_cat_file()
+
+    async def resolve(self, gh, full_name, rev):
+        """Resolve ``rev`` in the mirror, fetching once more if it is a full SHA that is not there yet.
+
+        Only full SHAs trigger that fetch, at most once per ``MISS_REFRESH_INTERVAL``
+        per mirror, so made-up revisions cannot turn into a stream of fetches.
+        """
+        mirror = await self.get(gh, full_name)
+        sha = await mirror.resolve(rev)
+        if sha is None and re.fullmatch(r"[0-9a-f]{40}", rev or "") and time.monotonic() - mirror.fetched_at >= MISS_REFRESH_INTERVAL:
+            mirror = await self.get(gh, full_name, refresh = True)
+            sha = await mirror.resolve(rev)
+        return mirror, sha
+
+
+mirror_store = MirrorStore(
+    root = settings.MIRROR_DIR or os.path.join(tempfile.gettempdir(), "repo-mirrors"),
+    refresh_interval = settings.MIRROR_REFRESH_INTERVAL,
+    remote_url = settings.MIRROR_REMOTE_URL
+)
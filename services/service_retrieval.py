@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import logging
+import math
+import re
+import time
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+
+from configs.config import settings
+from .service_scheduler import GitHubRateLimited
+from .service_singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+# Ước lượng số token từ số ký tự (không cần tokenizer của từng provider)
+CHARS_PER_TOKEN = 4
+
+
+def tokenize(text):
+    """Lowercased identifiers plus their camelCase / snake_case parts (``getUserName`` -> getusername, get, user, name)"""
+    tokens = []
+    for word in IDENTIFIER.findall(text):
+        parts = SUBWORD.findall(word)
+        if len(word) > 1:
+            tokens.append(word.lower())
+        if len(parts) > 1:
+            tokens += [part.lower() for part in parts if len(part) > 1]
+    return tokens
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_chunks(path, text, chunk_lines):
+    """``(start_line, end_line, term counts)`` of consecutive ``chunk_lines``-line windows; path terms count in every chunk"""
+    lines = text.splitlines()
+    path_terms = tokenize(path)
+    return [
+        (start + 1, min(start + chunk_lines, len(lines)), Counter(tokenize("\n".join(lines[start:start + chunk_lines])) + path_terms))
+        for start in range(0, len(lines), chunk_lines)
+    ]
+
+
+class BM25Index:
+    """Okapi BM25 over line-window chunks of the text files of one commit.
+
+    Posting lists are parallel ``array`` objects (chunk ids, term
+    frequencies); chunk text is not duplicated, only ``(file id, lines)``
+    pointing into the zlib-compressed file contents.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.paths = []                   # file id -> path
+        self.contents = []                # file id -> zlib bytes
+        self.chunk_file = array("I")      # chunk id -> file id
+        self.chunk_lines = array("I")     # chunk id -> start_line, end_line (2 ô mỗi chunk)
+        self.lengths = array("I")         # chunk id -> số term
+        self.postings = {}                # term -> (array chunk ids, array tf)
+        self.total_length = 0
+        self.nbytes = 0
+
+    def add(self, path, compressed, chunks):
+        file_id = len(self.paths)
+        self.paths.append(path)
+        self.contents.append(compressed)
+        self.nbytes += len(compressed)
+        for start, end, counts in chunks:
+            chunk_id = len(self.lengths)
+            self.chunk_file.append(file_id)
+            self.chunk_lines.extend((start, end))
+            length = sum(counts.values())
+            self.lengths.append(length)
+            self.total_length += length
+            for term, tf in counts.items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("I"), array("H"))
+                entry[0].append(chunk_id)
+                entry[1].append(min(tf, 65535))
+            self.nbytes += 6 * len(counts) + 12
+
+    def top(self, query, k):
+        """``(score, chunk id)`` of the ``k`` best chunks for ``query``"""
+        count = len(self.lengths)
+        if not count:
+            return []
+        average = self.total_length / count
+        scores = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            ids, tfs = entry
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            for chunk_id, tf in zip(ids, tfs):
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[chunk_id] / average)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, ((score, chunk_id) for chunk_id, score in scores.items()))
+
+    def chunk_range(self, chunk_id):
+        """``(file id, start_line, end_line)`` of a chunk"""
+        return self.chunk_file[chunk_id], self.chunk_lines[2 * chunk_id], self.chunk_lines[2 * chunk_id + 1]
+
+    def text(self, file_id, start, end):
+        lines = zlib.decompress(self.contents[file_id]).decode("utf-8").splitlines()
+        return "\n".join(lines[start - 1:end])
+
+    def stats(self):
+        return {"files": len(self.paths), "chunks": len(self.lengths), "terms": len(self.postings), "bytes": self.nbytes}
+
+
+class RetrievalIndexes:
+    """BM25 indexes cached by ``(repository, commit SHA)`` (LRU, ``max_indexes`` entries)"""
+
+    def __init__(self, max_indexes):
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.builds = 0
+
+    async def _build(self, gh, repo, tree):
+        started = time.perf_counter()
+        files = sorted(
+            (path, sha) for path, (sha, size) in tree.blobs.items() if size <= settings.GITHUB_MAX_FILE_SIZE
+        )[:settings.RAG_MAX_FILES]
+        owner, name = repo.full_name.split("/")
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+        index = BM25Index()
+
+        def analyze(path, data):
+            if b"\0" in data[:8192]:
+                return None
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError:
+                return None
+            return zlib.compress(data), split_chunks(path, text, settings.RAG_CHUNK_LINES)
+
+        async def fetch(path, sha):
+            nonlocal failed
+            try:
+                async with semaphore:
+                    data = await gh.get_blob(owner, name, sha)
+            except GitHubRateLimited:
+                raise
+            except Exception as e:
+                logger.warning(f"Error getting {path} for retrieval index: {str(e)}")
+                failed += 1
+                return
+            # Tách chunk và đếm term trong thread để không chặn event loop
+            analyzed = await asyncio.to_thread(analyze, path, data)
+            if analyzed is not None:
+                index.add(path, *analyzed)
+
+        failed = 0
+        tasks = [asyncio.ensure_future(fetch(path, sha)) for path, sha in files]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.builds += 1
+        logger.info(
+            f"Built retrieval index for {repo.full_name}@{tree.commit_sha}",
+            extra = dict(index.stats(), failed = failed, seconds = round(time.perf_counter() - started, 3))
+        )
+        return index, failed == 0
+
+    async def get(self, gh, repo, tree):
+        key = (repo.full_name, tree.commit_sha)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            self.hits += 1
+            return index
+
+        index, complete = await self._flights.do(key, lambda: self._build(gh, repo, tree))
+        if not complete:
+            # Thiếu file do lỗi tải: dùng cho request này nhưng không cache
+            return index
+        self._indexes[key] = index
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last = False)
+        return index
+
+    async def retrieve(self, gh, repo_name, query, branch = None, top_k = None, max_tokens = None):
+        """Best chunks for ``query`` packed under ``max_tokens``, as ``{"repo", "commit", "context", "sources", ...}`` (None if not found).
+
+        Adjacent chunks of a file are merged; chunks are added best-first
+        and skipped once they no longer fit the budget.
+        """
+        repo = await gh.get_repo(repo_name)
+        if repo is None:
+            return None
+        branch = branch or repo.default_branch
+        tree = await gh.get_tree_index(repo, branch)
+        if tree is None:
+            return None
+        index = await self.get(gh, repo, tree)
+
+        top_k = top_k or settings.RAG_TOP_K
+        max_tokens = max_tokens or settings.RAG_CONTEXT_TOKENS
+        hits = index.top(query, top_k)
+
+        ranges = {}
+        for score, chunk_id in hits:
+            file_id, start, end = index.chunk_range(chunk_id)
+            ranges.setdefault(file_id, []).append([start, end, score])
+        merged = []
+        for file_id, spans in ranges.items():
+            spans.sort()
+            current = spans[0]
+            for span in spans[1:]:
+                if span[0] <= current[1] + 1:
+                    current = [current[0], max(current[1], span[1]), max(current[2], span[2])]
+                else:
+                    merged.append((current[2], file_id, current[0], current[1]))
+                    current = span
+            merged.append((current[2], file_id, current[0], current[1]))
+
+        header = f"Relevant code from {repo.full_name} (branch {branch}, commit {tree.commit_sha[:7]}):"
+        blocks, sources, tokens = [header], [], estimate_tokens(header)
+        for score, file_id, start, end in sorted(merged, reverse = True):
+            path = index.paths[file_id]
+            block = f"### {path} (lines {start}-{end})\n```\n{index.text(file_id, start, end)}\n```"
+            cost = estimate_tokens(block)
+            if tokens + cost > max_tokens:
+                continue
+            blocks.append(block)
+            tokens += cost
+            sources.append({"path": path, "start_line": start, "end_line": end, "score": round(score, 3)})
+
+        return {
+            "repo": repo.full_name,
+            "branch": branch,
+            "commit": tree.commit_sha,
+            "context": "\n\n".join(blocks) if sources else None,
+            "context_tokens": tokens if sources else 0,
+            "sources": sources,
+        }
+
+    def stats(self):
+        return {
+            "indexes": len(self._indexes),
+            "bytes": sum(index.nbytes for index in self._indexes.values()),
+            "hits": self.hits,
+            "builds": self.builds,
+        }
+
+
+retrieval_indexes = RetrievalIndexes(max_indexes = settings.RAG_INDEX_CACHE_SIZE)
@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from configs.config import settings
+
+
+# Độ ưu tiên của request GitHub: số nhỏ hơn được phục vụ trước
+INTERACTIVE = 0
+BULK = 1
+
+# Secondary rate limit không có Retry-After: chờ tăng dần, tối đa 60s như GitHub khuyến nghị
+BACKOFF_START = 1.0
+BACKOFF_MAX = 60.0
+
+
+class GitHubRateLimited(Exception):
+    """A token is out of GitHub quota for longer than we are willing to wait"""
+
+    def __init__(self, retry_after, message = "GitHub rate limit exceeded"):
+        super().__init__(message)
+        self.retry_after = max(0, int(retry_after + 0.999))
+
+
+class _PriorityLimiter:
+    """Semaphore whose waiters are woken by priority, then in arrival order"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Slot đã được trao nhưng task bị huỷ trước khi dùng: trả lại cho người sau
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)   # chuyển slot thẳng cho waiter, active giữ nguyên
+                return
+        self.active -= 1
+
+
+class TokenBudget:
+    """Last known quota of one (token, API resource) pair"""
+
+    def __init__(self, max_in_flight):
+        self.limiter = _PriorityLimiter(max_in_flight)
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+
+    def delay(self, priority, bulk_reserve):
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.remaining is not None and self.reset_at > now:
+            # Phần quota cuối cùng được giữ lại cho request tương tác
+            floor = 0 if priority == INTERACTIVE else bulk_reserve
+            if self.remaining <= floor:
+                return self.reset_at - now
+        return 0.0
+
+
+class GitHubScheduler:
+    """Central gate for outbound GitHub calls.
+
+    Per token (and API resource) it tracks ``X-RateLimit-Remaining`` /
+    ``X-RateLimit-Reset``, caps in-flight requests, serves interactive calls
+    before bulk ones (history walks), keeps a quota reserve that bulk calls
+    may not touch, and backs off on 403/429 rate-limit responses. Waits
+    longer than ``max_wait`` surface as ``GitHubRateLimited`` (HTTP 429).
+    """
+
+    def __init__(self, max_in_flight, bulk_reserve, max_wait, retries, max_tokens = 4096):
+        self.max_in_flight = max_in_flight
+        self.bulk_reserve = bulk_reserve
+        self.max_wait = max_wait
+        self.retries = retries
+        self.max_tokens = max_tokens
+        self._budgets = OrderedDict()
+
+        self.throttled = 0
+        self.rejected = 0
+
+    def budget(self, token_key, resource = "core"):
+        key = (token_key, resource)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = TokenBudget(self.max_in_flight)
+            # Bỏ budget của token cũ đang rảnh để bảng không lớn mãi
+            for old_key in list(self._budgets)[:max(0, len(self._budgets) - self.max_tokens)]:
+                if self._budgets[old_key].limiter.active == 0:
+                    del self._budgets[old_key]
+        self._budgets.move_to_end(key)
+        return budget
+
+    async def observe(self, token_key, response, resource = "core"):
+        """Record rate-limit headers; raise ``GitHubRateLimited`` if the response is a rate-limit rejection"""
+        budget = self.budget(token_key, resource)
+        headers = response.headers
+        if "X-RateLimit-Remaining" in headers:
+            budget.remaining = int(headers["X-RateLimit-Remaining"])
+            budget.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+
+        if response.status not in (403, 429):
+            budget.backoff = 0.0
+            return
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None:
+            delay = float(retry_after)
+        elif budget.remaining == 0 and budget.reset_at > time.time():
+            delay = budget.reset_at - time.time()
+        elif response.status == 429 or "rate limit" in (await response.text()).lower():
+            budget.backoff = min(BACKOFF_MAX, budget.backoff * 2 or BACKOFF_START)
+            delay = budget.backoff
+        else:
+            return   # 403 thật sự (không có quyền), để caller xử lý
+
+        self.throttled += 1
+        budget.blocked_until = max(budget.blocked_until, time.time() + delay)
+        raise GitHubRateLimited(delay)
+
+    async def _admit(self, budget, priority):
+        """Wait out the token's rate-limit delay (or raise if it is too long), then take an in-flight slot"""
+        delay = budget.delay(priority, self.bulk_reserve)
+        if delay > self.max_wait:
+            self.rejected += 1
+            raise GitHubRateLimited(delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        await budget.limiter.acquire(priority)
+        if budget.remaining:
+            budget.remaining -= 1
+
+    async def run(self, token_key, send, priority = INTERACTIVE, resource = "core"):
+        """Run ``send()`` (one GitHub request) within the token's budget, retrying short rate-limit waits"""
+        budget = self.budget(token_key, resource)
+        for attempt in range(self.retries + 1):
+            await self._admit(budget, priority)
+            try:
+                return await send()
+            except GitHubRateLimited as e:
+                if attempt == self.retries or e.retry_after > self.max_wait:
+                    self.rejected += 1
+                    raise
+            finally:
+                budget.limiter.release()
+
+    @asynccontextmanager
+    async def slot(self, token_key, priority = INTERACTIVE, resource = "core"):
+        """Hold one request of the token's budget around a streamed call.
+
+        Same delay / reserve / rejection rules as ``run``, but without
+        retries: a streamed body may already be partly consumed.
+        """
+        budget = self.budget(token_key, resource)
+        await self._admit(budget, priority)
+        try:
+            yield
+        finally:
+            budget.limiter.release()
+
+    def headroom(self):
+        """Lowest known remaining quota per API resource, over tokens whose window has not reset"""
+        now, lowest = time.time(), {}
+        for (_, resource), budget in self._budgets.items():
+            if budget.remaining is not None and budget.reset_at > now:
+                lowest[resource] = min(lowest.get(resource, budget.remaining), budget.remaining)
+        return lowest
+
+    def stats(self):
+        return {
+            "tokens": len(self._budgets),
+            "in_flight": sum(budget.limiter.active for budget in self._budgets.values()),
+            "queued": sum(len(budget.limiter._waiters) for budget in self._budgets.values()),
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+        }
+
+
+github_scheduler = GitHubScheduler(
+    max_in_flight = settings.GITHUB_TOKEN_MAX_IN_FLIGHT,
+    bulk_reserve = settings.GITHUB_BULK_RESERVE,
+    max_wait = settings.GITHUB_RATE_LIMIT_MAX_WAIT,
+    retries = settings.GITHUB_RATE_LIMIT_RETRIES
+)
@@ -0,0 +1,375 @@
+import asyncio
+import fnmatch
+import logging
+import re
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+from configs.config import settings
+from fastapi import HTTPException
+from .service_scheduler import GitHubRateLimited
+from .service_singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Overhead ước lượng của mỗi array / bytes object trong bộ nhớ, dùng để tính dung lượng index
+OBJECT_OVERHEAD = 64
+QUANTIFIER = re.compile(r"\{\d*(,\d*)?\}")
+# Phần đi sau các escape có tham số (hex, unicode, tên ký tự, octal / backreference)
+ESCAPE_ARGUMENT = {
+    "x": re.compile(r"[0-9a-fA-F]{0,2}"),
+    "u": re.compile(r"[0-9a-fA-F]{0,4}"),
+    "U": re.compile(r"[0-9a-fA-F]{0,8}"),
+    "N": re.compile(r"\{[^}]*\}"),
+    **{digit: re.compile(r"\d{0,2}") for digit in "0123456789"},
+}
+
+
+def trigrams(data: bytes):
+    """Distinct trigrams of ``data`` (ASCII-lowercased), each packed into a 24-bit int"""
+    data = data.lower()
+    return {int.from_bytes(gram, "big") for gram in {data[i:i + 3] for i in range(len(data) - 2)}}
+
+
+def required_literals(pattern):
+    """Literal runs that every match of the regex ``pattern`` must contain.
+
+    Only top-level characters that are not quantified count: groups, classes,
+    ``.`` and escapes like ``\\w`` or ``\\x20`` end the current run, and a
+    top-level ``|`` means nothing is required. The result
+    is a necessary condition only; matches are always verified with ``re``.
+    """
+    runs, run, depth, i = [], "", 0, 0
+    while i < len(pattern):
+        char, literal = pattern[i], None
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            i += 2
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            else:
+                # \x20, \u00e9, \N{...}, \1, \012: bỏ qua cả phần đi sau, không tính là literal
+                argument = ESCAPE_ARGUMENT.get(escaped)
+                match = argument.match(pattern, i) if argument is not None else None
+                i = match.end() if match else i
+        elif char == "[":
+            # Bỏ qua cả character class, kể cả "]" đứng đầu và ký tự escape bên trong
+            i += 2 if pattern[i + 1:i + 2] == "^" else 1
+            i += 1 if pattern[i:i + 1] == "]" else 0
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        else:
+            i += 1
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max(depth - 1, 0)
+            elif char == "|" and depth == 0:
+                return []
+            elif char in "*?" or char == "{" and QUANTIFIER.match(pattern, i - 1):
+                # Ký tự ngay trước quantifier có thể không xuất hiện
+                i = QUANTIFIER.match(pattern, i - 1).end() if char == "{" else i
+                run = run[:-1]
+            elif char not in ".^$+":
+                literal = char
+
+        if literal is not None and depth == 0:
+            run += literal
+        else:
+            if run:
+                runs.append(run)
+            run = ""
+    if run:
+        runs.append(run)
+    return runs
+
+
+class RepoIndex:
+    """Trigram index of every text blob seen in one repository.
+
+    Blobs get increasing ids, so posting lists (``array('I')`` of ids per
+    trigram) stay sorted by appending. Contents are kept zlib-compressed to
+    verify candidates. Each indexed commit is a view ``{path: blob id}``:
+    a new commit only adds the blobs its tree does not share with blobs
+    already indexed. Ids no view refers to anymore are dropped by
+    ``compacted``, which builds new structures instead of mutating them, so
+    a search keeps working on the ``snapshot`` it started with.
+    """
+
+    def __init__(self):
+        self.blob_ids = {}        # blob sha -> id
+        self.contents = []        # id -> zlib bytes
+        self.postings = {}        # trigram -> array('I') of ids
+        self.skipped = set()      # blob sha không phải text (binary, không decode được)
+        self.views = OrderedDict()  # commit sha -> {path: id}
+        self.nbytes = 0
+        self.lock = asyncio.Lock()
+
+    def add(self, sha, compressed, grams):
+        blob_id = len(self.contents)
+        self.blob_ids[sha] = blob_id
+        self.contents.append(compressed)
+        self.nbytes += len(compressed) + OBJECT_OVERHEAD
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                ids = self.postings[gram] = array("I")
+                self.nbytes += OBJECT_OVERHEAD
+            ids.append(blob_id)
+        self.nbytes += 4 * len(grams)
+        return blob_id
+
+    def snapshot(self, view):
+        return view, self.contents, self.postings
+
+    def live_ids(self):
+        return {blob_id for view in self.views.values() for blob_id in view.values()}
+
+    def compacted(self):
+        """Structures without the blobs no view refers to, renumbered (applied with ``vars(entry).update``)"""
+        live = sorted(self.live_ids())
+        remap = {old: new for new, old in enumerate(live)}
+        shas = {blob_id: sha for sha, blob_id in self.blob_ids.items()}
+
+        postings, nbytes = {}, 0
+        for gram, ids in self.postings.items():
+            kept = array("I", (remap[blob_id] for blob_id in ids if blob_id in remap))
+            if kept:
+                postings[gram] = kept
+                nbytes += 4 * len(kept) + OBJECT_OVERHEAD
+        contents = [self.contents[old] for old in live]
+        nbytes += sum(len(data) + OBJECT_OVERHEAD for data in contents)
+
+        return {
+            "blob_ids": {shas[old]: new for new, old in enumerate(live)},
+            "contents": contents,
+            "postings": postings,
+            "views": OrderedDict(
+                (commit, {path: remap[blob_id] for path, blob_id in view.items()}) for commit, view in self.views.items()
+            ),
+            "nbytes": nbytes,
+        }
+
+
+def query_trigrams(query, pattern, regex):
+    """Trigrams every file matching ``query`` (compiled as ``pattern``) must contain"""
+    if pattern.flags & re.VERBOSE:
+        literals = []
+    else:
+        literals = required_literals(query) if regex else [query]
+    grams = set()
+    for literal in literals:
+        data = literal.encode("utf-8")
+        # Index chỉ hạ chữ thường ASCII: khi không phân biệt hoa thường, bỏ trigram có byte ngoài ASCII
+        grams |= {gram for gram in trigrams(data) if not pattern.flags & re.IGNORECASE or gram & 0x808080 == 0}
+    return grams
+
+
+def find_candidates(postings, grams):
+    """Ids of blobs containing every trigram in ``grams`` (None: no restriction)"""
+    if not grams:
+        return None
+    lists = sorted((postings.get(gram, ()) for gram in grams), key = len)
+    result = set(lists[0])
+    for ids in lists[1:]:
+        if not result:
+            break
+        result.intersection_update(ids)
+    return result
+
+
+def search_blobs(snapshot, grams, pattern, globs, limit):
+    """Line-numbered matches of ``pattern`` in the files of a ``(view, contents, postings)`` snapshot (runs in a thread)"""
+    view, contents, postings = snapshot
+    candidates = find_candidates(postings, grams)
+    files = sorted(
+        (path, blob_id) for path, blob_id in view.items()
+        if (candidates is None or blob_id in candidates) and (not globs or any(fnmatch.fnmatchcase(path, glob) for glob in globs))
+    )
+    matches, matched_files, truncated = [], 0, False
+    for path, blob_id in files:
+        text = zlib.decompress(contents[blob_id]).decode("utf-8")
+        line, line_start, last_line = 1, 0, 0
+        found = False
+        for match in pattern.finditer(text):
+            line += text.count("\n", line_start, match.start())
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            # Mỗi dòng chỉ báo một lần, ở match đầu tiên
+            if line == last_line:
+                continue
+            if len(matches) >= limit:
+                truncated = True
+                break
+            last_line, found = line, True
+            line_end = text.find("\n", match.start())
+            matches.append({
+                "path": path,
+                "line": line,
+                "column": match.start() - line_start + 1,
+                "text": text[line_start:line_end if line_end >= 0 else len(text)][:settings.SEARCH_MAX_LINE_CHARS],
+            })
+        matched_files += found
+        if truncated:
+            break
+    return matches, len(files), matched_files, truncated
+
+
+class SearchIndex:
+    """Per-repository trigram indexes for ``/search``, bounded by ``max_bytes`` (LRU by repository)"""
+
+    def __init__(self, max_bytes, max_views):
+        self.max_bytes = max_bytes
+        self.max_views = max_views
+        self._repos = OrderedDict()   # full_name -> RepoIndex
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.builds = 0
+        self.blobs_added = 0
+        self.evictions = 0
+
+    def _entry(self, full_name):
+        entry = self._repos.get(full_name)
+        if entry is None:
+            entry = self._repos[full_name] = RepoIndex()
+        self._repos.move_to_end(full_name)
+        return entry
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._repos.values())
+
+    def _evict(self, keep):
+        while self.nbytes > self.max_bytes and len(self._repos) > 1:
+            full_name = next(name for name in self._repos if name != keep)
+            del self._repos[full_name]
+            self.evictions += 1
+            logger.info(f"Search index for {full_name} evicted")
+
+    async def _index_commit(self, gh, repo, tree):
+        """Add the blobs of ``tree`` missing from the repo index and record its view"""
+        entry = self._entry(repo.full_name)
+        async with entry.lock:
+            if tree.commit_sha in entry.views:
+                entry.views.move_to_end(tree.commit_sha)
+                self.hits += 1
+                view = entry.views[tree.commit_sha]
+                return entry.snapshot(view), {"built": False, "added": 0, "reused": len(view)}
+
+            started = time.perf_counter()
+            files = sorted(
+                (path, sha) for path, (sha, size) in tree.blobs.items()
+                if size <= settings.GITHUB_MAX_FILE_SIZE and sha not in entry.skipped
+            )[:settings.SEARCH_MAX_FILES]
+            missing = sorted({sha for _, sha in files if sha not in entry.blob_ids})
+            owner, name = repo.full_name.split("/")
+            semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+            failed = 0
+
+            async def fetch(sha):
+                nonlocal failed
+                try:
+                    async with semaphore:
+                        data = await gh.get_blob(owner, name, sha)
+                except GitHubRateLimited:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Error getting blob {sha} for search index: {str(e)}")
+                    failed += 1
+                    return
+                if b"\0" in data[:8192]:
+                    entry.skipped.add(sha)
+                    return
+                try:
+                    data.decode("utf-8")
+                except UnicodeDecodeError:
+                    entry.skipped.add(sha)
+                    return
+                # Tách trigram và nén trong thread để không chặn event loop
+                grams, compressed = await asyncio.to_thread(lambda: (trigrams(data), zlib.compress(data)))
+                entry.add(sha, compressed, grams)
+
+            tasks = [asyncio.ensure_future(fetch(sha)) for sha in missing]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            view = {path: entry.blob_ids[sha] for path, sha in files if sha in entry.blob_ids}
+            added = len(missing) - failed - sum(sha in entry.skipped for sha in missing)
+            self.builds += 1
+            self.blobs_added += added
+            stats = {
+                "built": True, "added": added, "reused": len(view) - added, "failed": failed,
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            if failed:
+                # Thiếu file: không lưu view để lần sau tải lại các blob lỗi
+                return entry.snapshot(view), stats
+
+            entry.views[tree.commit_sha] = view
+            while len(entry.views) > self.max_views:
+                entry.views.popitem(last = False)
+            if len(entry.contents) > 2 * len(entry.live_ids()) + 1000:
+                vars(entry).update(await asyncio.to_thread(entry.compacted))
+            self._evict(keep = repo.full_name)
+            return entry.snapshot(entry.views[tree.commit_sha]), stats
+
+    async def search(self, gh, repo_name, query, branch = None, regex = False, case_sensitive = False, paths = None, limit = 100):
+        """Search ``query`` in the files of ``branch``, indexing the commit first if needed (None if not found)"""
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        try:
+            pattern = re.compile(query if regex else re.escape(query), flags)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid regex: {str(e)}")
+
+        repo = await gh.get_repo(repo_name)
+        if repo is None:
+            return None
+        branch = branch or repo.default_branch
+        tree = await gh.get_tree_index(repo, branch)
+        if tree is None:
+            return None
+
+        snapshot, index_stats = await self._flights.do(
+            (repo.full_name, tree.commit_sha), lambda: self._index_commit(gh, repo, tree)
+        )
+
+        grams = query_trigrams(query, pattern, regex)
+
+        started = time.perf_counter()
+        matches, searched, matched_files, truncated = await asyncio.to_thread(
+            search_blobs, snapshot, grams, pattern, paths, min(limit, settings.SEARCH_MAX_RESULTS)
+        )
+        return {
+            "repo": repo.full_name,
+            "branch": branch,
+            "commit": tree.commit_sha,
+            "files_indexed": len(snapshot[0]),
+            "files_searched": searched,
+            "files_matched": matched_files,
+            "truncated": truncated or tree.truncated or len(tree.blobs) > settings.SEARCH_MAX_FILES,
+            "matches": matches,
+            "index": index_stats,
+            "search_seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def stats(self):
+        return {
+            "repos": len(self._repos),
+            "commits": sum(len(entry.views) for entry in self._repos.values()),
+            "blobs": sum(len(entry.contents) for entry in self._repos.values()),
+            "trigrams": sum(len(entry.postings) for entry in self._repos.values()),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "builds": self.builds,
+            "blobs_added": self.blobs_added,
+            "evictions": self.evictions,
+        }
+
+
+search_index = SearchIndex(max_bytes = settings.SEARCH_INDEX_MAX_BYTES, max_views = settings.SEARCH_MAX_COMMITS)
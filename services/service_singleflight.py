@@ -0,0 +1,49 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight call.
+
+    The first caller starts ``fn()``; callers arriving before it finishes
+    await the same future and get the same result (or exception). The call
+    is shielded, so one caller disconnecting does not cancel it for the
+    others. Keys must carry everything that scopes the result, e.g. the
+    access token for GitHub calls.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+        self.executed += 1
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Không ai chờ nữa (mọi caller đã huỷ): lấy exception để không bị log "never retrieved"
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self):
+        calls = self.executed + self.shared
+        return {
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+            "shared_ratio": self.shared / calls if calls else 0.0,
+        }
+
+
+github_flights = SingleFlight()
+llm_flights = SingleFlight()
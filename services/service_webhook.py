@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+from urllib.parse import parse_qs, quote, urlsplit
+
+from configs.config import settings
+from .service_cache import blob_cache, metadata_cache
+from .service_github import github_pool
+from .service_mirror import mirror_store
+from .service_scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+ZERO_SHA = "0" * 40
+HANDLED_EVENTS = ("push", "create", "delete")
+
+
+def verify_signature(secret, body, signature):
+    """True if ``signature`` (``X-Hub-Signature-256``) is the HMAC-SHA256 of ``body`` with ``secret``"""
+    if not secret or not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def ref_matcher(full_name, branch = None):
+    """Predicate over cached GitHub URLs that depend on ``branch`` of ``full_name`` (or on its list of refs).
+
+    Trees, commits and blobs requested by SHA never change and are kept.
+    """
+    base = urlsplit(f"{settings.GITHUB_API_URL}/repos/{full_name}").path.lower()
+    by_name = {f"{base}/commits/{quote(branch)}".lower(), f"{base}/branches/{quote(branch)}".lower()} if branch else set()
+
+    def match(url):
+        parts = urlsplit(url)
+        path = parts.path.lower()
+        if path in (base, f"{base}/branches", f"{base}/tags") or path in by_name:
+            return True
+        if branch and path == f"{base}/commits":
+            return parse_qs(parts.query).get("sha") == [branch]
+        # compare theo tên branch, ví dụ main...feature
+        return bool(branch) and path.startswith(f"{base}/compare/") and branch.lower() in path[len(base) + 9:].split("...")
+    return match
+
+
+def delivery_ref(event, payload):
+    """``(full_name, branch)`` of a delivery (branch None for tags); ValueError if the payload lacks them"""
+    try:
+        full_name, ref = payload["repository"]["full_name"], payload["ref"]
+    except (KeyError, TypeError, IndexError):
+        raise ValueError("payload has no repository.full_name or ref")
+    if not isinstance(full_name, str) or not isinstance(ref, str) or full_name.count("/") != 1:
+        raise ValueError("repository.full_name and ref must be strings")
+    if event == "push":
+        return full_name, ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else None
+    # create / delete: "ref" là tên ngắn, kèm "ref_type" (branch / tag)
+    return full_name, ref if payload.get("ref_type") == "branch" else None
+
+
+class WebhookProcessor:
+    """Handle GitHub ``push`` / ``create`` / ``delete`` deliveries.
+
+    The cached metadata depending on the ref is dropped right away; for a
+    push, the new tree and the blobs of the changed files are then fetched
+    in the background by ``workers`` tasks at bulk priority, so the first
+    request after the push is served from cache. Jobs wait in a queue of
+    ``queue_size`` refs: a second push to a queued ref only updates its job,
+    and pushes beyond the queue size are not pre-warmed.
+    """
+
+    def __init__(self, secret, workers, queue_size, max_files):
+        self.secret = secret
+        self.workers = workers
+        self.max_files = max_files
+        self._queue = asyncio.Queue(maxsize = queue_size)
+        self._jobs = {}   # (full_name, branch) -> payload của push mới nhất
+        self._tasks = []
+
+        self.deliveries = 0
+        self.invalidated = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.prewarmed = 0
+        self.prewarmed_blobs = 0
+        self.failed = 0
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions = True)
+        self._tasks = []
+
+    def handle(self, event, payload):
+        """Invalidate caches for one verified delivery and queue its pre-warm job; returns a summary.
+
+        Raises ValueError (before touching any cache) if the payload does not name a repository and ref.
+        """
+        full_name, branch = delivery_ref(event, payload)
+        self.deliveries += 1
+
+        invalidated = metadata_cache.invalidate(ref_matcher(full_name, branch))
+        self.invalidated += invalidated
+        mirror_store.expire(full_name)
+
+        queued = False
+        if event == "push" and branch is not None and not payload.get("deleted") and payload.get("after", ZERO_SHA) != ZERO_SHA:
+            queued = self._enqueue((full_name, branch), payload)
+        logger.info(
+            f"Webhook {event} for {full_name}",
+            extra = {"branch": branch, "invalidated": invalidated, "queued": queued}
+        )
+        return {"event": event, "repository": full_name, "branch": branch, "invalidated": invalidated, "prewarm_queued": queued}
+
+    def _enqueue(self, key, payload):
+        if key in self._jobs:
+            self._jobs[key] = payload
+            self.coalesced += 1
+            return True
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Pre-warm queue full, skipping {key[0]}@{key[1]}")
+            return False
+        self._jobs[key] = payload
+        self.queued += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            payload = self._jobs.pop(key)
+            try:
+                await self._prewarm(key[0], key[1], payload)
+                self.prewarmed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Pre-warm of {key[0]}@{key[1]} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _prewarm(self, full_name, branch, payload):
+        gh = github_pool.client_for(full_name)
+        if gh is None:
+            logger.info(f"No token to pre-warm {full_name}")
+            return
+
+        repo = await gh.get_repo(full_name)
+        if repo is None:
+            return
+        # Branch -> commit mới, rồi tree của commit đó (cache dùng chung cho mọi token đọc được repo)
+        head_sha = await gh.resolve_commit(repo, branch)
+        tree = await gh.get_commit_tree_index(repo, head_sha or payload["after"])
+        if tree is None:
+            return
+
+        changed = {
+            path for commit in payload.get("commits") or []
+            for path in (commit.get("added") or []) + (commit.get("modified") or [])
+        }
+        if not changed and payload.get("before", ZERO_SHA) != ZERO_SHA:
+            # Payload không liệt kê file (force push, quá nhiều commit): so sánh hai tree theo blob SHA
+            before = await gh.get_commit_tree_index(repo, payload["before"])
+            if before is not None:
+                changed = {path for path, entry in tree.blobs.items() if before.blobs.get(path, (None,))[0] != entry[0]}
+
+        shas = []
+        for path in sorted(changed):
+            entry = tree.blobs.get(path)
+            if entry is not None and entry[1] <= settings.GITHUB_MAX_FILE_SIZE and entry[0] not in blob_cache:
+                shas.append(entry[0])
+        shas = shas[:self.max_files]
+
+        owner, name = repo.full_name.split("/")
+        semaphore = asyncio.Semaphore(settings.GITHUB_MAX_CONCURRENCY)
+
+        async def fetch(sha):
+            async with semaphore:
+                await gh.get_blob(owner, name, sha, priority = BULK)
+
+        results = await asyncio.gather(*(fetch(sha) for sha in shas), return_exceptions = True)
+        errors = sum(isinstance(result, Exception) for result in results)
+        self.prewarmed_blobs += len(shas) - errors
+        logger.info(
+            f"Pre-warmed {full_name}@{branch}",
+            extra = {"commit": tree.commit_sha, "blobs": len(shas) - errors, "errors": errors}
+        )
+
+    def stats(self):
+        return {
+            "deliveries": self.deliveries,
+            "invalidated": self.invalidated,
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize(),
+            "prewarmed": self.prewarmed,
+            "prewarmed_blobs": self.prewarmed_blobs,
+            "failed": self.failed,
+        }
+
+
+webhook_processor = WebhookProcessor(
+    secret = settings.GITHUB_WEBHOOK_SECRET,
+    workers = settings.WEBHOOK_WORKERS,
+    queue_size = settings.WEBHOOK_QUEUE_SIZE,
+    max_files = settings.WEBHOOK_PREWARM_MAX_FILES
+)
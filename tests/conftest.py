@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+# Chạy được `pytest` từ bất kỳ thư mục nào: import theo gốc repo như main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import UpstreamProfile
+from benchmarks.fake_github import FakeGitHub
+from benchmarks.fake_llm import FakeLLM
+from configs.config import settings
+from services import service_http, service_llm
+from services.service_http import close_sessions
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    """``run(test, repo)`` runs ``await test(server)`` with the GitHub URLs pointing at a fake GitHub serving ``repo``"""
+    def run(test, repo, rate_limit = 0):
+        async def main():
+            server = FakeGitHub(repo, UpstreamProfile(), rate_limit = rate_limit)
+            runner, url = await serve(server.app())
+            monkeypatch.setattr(settings, "GITHUB_API_URL", url)
+            monkeypatch.setattr(settings, "GITHUB_GRAPHQL_URL", f"{url}/graphql")
+            try:
+                await test(server)
+            finally:
+                await close_sessions()
+                await runner.cleanup()
+        asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """``run(test, fake, middlewares)`` runs ``await test(url)`` with every provider pointing at ``fake`` (a ``FakeLLM``).
+
+    ``middlewares`` run inside the fake's latency / failure injection, e.g. to
+    count connections or answer some requests with 429.
+    """
+    # Semaphore của provider được tạo theo limit của lần gọi đầu: mỗi test bắt đầu từ đầu
+    monkeypatch.setattr(service_http, "_limiters", {})
+    monkeypatch.setattr(service_llm, "_blocked_until", {})
+    for name in ("OPENAI_TOKEN", "DEEPSEEK_TOKEN", "GEMINI_TOKEN", "CLAUDE_TOKEN"):
+        monkeypatch.setattr(settings, name, "test-token")
+
+    def run(test, fake = None, middlewares = ()):
+        async def main():
+            app = (fake or FakeLLM(UpstreamProfile(), tokens = 5)).app()
+            app.middlewares.extend(middlewares)
+            runner, url = await serve(app)
+            monkeypatch.setattr(settings, "OPENAI_API_URL", f"{url}/openai/v1")
+            monkeypatch.setattr(settings, "DEEPSEEK_API_URL", f"{url}/deepseek")
+            monkeypatch.setattr(settings, "GEMINI_API_URL", f"{url}/gemini/v1")
+            monkeypatch.setattr(settings, "CLAUDE_API_URL", f"{url}/claude/v1")
+            try:
+                await test(url)
+            finally:
+                await close_sessions()
+                await runner.cleanup()
+        asyncio.run(main())
+    return run
@@ -0,0 +1,121 @@
+import asyncio
+import gc
+import io
+import tarfile
+from contextlib import asynccontextmanager
+
+import pytest
+
+from services.service_archive import SnapshotStore
+
+FILES = {"README.md": b"hello\n", "src/app.py": b"print(1)\n", "logo.png": b"\x89PNG\r\n\x00\x00", "empty.txt": b""}
+
+
+def tarball(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj = buffer, mode = "w:gz") as tar:
+        for path, data in files.items():
+            info = tarfile.TarInfo(f"octo-repo-abc/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeContent:
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    async def read(self, size):
+        return self.data.read(size)
+
+
+class FakeGitHub:
+    """Serves one tarball through ``stream()``; ``fail`` makes the next downloads error out"""
+
+    def __init__(self, files):
+        self.data = tarball(files)
+        self.downloads = 0
+        self.fail = False
+
+    @asynccontextmanager
+    async def stream(self, path):
+        self.downloads += 1
+        if self.fail:
+            raise ConnectionError("download failed")
+        response = type("Response", (), {"raise_for_status": lambda self: None})()
+        response.content = FakeContent(self.data)
+        yield response
+
+
+def test_snapshot_contents(tmp_path):
+    async def main():
+        store, gh = SnapshotStore(str(tmp_path), max_open = 4), FakeGitHub(FILES)
+        snapshot = await store.get(gh, "octo/repo", "a" * 40)
+        assert sorted(snapshot.text_files()) == ["README.md", "empty.txt", "src/app.py"]
+        assert snapshot.read("src/app.py") == "print(1)\n"
+        assert snapshot.read("empty.txt") == ""
+        assert snapshot.read("logo.png") is None
+        assert snapshot.read("missing.py") is None
+        snapshot.release()
+
+        # Lần sau dùng snapshot đang mở; store mới đọc lại từ đĩa, không tải lại
+        assert await store.get(gh, "octo/repo", "a" * 40) is snapshot
+        other = await SnapshotStore(str(tmp_path), max_open = 4).get(gh, "octo/repo", "a" * 40)
+        assert other.read("README.md") == "hello\n"
+        assert gh.downloads == 1
+    asyncio.run(main())
+
+
+def test_evicted_snapshot_stays_open_for_its_readers(tmp_path):
+    async def main():
+        store, gh = SnapshotStore(str(tmp_path), max_open = 1), FakeGitHub(FILES)
+        first = await store.get(gh, "octo/repo", "a" * 40)
+        second = await store.get(gh, "octo/repo", "b" * 40)
+        # first đã bị đẩy ra nhưng vẫn còn người đọc
+        assert first.retired
+        assert first.read("README.md") == "hello\n"
+        first.release()
+        with pytest.raises(ValueError):
+            first.read("README.md")
+        assert second.read("README.md") == "hello\n"
+        second.release()
+    asyncio.run(main())
+
+
+def test_failed_rebuild_keeps_the_open_snapshot(tmp_path):
+    async def main():
+        store, gh = SnapshotStore(str(tmp_path), max_open = 4), FakeGitHub(FILES)
+        # Snapshot không giải nén file .png; request sau cần cả .png nên phải build lại
+        reader = await store.get(gh, "octo/repo", "a" * 40, forbidden_extensions = {"png"})
+        gh.fail = True
+        with pytest.raises(ConnectionError):
+            await store.get(gh, "octo/repo", "a" * 40)
+        assert not reader.retired
+        assert reader.read("src/app.py") == "print(1)\n"
+
+        again = await store.get(gh, "octo/repo", "a" * 40, forbidden_extensions = {"png"})
+        assert again is reader
+        assert again.read("README.md") == "hello\n"
+        again.release()
+
+        gh.fail = False
+        rebuilt = await store.get(gh, "octo/repo", "a" * 40)
+        assert rebuilt is not reader and reader.retired
+        # Người đọc cũ vẫn đọc được cho tới khi release
+        assert reader.read("README.md") == "hello\n"
+        reader.release()
+        assert rebuilt.read("src/app.py") == "print(1)\n"
+        rebuilt.release()
+    asyncio.run(main())
+
+
+def test_locks_are_not_kept(tmp_path):
+    async def main():
+        store, gh = SnapshotStore(str(tmp_path), max_open = 2), FakeGitHub(FILES)
+        snapshots = await asyncio.gather(*(store.get(gh, "octo/repo", f"{i:040x}") for i in range(5)))
+        for snapshot in snapshots:
+            snapshot.release()
+        gc.collect()
+        assert len(store._locks) == 0
+        assert len(store._open) == 2
+    asyncio.run(main())
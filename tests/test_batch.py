@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+from fastapi.testclient import TestClient
+
+import main
+from configs.config import settings
+from services.service_base import chat_llm_retry
+
+JOB = {"prompt": "hi", "provider": "openai", "model_name": "gpt-4o-mini"}
+
+
+class StandIn:
+    """Middleware for the fake LLM: per-prompt latency, scripted failures and in-flight counts per provider"""
+
+    def __init__(self, failures = ()):
+        self.failures = list(failures)   # (status, headers) trả về cho các request đầu tiên
+        self.in_flight, self.peak = Counter(), Counter()
+        self.total = self.total_peak = 0
+
+        @web.middleware
+        async def middleware(request, handler):
+            return await self.handle(request, handler)
+        self.middleware = middleware
+
+    async def handle(self, request, handler):
+        if self.failures:
+            status, headers = self.failures.pop(0)
+            return web.json_response({"error": {"message": "scripted"}}, status = status, headers = headers)
+
+        provider = request.path.split("/")[1]
+        self.in_flight[provider] += 1
+        self.total += 1
+        self.peak[provider] = max(self.peak[provider], self.in_flight[provider])
+        self.total_peak = max(self.total_peak, self.total)
+        try:
+            # Prompt là số giây upstream cần để trả lời
+            body = await request.json()
+            prompt = body["contents"][-1]["parts"][0]["text"] if "contents" in body else body["messages"][-1]["content"][0]["text"]
+            await asyncio.sleep(float(prompt) if prompt.replace(".", "").isdigit() else 0)
+            return await handler(request)
+        finally:
+            self.in_flight[provider] -= 1
+            self.total -= 1
+
+
+async def post_batch(body):
+    """POST /chat/batch from a thread, so the fake LLM keeps serving on this event loop"""
+    def post():
+        with TestClient(main.app) as client:
+            return client.post("/api/v1/chat/batch", json = body)
+    return await asyncio.to_thread(post)
+
+
+def test_retry_waits_for_retry_after(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_WAIT", 5)
+    stand_in = StandIn([(429, {"Retry-After": "0.3"})])
+
+    async def test(url):
+        started = time.perf_counter()
+        result = await chat_llm_retry(JOB)
+        assert result["status_code"] == 200 and result["attempts"] == 2
+        assert time.perf_counter() - started >= 0.3
+    fake_llm(test, middlewares = [stand_in.middleware])
+
+
+def test_retry_gives_up_on_long_retry_after(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_WAIT", 5)
+    stand_in = StandIn([(429, {"Retry-After": "3600"})])
+
+    async def test(url):
+        started = time.perf_counter()
+        result = await chat_llm_retry(JOB)
+        assert result["status_code"] == 429 and result["attempts"] == 1
+        assert time.perf_counter() - started < 1
+    fake_llm(test, middlewares = [stand_in.middleware])
+
+
+def test_retry_backs_off_on_5xx_up_to_the_limit(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(settings, "LLM_RETRIES", 3)
+    stand_in = StandIn([(503, {}), (500, {})])
+
+    async def test(url):
+        # Hai lỗi rồi thành công
+        result = await chat_llm_retry(JOB)
+        assert result["status_code"] == 200 and result["attempts"] == 3
+        # Bốn lỗi liên tiếp: hết LLM_RETRIES lần thử lại
+        stand_in.failures = [(503, {})] * 4
+        result = await chat_llm_retry(JOB)
+        assert result["status_code"] == 503 and result["attempts"] == 4
+        assert stand_in.failures == []
+    fake_llm(test, middlewares = [stand_in.middleware])
+
+
+def test_batch_results_in_job_order_or_completion_order(fake_llm):
+    # Job 0 xong sau cùng, job 1 xong đầu tiên
+    delays = ["0.3", "0", "0.2", "0.1"]
+    jobs = [{**JOB, "prompt": delay, "provider": provider, "model_name": model_name} for delay, (provider, model_name) in zip(delays, [
+        ("openai", "gpt-4o-mini"), ("claude", "claude-3-5-sonnet-20241022"), ("gemini", "gemini-2.0-flash"), ("deepseek", "deepseek-chat")
+    ])]
+    stand_in = StandIn()
+
+    async def test(url):
+        response = await post_batch({"jobs": jobs})
+        assert response.status_code == 200
+        ordered = response.json()
+        assert [result["index"] for result in ordered] == [0, 1, 2, 3]
+        assert all(result["status_code"] == 200 and result["attempts"] == 1 for result in ordered)
+        assert len({result["output"] for result in ordered}) == 4
+
+        response = await post_batch({"jobs": jobs, "stream": True})
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        streamed = [json.loads(line) for line in response.text.splitlines()]
+        assert [result["index"] for result in streamed] == [1, 3, 2, 0]
+        assert sorted(streamed, key = lambda result: result["index"]) == ordered
+    fake_llm(test, middlewares = [stand_in.middleware])
+
+
+def test_batch_limits_concurrency_per_provider(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BATCH_CONCURRENCY", 2)
+    jobs = [{**JOB, "prompt": "0.1"} for _ in range(6)]
+    jobs += [{**JOB, "prompt": "0.1", "provider": "gemini", "model_name": "gemini-2.0-flash"} for _ in range(6)]
+    stand_in = StandIn()
+
+    async def test(url):
+        started = time.perf_counter()
+        response = await post_batch({"jobs": jobs})
+        assert [result["status_code"] for result in response.json()] == [200] * 12
+        assert stand_in.peak == {"openai": 2, "gemini": 2}
+        # Hai provider chạy song song với nhau: 3 lượt x 0.1s, không phải 6 lượt
+        assert stand_in.total_peak == 4
+        assert time.perf_counter() - started < 0.55
+    fake_llm(test, middlewares = [stand_in.middleware])
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import threading
+
+import aiohttp
+import pytest
+
+from benchmarks.synthetic import SyntheticRepo
+from configs.config import settings
+from services import service_github
+from services.service_cache import BlobCache, MetadataCache, git_blob_sha
+from services.service_github import GitHubRepo
+
+
+def blob(text):
+    data = text.encode()
+    return git_blob_sha(data), data
+
+
+def files_on_disk(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_blob_cache_evicts_to_disk_and_reads_back(tmp_path):
+    cache = BlobCache(max_bytes = 100, disk_dir = str(tmp_path), promote_threshold = 30)
+    small = [blob(f"{i}" * 20) for i in range(6)]
+    large = blob("x" * 40)   # > max_bytes // 4: ghi thẳng xuống đĩa
+
+    async def test():
+        for sha, data in small + [large]:
+            await cache.put(sha, data)
+        # Sai SHA: bỏ qua
+        await cache.put("0" * 40, b"other")
+        assert "0" * 40 not in cache
+
+        stats = cache.stats()
+        assert stats["memory_bytes"] == 100 and stats["evictions"] == 1
+        assert stats["disk_entries"] == 2 and stats["disk_bytes"] == 60
+        assert all(sha in cache for sha, _ in small + [large])
+
+        # Entry nhỏ trên đĩa được đưa lại lên bộ nhớ, entry lớn thì không
+        assert await cache.get(small[0][0]) == small[0][1]
+        assert small[0][0] in cache._memory
+        assert await cache.get(large[0]) == large[1]
+        assert large[0] not in cache._memory
+        assert await cache.get("f" * 40) is None
+        assert (cache.hits, cache.disk_hits, cache.misses) == (0, 2, 1)
+    asyncio.run(test())
+
+
+def test_blob_cache_bounds_the_disk(tmp_path):
+    cache = BlobCache(max_bytes = 10, disk_dir = str(tmp_path), disk_max_bytes = 100)
+    entries = [blob(f"{i}" * 40) for i in range(4)]
+
+    async def test():
+        for sha, data in entries:
+            await cache.put(sha, data)
+        assert cache.stats()["disk_bytes"] == 80 and cache.disk_evictions == 2
+        assert entries[0][0] not in cache and entries[3][0] in cache
+        assert len(files_on_disk(tmp_path)) == 2
+    asyncio.run(test())
+
+
+def test_concurrent_puts_of_one_blob_are_counted_once(tmp_path, monkeypatch):
+    cache = BlobCache(max_bytes = 10, disk_dir = str(tmp_path))
+    sha, data = blob("y" * 1000)
+    # Chặn mọi lần ghi ở os.replace cho đến khi cả 8 thread đều đã vào _write_disk
+    barrier, replace = threading.Barrier(8, timeout = 0.5), os.replace
+
+    def slow_replace(*args):
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        replace(*args)
+    monkeypatch.setattr(os, "replace", slow_replace)
+
+    async def test():
+        await asyncio.gather(*(asyncio.to_thread(cache._write_disk, sha, data) for _ in range(8)))
+    asyncio.run(test())
+    assert cache.stats()["disk_bytes"] == len(data) and cache.stats()["disk_entries"] == 1
+    assert files_on_disk(tmp_path) == [sha[2:]]
+
+
+def test_disk_index_skips_temporary_files(tmp_path):
+    sha, data = blob("kept")
+    folder = tmp_path / sha[:2]
+    folder.mkdir()
+    (folder / sha[2:]).write_bytes(data)
+    # Ghi dở khi process bị dừng, và file lạ không phải của cache
+    (folder / ".tmpab12cd").write_bytes(b"partial" * 100)
+    (tmp_path / "notes.txt").write_text("unrelated")
+
+    cache = BlobCache(max_bytes = 100, disk_dir = str(tmp_path))
+    assert cache.stats()["disk_entries"] == 1 and cache.stats()["disk_bytes"] == len(data)
+    assert not (folder / ".tmpab12cd").exists() and (tmp_path / "notes.txt").exists()
+    assert asyncio.run(cache.get(sha)) == data
+
+
+def test_metadata_cache_lru_and_invalidation():
+    cache = MetadataCache(max_bytes = 100)
+    for i in range(4):
+        cache.put(("token", f"https://api/{i}"), {"i": i}, etag = f'"{i}"', last_modified = None, size = 40)
+    assert cache.get(("token", "https://api/0")) is None and cache.evictions == 2
+    assert cache.get_fresh(("token", "https://api/3"), ttl = 60).body == {"i": 3}
+    assert cache.get_fresh(("token", "https://api/3"), ttl = 0) is None
+
+    entry = cache.get(("token", "https://api/2"))
+    entry.fetched_at -= 120
+    assert cache.get_fresh(("token", "https://api/2"), ttl = 60) is None
+    cache.renew(entry)
+    assert cache.get_fresh(("token", "https://api/2"), ttl = 60) is entry
+
+    assert cache.invalidate(lambda url: url.endswith("/2")) == 1
+    assert cache.get(("token", "https://api/2")) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["revalidated"], stats["misses"], stats["entries"]) == (2, 1, 4, 1)
+
+
+@pytest.fixture
+def fresh_caches(monkeypatch):
+    """Empty blob / metadata caches for GitHubRepo, so counts do not depend on earlier tests"""
+    blobs, metadata = BlobCache(max_bytes = 1 << 20), MetadataCache(max_bytes = 1 << 20)
+    monkeypatch.setattr(service_github, "blob_cache", blobs)
+    monkeypatch.setattr(service_github, "metadata_cache", metadata)
+    return blobs, metadata
+
+
+async def calls():
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{settings.GITHUB_API_URL}/_bench/calls", params = {"reset": "1"}) as response:
+            return await response.json()
+
+
+def test_bulk_fetch_reads_one_tree_and_each_blob_once(fake_github, fresh_caches, monkeypatch):
+    monkeypatch.setattr(settings, "GITHUB_BACKEND", "rest")
+    repo = SyntheticRepo(files = 60, commits = 5)
+    text_files = [path for path in repo.paths if path.endswith(".py")][:20]
+
+    async def test(server):
+        gh = GitHubRepo("token")
+        head = repo.branches["main"]
+        wanted = text_files + text_files[:5] + ["missing.py", "docs/readme.md"]
+        contents = await gh.get_files_content("bench/repo", files = wanted, forbidden_extensions = ["md"])
+        assert list(contents) == list(dict.fromkeys(wanted))
+        for path in text_files:
+            assert contents[path] == repo.content(repo.file_index[path], repo.version(repo.file_index[path], head)).decode()
+        assert contents["missing.py"] is None and contents["docs/readme.md"] is None
+        assert await calls() == {
+            "GET /repos/{owner}/{repo}": 1,
+            "GET /repos/{owner}/{repo}/branches/{branch}": 1,
+            "GET /repos/{owner}/{repo}/git/trees/{sha}": 1,
+            "GET /repos/{owner}/{repo}/git/blobs/{sha}": len(text_files),
+        }
+
+        # Lần sau: metadata còn fresh, blob lấy từ cache theo SHA
+        assert await gh.get_files_content("bench/repo", files = text_files) == {path: contents[path] for path in text_files}
+        assert await calls() == {}
+    fake_github(test, repo)
+
+
+def test_metadata_is_revalidated_with_etags(fake_github, fresh_caches, monkeypatch):
+    _, metadata = fresh_caches
+    monkeypatch.setattr(settings, "GITHUB_METADATA_TTL", 0)
+    repo = SyntheticRepo(files = 10, commits = 3)
+
+    async def test(server):
+        gh = GitHubRepo("token")
+        first = await gh.get_branches("bench/repo")
+        second = await gh.get_branches("bench/repo")
+        assert first == second and sorted(first) == sorted(repo.branches)
+        # TTL = 0: mỗi lần gọi gửi một conditional request, GitHub trả về 304
+        assert await calls() == {"GET /repos/{owner}/{repo}": 2, "GET /repos/{owner}/{repo}/branches": 2}
+        assert metadata.revalidated == 2 and metadata.misses == 2
+
+        # Token khác có entry riêng cho repo
+        await GitHubRepo("other").get_repo("bench/repo")
+        assert metadata.misses == 3
+    fake_github(test, repo)
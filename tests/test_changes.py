@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+from configs.config import settings
+from services.service_github import COMPARE_MAX_FILES, GitHubRepo, TreeIndex
+from services.service_mirror import RepoMirror
+from tests.test_mirror import commit, git
+from utils.patch import apply_patch
+
+
+class Repo:
+    full_name = "bench/repo"
+    default_branch = "main"
+
+
+def lines(*numbers):
+    return "".join(f"line {i}\n" for i in numbers)
+
+
+def test_range_merge_fallback_matches_the_compare(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "GITHUB_BACKEND", "rest")
+    work = str(tmp_path / "work")
+    git(str(tmp_path), "init", "-q", "-b", "main", work)
+    base = commit(work, "base", {"a.txt": lines(*range(20)), "b.txt": "old b\n", "keep.txt": "keep\n"})
+    git(work, "mv", "a.txt", "moved.txt")
+    git(work, "rm", "-q", "b.txt")
+    end = commit(work, "rename a, add tmp, remove b", {"tmp.txt": "tmp\n"})
+    commit(work, "edit moved, re-add b", {"moved.txt": lines(0, 1, 2, 4, *range(5, 20), 99), "b.txt": "new b"}, removed = ["tmp.txt"])
+    commit(work, "edit keep", {"keep.txt": "changed\n"})
+    head = commit(work, "revert keep", {"keep.txt": "keep\n"})
+    mirror = RepoMirror("bench/repo", os.path.join(work, ".git"))
+    gh = GitHubRepo("token")
+
+    async def get_repo(repo_name):
+        return Repo()
+
+    async def get_commit(full_name, ref, priority = None):
+        return await mirror.commit(ref)
+
+    async def get_json(path, *args, **kwargs):
+        # Compare vượt giới hạn file của API: buộc gộp các commit tại local
+        return {"files": [{}] * COMPARE_MAX_FILES}
+
+    async def walk_range(full_name, head_sha, end_sha):
+        shas = git(work, "rev-list", "--reverse", f"{end_sha}~1..{head_sha}").split()
+        return [await mirror.commit(sha) for sha in shas]
+
+    async def tree_index(repo, commit_sha):
+        return TreeIndex(commit_sha = commit_sha, blobs = await mirror.tree(commit_sha))
+
+    async def download_blob(owner, repo, sha, *args, **kwargs):
+        return await mirror.read_blob(sha)
+
+    gh.get_repo, gh.get_commit, gh._get_json = get_repo, get_commit, get_json
+    gh._walk_range, gh.get_commit_tree_index, gh._download_blob = walk_range, tree_index, download_blob
+
+    async def test():
+        await mirror.load_refs()
+        try:
+            result = await gh.get_range_changes("bench/repo", start_id = head, end_id = end, include_file_content = True)
+            expected = await mirror.compare(base, head)
+        finally:
+            await mirror.close_cat_file()
+            gh.close()
+        return result, {file["filename"]: file for file in expected["files"]}
+    result, expected = asyncio.run(test())
+
+    assert result["base_id"] == base and result["total_commits"] == 4
+    assert result["commits_truncated"] is False
+    files = result["files"]
+    # tmp.txt thêm rồi xoá, keep.txt sửa rồi revert: không còn trong kết quả
+    assert set(files) == set(expected) == {"moved.txt", "b.txt"}
+    assert files["moved.txt"]["status"] == expected["moved.txt"]["status"] == "renamed"
+    assert files["moved.txt"]["previous_filename"] == "a.txt"
+    # b.txt xoá rồi thêm lại: sửa đổi so với commit gốc
+    assert files["b.txt"]["status"] == expected["b.txt"]["status"] == "modified"
+    for name in files:
+        for key in ("additions", "deletions", "changes"):
+            assert files[name][key] == expected[name][key], (name, key)
+    assert files["moved.txt"]["content_after"] == apply_patch(files["moved.txt"]["content_before"], files["moved.txt"]["patch"])
+    assert files["b.txt"]["patch"] == "@@ -1 +1 @@\n-old b\n+new b\n\\ No newline at end of file"
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from fastapi import HTTPException
+
+from configs.config import settings
+from services.service_github import GitHubRepo
+from services.service_http import close_sessions
+from tests.conftest import serve
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """``run(test)`` runs ``await test()`` against a GitHub that rejects the tokens ``bad`` (401) and ``sso`` (403)"""
+    async def get_repo(request):
+        token = request.headers["Authorization"].removeprefix("Bearer ")
+        if token == "bad":
+            return web.json_response({"message": "Bad credentials"}, status = 401)
+        if token == "sso":
+            return web.json_response({"message": "Resource protected by organization SAML enforcement"}, status = 403)
+        if request.match_info["repo"] != "private":
+            return web.json_response({"message": "Not Found"}, status = 404)
+        return web.json_response({"id": 1, "full_name": "bench/private", "default_branch": "main", "private": True})
+
+    def run(test):
+        async def main():
+            app = web.Application()
+            app.router.add_get("/repos/{owner}/{repo}", get_repo)
+            runner, url = await serve(app)
+            monkeypatch.setattr(settings, "GITHUB_API_URL", url)
+            try:
+                await test()
+            finally:
+                await close_sessions()
+                await runner.cleanup()
+        asyncio.run(main())
+    return run
+
+
+def test_get_repo_builds_the_repository_from_the_payload(upstream):
+    async def test():
+        repo = await GitHubRepo("good").get_repo("bench/private")
+        assert (repo.full_name, repo.default_branch, repo.private) == ("bench/private", "main", True)
+        # Thuộc tính không có trong payload không tạo request mới
+        assert repo.description is None
+        assert await GitHubRepo("good").get_repo("bench/missing") is None
+    upstream(test)
+
+
+@pytest.mark.parametrize("token, status_code", [("bad", 401), ("sso", 403)])
+def test_get_repo_rejects_unusable_tokens(upstream, token, status_code):
+    async def test():
+        with pytest.raises(HTTPException) as error:
+            await GitHubRepo(token).get_repo("bench/private")
+        assert error.value.status_code == status_code
+    upstream(test)
@@ -0,0 +1,148 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.synthetic import SyntheticRepo
+from configs.config import settings
+from services.service_github import GitHubRepo
+from services.service_graphql import GraphQLCostError
+
+
+@pytest.fixture
+def backends(fake_github, monkeypatch):
+    """Run ``test(rest, graphql, repo)`` against one fake GitHub serving a synthetic repository"""
+    # Hơn GITHUB_GRAPHQL_BATCH file để có cả query đầu tiên lẫn các batch sau
+    repo = SyntheticRepo(files = 120, commits = 40)
+
+    def run(test):
+        async def main(server):
+            monkeypatch.setattr(settings, "GITHUB_BACKEND", "rest")
+            rest = GitHubRepo("token-rest")
+            monkeypatch.setattr(settings, "GITHUB_BACKEND", "graphql")
+            graphql = GitHubRepo("token-graphql")
+            assert rest.graphql is None and graphql.graphql is not None
+            try:
+                await test(rest, graphql, repo)
+            finally:
+                rest.close()
+                graphql.close()
+        fake_github(main, repo)
+    return run
+
+
+def test_structure_matches_rest(backends):
+    async def test(rest, graphql, repo):
+        for branch in (None, "dev"):
+            expected = await rest.get_structure("bench/repo", branch = branch)
+            assert sorted(await graphql.get_structure("bench/repo", branch = branch)) == sorted(expected)
+        assert sorted(expected) == sorted(repo.paths)
+        assert await graphql.get_structure("bench/repo", branch = "missing") is None
+        assert await graphql.get_structure("bench/other") is None
+    backends(test)
+
+
+def test_files_match_rest(backends):
+    async def test(rest, graphql, repo):
+        directory = repo.paths[0].rsplit("/", 1)[0]
+        # File văn bản, file nhị phân (.png), thư mục, file không tồn tại, file trùng
+        files = repo.paths[:100] + [directory, f"{directory}/", "missing.py", repo.paths[0]]
+        for branch in ("main", "dev"):
+            expected = await rest.get_files_content("bench/repo", branch = branch, files = files)
+            actual = await graphql.get_files_content("bench/repo", branch = branch, files = files)
+            assert actual == expected
+            assert list(actual) == list(dict.fromkeys(files))
+            assert actual[directory] is None and actual["missing.py"] is None
+            assert sum(content is not None for content in actual.values()) == sum(not repo.is_binary(i) for i in range(100))
+
+        forbidden = await graphql.get_files_content("bench/repo", branch = "main", files = files, forbidden_extensions = ["md", ".JSON"])
+        assert forbidden == await rest.get_files_content("bench/repo", branch = "main", files = files, forbidden_extensions = ["md", ".JSON"])
+        assert all(forbidden[path] is None for path in files if path.endswith((".md", ".json")))
+    backends(test)
+
+
+def test_history_matches_rest(backends):
+    async def test(rest, graphql, repo):
+        for kwargs in ({}, {"branch": "dev"}, {"file_path": repo.paths[3]}, {"limit": 7}):
+            expected, _ = await rest.get_commit_history_page("bench/repo", **kwargs)
+            actual, _ = await graphql.get_commit_history_page("bench/repo", **kwargs)
+            assert list(actual.items()) == list(expected.items()), kwargs
+
+        # Phân trang bằng cursor cho ra đúng lịch sử đầy đủ
+        pages, cursor = {}, None
+        while True:
+            page, cursor = await graphql.get_commit_history_page("bench/repo", limit = 15, cursor = cursor)
+            pages.update(page)
+            if cursor is None:
+                break
+        full, _ = await rest.get_commit_history_page("bench/repo")
+        assert list(pages) == list(full)
+    backends(test)
+
+
+def test_history_cursors_are_bound_to_the_query(backends):
+    async def test(rest, graphql, repo):
+        path = repo.paths[max(range(len(repo.paths)), key = lambda i: len(repo.touches[i]))]
+        for gh in (rest, graphql):
+            page, cursor = await gh.get_commit_history_page("bench/repo", file_path = path, limit = 1)
+            assert cursor is not None
+            rest_of_history, _ = await gh.get_commit_history_page("bench/repo", file_path = path, cursor = cursor)
+            assert list(page) + list(rest_of_history) == list((await gh.get_commit_history_page("bench/repo", file_path = path))[0])
+
+            # Cursor của một query không dùng được cho file_path / since / until khác
+            for kwargs in ({}, {"file_path": repo.paths[0] if path != repo.paths[0] else repo.paths[1]}, {"file_path": path, "since": "2024-01-01T00:00:00Z"}):
+                with pytest.raises(HTTPException) as error:
+                    await gh.get_commit_history_page("bench/repo", cursor = cursor, **kwargs)
+                assert error.value.status_code == 400
+
+            # per_page / offset ngoài giới hạn của API
+            data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            for change in ({"per_page": 1000}, {"per_page": 0}, {"offset": -1}, {"offset": 100}, {"per_page": "5"}, {"filters": None}):
+                forged = base64.urlsafe_b64encode(json.dumps({**data, **change}).encode()).decode()
+                with pytest.raises(HTTPException) as error:
+                    await gh.get_commit_history_page("bench/repo", file_path = path, cursor = forged)
+                assert error.value.status_code == 400, change
+    backends(test)
+
+
+def test_expensive_tree_queries_retry_with_less_depth(backends):
+    async def test(rest, graphql, repo):
+        execute, depths = graphql.graphql.execute, []
+
+        async def limited(query, variables = None, priority = None):
+            # GitHub từ chối mọi query đọc tree sâu hơn 1 tầng
+            depth = query.count("entries {") // max(1, query.count("object(oid:"))
+            depths.append(depth)
+            if depth > 1:
+                raise GraphQLCostError("Query has too many nodes")
+            return await execute(query, variables)
+        graphql.graphql.execute = limited
+
+        assert sorted(await graphql.get_structure("bench/repo")) == sorted(await rest.get_structure("bench/repo"))
+        assert depths[:3] == [settings.GITHUB_GRAPHQL_TREE_DEPTH, settings.GITHUB_GRAPHQL_TREE_DEPTH // 2, 1]
+    backends(test)
+
+
+def test_every_file_batch_is_pinned_to_the_resolved_commit(backends):
+    async def test(rest, graphql, repo):
+        execute, queries = graphql.graphql.execute, []
+
+        async def moving(query, variables = None, priority = None):
+            data = await execute(query, variables)
+            queries.append(variables)
+            # Push ngay sau query đầu tiên: các batch sau vẫn phải đọc commit cũ
+            repo.branches["main"] = repo.branches["dev"]
+            return data
+        graphql.graphql.execute = moving
+
+        head = repo.branches["main"]
+        files = [path for i, path in enumerate(repo.paths) if not repo.is_binary(i)]
+        contents = await graphql.get_files_content("bench/repo", branch = "main", files = files)
+        assert len(queries) > 1
+        for path in files:
+            file = repo.file_index[path]
+            assert contents[path] == repo.content(file, repo.version(file, head)).decode(), path
+        # Không batch nào đọc file theo tên branch
+        assert all(not str(value).startswith("main:") for variables in queries for value in variables.values())
+    backends(test)
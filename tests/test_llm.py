@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from benchmarks.common import UpstreamProfile
+from benchmarks.fake_llm import FakeLLM
+from configs.config import settings
+from services.service_llm import build_request, llm_answer, llm_stream
+
+MODELS = {
+    "openai": "gpt-4o-mini",
+    "deepseek": "deepseek-chat",
+    "gemini": "gemini-2.0-flash",
+    "claude": "claude-3-5-sonnet-20241022",
+}
+
+
+def messages(text):
+    return [
+        {"role": "system", "content": [{"type": "text", "text": "Be brief."}]},
+        {"role": "user", "content": [{"type": "text", "text": text}]},
+    ]
+
+
+def expected(fake, provider, text, stream = False):
+    body = build_request(provider = provider, model_name = MODELS[provider], messages = messages(text), stream = stream)[3]
+    return "".join(fake._answer(body))
+
+
+class Traffic:
+    """Middleware recording in-flight requests and client connections seen by the fake"""
+
+    def __init__(self):
+        self.in_flight = self.peak = 0
+        self.peers = set()
+
+        @web.middleware
+        async def middleware(request, handler):
+            return await self.track(request, handler)
+        self.middleware = middleware
+
+    async def track(self, request, handler):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+
+def test_every_provider_answers_and_streams(fake_llm):
+    fake = FakeLLM(UpstreamProfile(), tokens = 5)
+
+    async def test(url):
+        for provider, model_name in MODELS.items():
+            assert await llm_answer(provider, model_name, messages("hi")) == (expected(fake, provider, "hi"), 200)
+
+            events = [event async for event in llm_stream(provider, model_name, messages("hi"))]
+            assert events[-1] == {"type": "done", "status_code": 200}
+            text = "".join(event["text"] for event in events if event["type"] == "delta")
+            assert text == expected(fake, provider, "hi", stream = True)
+    fake_llm(test, fake)
+
+
+def test_concurrent_calls_share_keep_alive_connections(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_CONNECTIONS", 10)
+    traffic = Traffic()
+
+    async def test(url):
+        # Gọi lần lượt: mọi request dùng lại một kết nối
+        for i in range(5):
+            assert (await llm_answer("openai", MODELS["openai"], messages(str(i))))[1] == 200
+        assert len(traffic.peers) == 1
+
+        # 100 request đồng thời, mỗi request 0.2s: không chặn event loop, tối đa LLM_MAX_CONNECTIONS kết nối
+        started = time.perf_counter()
+        results = await asyncio.gather(*(llm_answer("openai", MODELS["openai"], messages(str(i))) for i in range(100)))
+        assert all(status_code == 200 for _, status_code in results)
+        assert time.perf_counter() - started < 100 * 0.2 / 5
+        assert traffic.peak == 10 and len(traffic.peers) <= 10
+    fake_llm(test, FakeLLM(UpstreamProfile(), tokens = 5, token_delay = 0.04), [traffic.middleware])
+
+
+def test_concurrency_is_bounded_per_provider(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_CONCURRENCY", 3)
+    traffic = Traffic()
+
+    async def test(url):
+        results = await asyncio.gather(*(llm_answer("claude", MODELS["claude"], messages(str(i))) for i in range(12)))
+        assert [status_code for _, status_code in results] == [200] * 12
+        assert traffic.peak == 3
+    fake_llm(test, FakeLLM(UpstreamProfile(), tokens = 5, token_delay = 0.01), [traffic.middleware])
+
+
+def test_upstream_failures_become_status_codes(fake_llm, monkeypatch):
+    async def test(url):
+        output, status_code = await llm_answer("gemini", MODELS["gemini"], messages("hi"))
+        assert status_code == 503 and "Service Unavailable" in output
+
+        events = [event async for event in llm_stream("deepseek", MODELS["deepseek"], messages("hi"))]
+        assert [(event["type"], event["status_code"]) for event in events] == [("error", 503)]
+    fake_llm(test, FakeLLM(UpstreamProfile(error_rate = 1.0), tokens = 5))
+
+    monkeypatch.setattr(settings, "LLM_TIMEOUT", 0.1)
+
+    async def slow(url):
+        assert (await llm_answer("openai", MODELS["openai"], messages("hi")))[1] == 504
+    fake_llm(slow, FakeLLM(UpstreamProfile(latency = 0.5), tokens = 5))
+
+    async def unreachable(url):
+        monkeypatch.setattr(settings, "OPENAI_API_URL", "http://127.0.0.1:1/v1")
+        assert (await llm_answer("openai", MODELS["openai"], messages("hi")))[1] == 502
+    fake_llm(unreachable)
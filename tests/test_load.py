@@ -0,0 +1,12 @@
+import main
+from benchmarks.load import build_scenarios
+from benchmarks.synthetic import SyntheticRepo
+
+
+def test_scenarios_cover_every_endpoint():
+    scenarios = build_scenarios(SyntheticRepo(files = 20, commits = 10), batch_size = 2)
+    covered = {(build(0)["method"], build(0)["path"]) for build in scenarios.values()}
+    endpoints = {
+        (method.upper(), path) for path, operations in main.app.openapi()["paths"].items() for method in operations
+    }
+    assert endpoints | {("GET", "/metrics")} <= covered
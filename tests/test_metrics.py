@@ -0,0 +1,31 @@
+import re
+
+from fastapi.testclient import TestClient
+
+import main
+from services.service_metrics import Registry
+
+
+def test_collector_samples_keep_their_type():
+    registry = Registry()
+    registry.collector(lambda: [
+        ("jobs_total", "counter", "Jobs done", {"queue": "a"}, 3),
+        ("jobs_total", "counter", "Jobs done", {"queue": "b"}, 1),
+        ("jobs_pending", "gauge", "Jobs waiting", {}, 2),
+    ])
+    assert registry.render().splitlines() == [
+        "# HELP jobs_total Jobs done", "# TYPE jobs_total counter",
+        'jobs_total{queue="a"} 3', 'jobs_total{queue="b"} 1',
+        "# HELP jobs_pending Jobs waiting", "# TYPE jobs_pending gauge",
+        "jobs_pending 2",
+    ]
+
+
+def test_running_totals_are_exposed_as_counters():
+    with TestClient(main.app) as client:
+        text = client.get("/metrics").text
+    types = dict(re.findall(r"^# TYPE (\S+) (\S+)$", text, re.M))
+    assert types["cache_hits_total"] == types["cache_misses_total"] == types["cache_evictions_total"] == "counter"
+    assert types["cache_hit_ratio"] == types["webhook_pending"] == "gauge"
+    # Prometheus: counter có hậu tố _total, gauge thì không
+    assert all((kind == "counter") == name.endswith("_total") for name, kind in types.items() if kind in ("counter", "gauge"))
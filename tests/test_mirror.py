@@ -0,0 +1,219 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from services.service_mirror import GitError, MirrorStore, RepoMirror
+
+
+def git(cwd, *args):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "dev", "GIT_AUTHOR_EMAIL": "dev@example.com",
+        "GIT_COMMITTER_NAME": "dev", "GIT_COMMITTER_EMAIL": "dev@example.com",
+    }
+    return subprocess.run(("git", *args), cwd = cwd, env = env, check = True, capture_output = True, text = True).stdout.strip()
+
+
+def commit(work, message, files = (), removed = ()):
+    for path, text in dict(files).items():
+        os.makedirs(os.path.dirname(os.path.join(work, path)) or work, exist_ok = True)
+        with open(os.path.join(work, path), "w") as file:
+            file.write(text)
+    for path in removed:
+        git(work, "rm", "-q", path)
+    git(work, "add", "-A")
+    git(work, "commit", "-q", "-m", message)
+    return git(work, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Bare repository with three commits on main, a tag and a dev branch"""
+    work = str(tmp_path / "work")
+    git(str(tmp_path), "init", "-q", "-b", "main", work)
+    shas = [
+        commit(work, "add files", {"README.md": "hello\n", "src/app.py": "print(1)\n"}),
+        commit(work, "edit app", {"src/app.py": "print(2)\n"}),
+    ]
+    git(work, "tag", "v1")
+    os.makedirs(os.path.join(work, "docs"))
+    git(work, "mv", "README.md", "docs/README.md")
+    shas.append(commit(work, "move readme", {"src/util.py": "x = 1\n"}))
+    git(work, "branch", "dev", shas[0])
+    bare = str(tmp_path / "repo.git")
+    git(str(tmp_path), "clone", "-q", "--bare", work, bare)
+    return bare, shas
+
+
+def run(mirror, test):
+    async def main():
+        await mirror.load_refs()
+        try:
+            return await test()
+        finally:
+            await mirror.close_cat_file()
+    return asyncio.run(main())
+
+
+def test_resolve(repo):
+    bare, shas = repo
+    mirror = RepoMirror("bench/repo", bare)
+
+    async def test():
+        assert await mirror.resolve("main") == shas[2]
+        assert await mirror.resolve("refs/heads/dev") == shas[0]
+        assert await mirror.resolve("v1") == shas[1]
+        assert await mirror.resolve(shas[1]) == shas[1]
+        assert await mirror.resolve(shas[1][:10]) == shas[1]
+        assert await mirror.resolve("main~1") == shas[1]
+        assert await mirror.resolve("missing") is None
+        assert await mirror.resolve("--output=/tmp/x") is None
+    run(mirror, test)
+
+
+def test_tree_and_blob(repo):
+    bare, shas = repo
+    mirror = RepoMirror("bench/repo", bare)
+
+    async def test():
+        tree = await mirror.tree(shas[2])
+        assert set(tree) == {"docs/README.md", "src/app.py", "src/util.py"}
+        sha, size = tree["src/app.py"]
+        assert size == len("print(2)\n")
+        assert await mirror.read_blob(sha) == b"print(2)\n"
+        # Process cat-file được dùng lại cho lần đọc sau
+        assert await mirror.read_blob(tree["src/util.py"][0]) == b"x = 1\n"
+        with pytest.raises(GitError):
+            await mirror.read_blob("0" * 40)
+        with pytest.raises(GitError):
+            await mirror.tree("--output=/tmp/x")
+    run(mirror, test)
+
+
+def test_list_commits(repo):
+    bare, shas = repo
+    mirror = RepoMirror("bench/repo", bare)
+
+    async def test():
+        commits = await mirror.list_commits({"sha": shas[2]}, 1, 100)
+        assert [c["sha"] for c in commits] == shas[::-1]
+        assert commits[0]["commit"]["message"] == "move readme"
+        assert commits[0]["parents"] == [{"sha": shas[1]}]
+        assert commits[0]["commit"]["author"]["email"] == "dev@example.com"
+
+        page = await mirror.list_commits({"sha": shas[2]}, 2, 1)
+        assert [c["sha"] for c in page] == [shas[1]]
+        by_path = await mirror.list_commits({"sha": shas[2], "path": "src/app.py"}, 1, 100)
+        assert [c["sha"] for c in by_path] == [shas[1], shas[0]]
+        by_dir = await mirror.list_commits({"sha": shas[2], "path": "docs/"}, 1, 100)
+        assert [c["sha"] for c in by_dir] == [shas[2]]
+    run(mirror, test)
+
+
+def test_list_commits_rejects_options(repo, tmp_path):
+    bare, shas = repo
+    mirror = RepoMirror("bench/repo", bare)
+    target = tmp_path / "PWNED"
+
+    async def test():
+        with pytest.raises(GitError):
+            await mirror.list_commits({"sha": f"--output={target}"}, 1, 100)
+        with pytest.raises(GitError):
+            await mirror.compare(f"--output={target}", shas[2])
+    run(mirror, test)
+    assert not target.exists()
+
+
+def test_commit_and_compare(repo):
+    bare, shas = repo
+    mirror = RepoMirror("bench/repo", bare)
+
+    async def test():
+        root = await mirror.commit(shas[0])
+        assert sorted(file["filename"] for file in root["files"]) == ["README.md", "src/app.py"]
+        assert all(file["status"] == "added" for file in root["files"])
+
+        moved = await mirror.commit("main")
+        files = {file["filename"]: file for file in moved["files"]}
+        assert files["docs/README.md"]["status"] == "renamed"
+        assert files["docs/README.md"]["previous_filename"] == "README.md"
+        assert files["src/util.py"]["status"] == "added"
+        assert files["src/util.py"]["patch"] == "@@ -0,0 +1 @@\n+x = 1"
+        assert await mirror.commit("missing") is None
+
+        compare = await mirror.compare(shas[0], shas[2])
+        assert compare["total_commits"] == 2
+        assert [c["sha"] for c in compare["commits"]] == shas[1:]
+        changed = {file["filename"]: file for file in compare["files"]}
+        assert set(changed) == {"docs/README.md", "src/app.py", "src/util.py"}
+        assert changed["src/app.py"]["additions"] == 1 and changed["src/app.py"]["deletions"] == 1
+    run(mirror, test)
+
+
+def test_cancelled_blob_read_does_not_break_the_next_read(repo, tmp_path):
+    bare, shas = repo
+    work = str(tmp_path / "work")
+    big = "".join(f"line {i}\n" for i in range(600000))   # ~5 MB, lớn hơn buffer của pipe
+    head = commit(work, "big file", {"big.txt": big})
+    git(work, "push", "-q", bare, "main")
+    mirror = RepoMirror("bench/repo", bare)
+
+    async def test():
+        tree = await mirror.tree(head)
+        big_sha, small_sha = tree["big.txt"][0], tree["src/app.py"][0]
+        assert await mirror.read_blob(small_sha) == b"print(2)\n"
+
+        # Huỷ khi thân blob đang được đọc: phần còn lại nằm trong pipe
+        reading, stdout = asyncio.Event(), mirror._cat_file.stdout
+        readexactly = stdout.readexactly
+        def signal(n):
+            reading.set()
+            return readexactly(n)
+        stdout.readexactly = signal
+        read = asyncio.ensure_future(mirror.read_blob(big_sha))
+        await reading.wait()
+        await asyncio.sleep(0.01)
+        read.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await read
+        assert mirror._cat_file is None
+
+        assert await mirror.read_blob(small_sha) == b"print(2)\n"
+        assert await mirror.read_blob(big_sha) == big.encode()
+
+        # Process đang bị chặn khi ghi ra stdout: close_cat_file không được treo
+        mirror._cat_file.stdin.write(f"{big_sha}\n".encode())
+        await asyncio.wait_for(mirror.close_cat_file(), timeout = 5)
+        assert mirror._cat_file is None
+    run(mirror, test)
+
+
+def test_unknown_revisions_do_not_trigger_fetches(repo, tmp_path):
+    bare, shas = repo
+    store = MirrorStore(str(tmp_path / "mirrors"), refresh_interval = 3600, remote_url = bare)
+    gh, syncs = type("Client", (), {"access_token": "token"})(), []
+    sync = store._sync
+
+    async def counted(gh, mirror):
+        syncs.append(mirror.full_name)
+        await sync(gh, mirror)
+    store._sync = counted
+
+    async def test():
+        try:
+            _, sha = await store.resolve(gh, "bench/repo", "main")
+            assert sha == shas[2] and len(syncs) == 1
+            for rev in ("no-such-branch", "f" * 12, "--all"):
+                assert (await store.resolve(gh, "bench/repo", rev))[1] is None
+            # SHA đầy đủ chưa có: chỉ fetch lại sau MISS_REFRESH_INTERVAL
+            assert (await store.resolve(gh, "bench/repo", "f" * 40))[1] is None
+            assert len(syncs) == 1
+            store._mirrors["bench/repo"].fetched_at -= 3000
+            assert (await store.resolve(gh, "bench/repo", "f" * 40))[1] is None
+            assert (await store.resolve(gh, "bench/repo", "e" * 40))[1] is None
+            assert len(syncs) == 2
+        finally:
+            await store.close()
+    asyncio.run(test())
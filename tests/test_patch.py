@@ -0,0 +1,101 @@
+import pytest
+
+from benchmarks.synthetic import SyntheticRepo
+from services.service_github import GitHubRepo
+from utils.patch import PatchError, apply_patch, make_patch, parse_hunks, split_lines
+
+
+def lines(*numbers):
+    return "".join(f"line {i}\n" for i in numbers)
+
+
+def test_split_lines():
+    assert split_lines("") == ([], True)
+    assert split_lines("a\nb\n") == (["a", "b"], True)
+    assert split_lines("a\r\nb") == (["a\r", "b"], False)
+
+
+def test_parse_hunks():
+    patch = "@@ -1,2 +1,2 @@\n a\n-b\n+B\n@@ -9 +9,0 @@\n-x\n\\ No newline at end of file"
+    assert parse_hunks(patch) == [
+        (1, 1, [(" ", "a"), ("-", "b"), ("+", "B")]),
+        (9, 9, [("-", "x"), ("\\", " No newline at end of file")]),
+    ]
+
+
+MULTI_HUNK = (
+    lines(*range(20)),
+    lines(0, 1, 2, 4, 5, *range(6, 15), 99, *range(15, 20)),
+    "@@ -1,7 +1,6 @@\n line 0\n line 1\n line 2\n-line 3\n line 4\n line 5\n line 6\n"
+    "@@ -13,6 +12,7 @@\n line 12\n line 13\n line 14\n+line 99\n line 15\n line 16\n line 17",
+)
+
+
+@pytest.mark.parametrize("before, after, patch", [
+    MULTI_HUNK,
+    ("", "new\nfile\n", "@@ -0,0 +1,2 @@\n+new\n+file"),
+    ("old\nfile\n", "", "@@ -1,2 +0,0 @@\n-old\n-file"),
+    ("a\nb", "a\nb\n", "@@ -1,2 +1,2 @@\n a\n-b\n\\ No newline at end of file\n+b"),
+    ("a\nb\n", "a\nc", "@@ -1,2 +1,2 @@\n a\n-b\n+c\n\\ No newline at end of file"),
+    ("a\nb", "x\nb", "@@ -1,2 +1,2 @@\n-a\n+x\n b\n\\ No newline at end of file"),
+    ("", "x", "@@ -0,0 +1 @@\n+x\n\\ No newline at end of file"),
+])
+def test_patch_round_trip(before, after, patch):
+    assert make_patch(before, after)[0] == patch
+    assert apply_patch(before, patch) == after
+    assert apply_patch(after, patch, reverse = True) == before
+
+
+def test_make_patch_counts_lines():
+    assert make_patch(*MULTI_HUNK[:2])[1:] == (1, 1)
+    assert make_patch("", "a\nb\n")[1:] == (2, 0)
+    assert make_patch("a\n", "a\n") == ("", 0, 0)
+
+
+def test_patch_without_space_on_empty_context_lines():
+    # Một số diff bỏ dấu cách đầu dòng của dòng context rỗng
+    assert apply_patch("a\n\nb\n", "@@ -1,3 +1,3 @@\n a\n\n-b\n+c") == "a\n\nc\n"
+
+
+@pytest.mark.parametrize("text, patch", [
+    ("a\nB\nc\n", "@@ -1,3 +1,3 @@\n a\n-b\n+x\n c"),              # dòng bị xoá không khớp
+    ("z\nb\nc\n", "@@ -1,3 +1,3 @@\n a\n-b\n+x\n c"),              # context không khớp
+    ("a\n", "@@ -5,2 +5,2 @@\n e\n-f\n+g"),                        # hunk ngoài file
+    (lines(*range(10)), "@@ -8 +8 @@\n-line 7\n+x\n@@ -2 +2 @@\n-line 1\n+y"),   # hunk sai thứ tự
+])
+def test_mismatched_patches_raise(text, patch):
+    with pytest.raises(PatchError):
+        apply_patch(text, patch)
+
+
+def test_timeline_falls_back_to_the_blob_when_the_rebuilt_version_disagrees(fake_github):
+    repo = SyntheticRepo(files = 10, commits = 30)
+    file = max(range(10), key = lambda i: len(repo.touches[i]))
+    path, touches = repo.paths[file], repo.touches[file]
+    corrupted = touches[-2]
+    file_change = repo.file_change
+
+    def tampered(index, before, after):
+        entry = file_change(index, before, after)
+        if index == file and after == corrupted and "patch" in entry:
+            # Dòng bị xoá sai: đảo ngược patch vẫn chạy được nhưng ra nội dung khác blob
+            entry["patch"] = "\n".join(line + " tampered" if line.startswith("-") else line for line in entry["patch"].split("\n"))
+        return entry
+    repo.file_change = tampered
+
+    async def test(server):
+        gh = GitHubRepo("token")
+        try:
+            versions = [version async for version in await gh.iter_file_timeline(repo.full_name, path)]
+        finally:
+            gh.close()
+        assert [version["commit_id"] for version in versions] == [repo.shas[commit] for commit in reversed(touches)]
+        sources = {version["commit_id"]: version["source"] for version in versions}
+        for commit in touches:
+            assert next(v for v in versions if v["commit_id"] == repo.shas[commit])["content"] == repo.content(file, commit).decode()
+        # Phiên bản trước commit bị sửa patch được tải lại từ blob, các phiên bản khác dựng từ patch
+        previous = touches[touches.index(corrupted) - 1]
+        assert sources[repo.shas[previous]] == "blob"
+        assert sources[repo.shas[touches[-1]]] == "blob"
+        assert all(source == "patch" for sha, source in sources.items() if sha not in (repo.shas[previous], repo.shas[touches[-1]]))
+    fake_github(test, repo)
@@ -0,0 +1,99 @@
+import asyncio
+import zlib
+
+import brotli
+import msgpack
+import orjson
+import zstandard
+from fastapi.responses import Response, StreamingResponse
+
+from api.responses import CompressionMiddleware, choose_encoding, stream_json_object, stream_msgpack_map, wants_msgpack
+
+DECOMPRESSORS = {
+    "gzip": lambda: zlib.decompressobj(31).decompress,
+    "br": lambda: brotli.Decompressor().process,
+    "zstd": lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+}
+
+
+def call(response, accept_encoding, min_size = 0):
+    """Messages sent by ``CompressionMiddleware`` around ``response``"""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(lambda *args: response(*args), min_size = min_size)(scope, receive, send))
+    return dict(messages[0]["headers"]), [message.get("body", b"") for message in messages[1:]]
+
+
+def lines(count):
+    async def body():
+        for i in range(count):
+            yield b'{"line": %d}\n' % i
+    return body()
+
+
+def test_choose_encoding():
+    encodings = ["zstd", "br", "gzip"]
+    assert choose_encoding("gzip, br, zstd", encodings) == "zstd"
+    assert choose_encoding("gzip;q=0.5, br;q=0.9", encodings) == "br"
+    assert choose_encoding("zstd;q=0, *", encodings) == "br"
+    assert choose_encoding("identity", encodings) is None
+    assert choose_encoding("", encodings) is None
+
+
+def test_ndjson_is_compressed_and_flushed_per_chunk():
+    for encoding, decompressor in DECOMPRESSORS.items():
+        headers, chunks = call(StreamingResponse(lines(3), media_type = "application/x-ndjson"), encoding)
+        assert headers[b"content-encoding"] == encoding.encode()
+        assert headers[b"vary"] == b"Accept-Encoding"
+        decompress = decompressor()
+        # Mỗi dòng giải nén được ngay khi nhận, không phải chờ hết stream
+        assert [decompress(chunk) for chunk in chunks[:3]] == [b'{"line": %d}\n' % i for i in range(3)]
+
+
+def test_sse_is_not_compressed():
+    headers, chunks = call(StreamingResponse(lines(3), media_type = "text/event-stream"), "gzip, br, zstd")
+    assert b"content-encoding" not in headers
+    assert b"".join(chunks) == b"".join(b'{"line": %d}\n' % i for i in range(3))
+
+
+def test_small_and_unaccepted_bodies_are_sent_as_is():
+    headers, chunks = call(Response(b'{"a": 1}', media_type = "application/json"), "gzip", min_size = 1024)
+    assert b"content-encoding" not in headers and chunks == [b'{"a": 1}']
+
+    body = b"x" * 4096
+    headers, chunks = call(Response(body, media_type = "application/json"), "identity")
+    assert b"content-encoding" not in headers and chunks == [body]
+
+    headers, chunks = call(Response(body, media_type = "application/json"), "gzip")
+    assert headers[b"content-encoding"] == b"gzip"
+    assert int(headers[b"content-length"]) == len(chunks[0])
+    assert zlib.decompress(chunks[0], 31) == body
+
+
+def test_wants_msgpack():
+    assert wants_msgpack("application/msgpack")
+    assert wants_msgpack("application/x-msgpack, application/json")
+    assert not wants_msgpack("application/json;q=1, application/msgpack;q=0.5")
+    assert not wants_msgpack("*/*")
+    assert not wants_msgpack(None)
+
+
+def test_streamed_object_and_map():
+    items = [("a.py", "print(1)\n"), ("b.md", None), ("c/d.txt", "é" * 10)]
+
+    async def pairs():
+        for item in items:
+            yield item
+
+    async def collect(body):
+        return b"".join([chunk async for chunk in body])
+
+    assert orjson.loads(asyncio.run(collect(stream_json_object(pairs())))) == dict(items)
+    assert msgpack.unpackb(asyncio.run(collect(stream_msgpack_map(len(items), pairs())))) == dict(items)
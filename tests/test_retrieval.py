@@ -0,0 +1,130 @@
+import asyncio
+import math
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from configs.config import settings
+from services.service_github import TreeIndex
+from services.service_retrieval import BM25Index, RetrievalIndexes, estimate_tokens, split_chunks, tokenize
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("getUserName", ["getusername", "get", "user", "name"]),
+    ("user_name = 1", ["user_name", "user", "name"]),
+    ("HTTPServer2", ["httpserver2", "http", "server"]),
+    ("x = y + 42", ["42"]),
+    ("parse_HTTP_response()", ["parse_http_response", "parse", "http", "response"]),
+    ("café", ["caf"]),
+])
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+
+def test_split_chunks_count_path_terms_in_every_chunk():
+    chunks = split_chunks("src/auth.py", "def login():\n    pass\nlogin()\n", 2)
+    assert [(start, end) for start, end, _ in chunks] == [(1, 2), (3, 3)]
+    assert chunks[0][2] == Counter({"def": 1, "login": 1, "pass": 1, "src": 1, "auth": 1, "py": 1})
+    assert chunks[1][2] == Counter({"login": 1, "src": 1, "auth": 1, "py": 1})
+    assert split_chunks("a", "", 2) == []
+
+
+def build(files, chunk_lines = 2):
+    index = BM25Index()
+    for path, text in files.items():
+        index.add(path, zlib.compress(text.encode()), split_chunks(path, text, chunk_lines))
+    return index
+
+
+def test_bm25_scores():
+    index = build({
+        "a": "token token\nother\n",
+        "b": "token\nrare\n",
+        "c": "padding words here\nmore padding words\n",
+    })
+    lengths, average = list(index.lengths), index.total_length / len(index.lengths)
+
+    def expected(chunk_id, terms):
+        score = 0.0
+        for term, df in terms:
+            tf = dict(zip(*index.postings[term])).get(chunk_id)
+            if not tf:
+                continue
+            idf = math.log(1 + (3 - df + 0.5) / (df + 0.5))
+            norm = BM25Index.K1 * (1 - BM25Index.B + BM25Index.B * lengths[chunk_id] / average)
+            score += idf * tf * (BM25Index.K1 + 1) / (tf + norm)
+        return score
+
+    top = index.top("token rare missing", 10)
+    assert [chunk_id for _, chunk_id in top] == [1, 0]
+    for score, chunk_id in top:
+        assert score == pytest.approx(expected(chunk_id, [("token", 2), ("rare", 1)]))
+    # Term lặp lại trong query chỉ tính một lần; term hiếm có idf cao hơn
+    assert index.top("token token", 10) == index.top("token", 10)
+    assert index.top("rare", 1)[0][0] > index.top("token", 1)[0][0]
+    assert index.top("missing", 10) == []
+    assert BM25Index().top("token", 10) == []
+
+
+def test_bm25_prefers_shorter_chunks_and_saturates_term_frequency():
+    index = build({"short": "needle\n", "long": "needle filler filler filler filler filler\n", "many": "needle " * 50}, chunk_lines = 10)
+    scores = {index.paths[index.chunk_range(chunk_id)[0]]: score for score, chunk_id in index.top("needle", 10)}
+    assert scores["short"] > scores["long"]
+    # tf bão hoà: 50 lần xuất hiện không cho điểm gấp 50 lần
+    assert scores["many"] < (BM25Index.K1 + 1) * scores["short"]
+
+
+class FakeClient:
+    def __init__(self, files):
+        self.files = {path: text.encode() for path, text in files.items()}
+        self.repo = SimpleNamespace(full_name = "bench/repo", default_branch = "main")
+
+    async def get_repo(self, repo_name):
+        return self.repo if repo_name == "bench/repo" else None
+
+    async def get_tree_index(self, repo, branch):
+        return TreeIndex(commit_sha = "c" * 40, blobs = {path: (path, len(data)) for path, data in self.files.items()})
+
+    async def get_blob(self, owner, name, sha):
+        return self.files[sha]
+
+
+def retrieve(files, query, **kwargs):
+    return asyncio.run(RetrievalIndexes(max_indexes = 2).retrieve(FakeClient(files), "bench/repo", query, **kwargs))
+
+
+def test_retrieve_merges_adjacent_chunks_best_first(monkeypatch):
+    monkeypatch.setattr(settings, "RAG_CHUNK_LINES", 2)
+    lines = ["def load_config():", "    return read_config()", "def read_config():", "    return {}", "x = 1", "y = 2", "z = 3", "w = 4"]
+    files = {"app/loader.py": "\n".join(lines) + "\n", "README.md": "see loader\n", "logo.png": "\0binary read_config"}
+    result = retrieve(files, "read_config", top_k = 5, max_tokens = 1000)
+
+    assert result["repo"] == "bench/repo" and result["commit"] == "c" * 40
+    # Chunk 1-2 và 3-4 cùng khớp và liền nhau: gộp thành một đoạn; file nhị phân không được index
+    assert [(s["path"], s["start_line"], s["end_line"]) for s in result["sources"]] == [("app/loader.py", 1, 4)]
+    header, block = result["context"].split("\n\n")
+    assert block == "### app/loader.py (lines 1-4)\n```\n" + "\n".join(lines[:4]) + "\n```"
+    assert result["context_tokens"] == estimate_tokens(header) + estimate_tokens(block)
+
+    # Path term được tính trong mọi chunk: README khớp "loader" qua nội dung, loader.py qua path
+    sources = retrieve(files, "loader", top_k = 10, max_tokens = 1000)["sources"]
+    assert {s["path"] for s in sources} == {"README.md", "app/loader.py"}
+    assert sources == sorted(sources, key = lambda s: -s["score"])
+
+
+def test_retrieve_skips_chunks_over_the_budget(monkeypatch):
+    monkeypatch.setattr(settings, "RAG_CHUNK_LINES", 50)
+    files = {"big.py": "needle needle\n" * 50 + "filler line of code\n" * 100, "small.py": "needle\n"}
+    full = retrieve(files, "needle", top_k = 5, max_tokens = 10000)
+    assert [(s["path"], s["start_line"], s["end_line"]) for s in full["sources"]] == [("big.py", 1, 50), ("small.py", 1, 1)]
+
+    # Chunk tốt nhất của big.py vượt budget: bị bỏ qua, chunk nhỏ hơn phía sau vẫn được thêm
+    budget = retrieve(files, "needle", top_k = 5, max_tokens = 100)
+    assert [s["path"] for s in budget["sources"]] == ["small.py"]
+    assert budget["context_tokens"] <= 100
+
+    nothing = retrieve(files, "absent", top_k = 5, max_tokens = 100)
+    assert nothing["sources"] == [] and nothing["context"] is None and nothing["context_tokens"] == 0
+    assert asyncio.run(RetrievalIndexes(max_indexes = 1).retrieve(FakeClient(files), "bench/other", "needle")) is None
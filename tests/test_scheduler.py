@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from benchmarks.synthetic import SyntheticRepo
+from services.service_github import GitHubRepo, TreeIndex
+from services.service_scheduler import BULK, INTERACTIVE, GitHubRateLimited, GitHubScheduler
+
+
+def scheduler(**kwargs):
+    return GitHubScheduler(**{"max_in_flight": 2, "bulk_reserve": 5, "max_wait": 1, "retries": 1, **kwargs})
+
+
+def test_slot_applies_quota_and_reserve():
+    async def main():
+        gate = scheduler()
+        budget = gate.budget("token")
+        budget.remaining, budget.reset_at = 0, time.time() + 3600
+        with pytest.raises(GitHubRateLimited) as error:
+            async with gate.slot("token"):
+                pass
+        assert error.value.retry_after > 3000
+        assert gate.rejected == 1
+
+        # Phần quota dự trữ chỉ dành cho request tương tác
+        budget.remaining = 3
+        with pytest.raises(GitHubRateLimited):
+            async with gate.slot("token", BULK):
+                pass
+        async with gate.slot("token", INTERACTIVE):
+            assert budget.limiter.active == 1
+        assert budget.remaining == 2 and budget.limiter.active == 0
+    asyncio.run(main())
+
+
+def test_slot_waits_for_in_flight_limit_by_priority():
+    async def main():
+        gate, order = scheduler(max_in_flight = 1), []
+
+        async def hold(name, priority, started = None):
+            async with gate.slot("token", priority):
+                order.append(name)
+                if started is not None:
+                    started.set()
+                    await asyncio.sleep(0.05)
+
+        started = asyncio.Event()
+        first = asyncio.ensure_future(hold("first", BULK, started))
+        await started.wait()
+        bulk = asyncio.ensure_future(hold("bulk", BULK))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(hold("interactive", INTERACTIVE))
+        await asyncio.gather(first, bulk, interactive)
+        assert order == ["first", "interactive", "bulk"]
+    asyncio.run(main())
+
+
+def test_run_retries_short_rate_limits():
+    async def main():
+        gate, attempts = scheduler(), []
+
+        async def send():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise GitHubRateLimited(0)
+            return "ok"
+
+        assert await gate.run("token", send) == "ok"
+        assert len(attempts) == 2
+
+        async def limited():
+            raise GitHubRateLimited(0)
+        with pytest.raises(GitHubRateLimited):
+            await gate.run("token", limited)
+    asyncio.run(main())
+
+
+async def bench_calls(server_url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{server_url}/_bench/calls?reset=1") as response:
+            return await response.json()
+
+
+def test_tarball_download_respects_token_budget(fake_github):
+    repo = SyntheticRepo(files = 20, commits = 5)
+
+    async def test(server):
+        from configs.config import settings
+        gh = GitHubRepo("token-quota")
+        try:
+            # 3 request: hết quota của token trong cửa sổ hiện tại
+            github_repo = await gh.get_repo("bench/repo")
+            await gh.get_langauges("bench/repo")
+            await gh.resolve_commit(github_repo, "main")
+            await bench_calls(settings.GITHUB_API_URL)
+            with pytest.raises(GitHubRateLimited):
+                async with gh.stream(f"/repos/bench/repo/tarball/{'main'}"):
+                    pass
+            assert await bench_calls(settings.GITHUB_API_URL) == {}
+        finally:
+            gh.close()
+    fake_github(test, repo, rate_limit = 3)
+
+
+def test_contents_fallback_and_languages_use_rest_client(fake_github):
+    repo = SyntheticRepo(files = 20, commits = 5)
+
+    async def test(server):
+        from configs.config import settings
+        gh = GitHubRepo("token-fallback")
+        try:
+            github_repo = await gh.get_repo("bench/repo")
+            head = repo.shas[repo.resolve("main")]
+            # Tree bị cắt bớt: file không có trong index, phải hỏi contents API
+            index = TreeIndex(commit_sha = head, blobs = {}, truncated = True)
+            semaphore = asyncio.Semaphore(4)
+            path = repo.paths[1]
+            expected = repo.content(1, repo.version(1, repo.resolve("main"))).decode()
+            await bench_calls(settings.GITHUB_API_URL)
+            assert await gh._fetch_file(github_repo, index, path, None, semaphore) == expected
+            assert await gh._fetch_file(github_repo, index, "missing.py", None, semaphore) is None
+            assert await gh._fetch_file(github_repo, index, repo.paths[0], None, semaphore) is None   # file .png
+            calls = await bench_calls(settings.GITHUB_API_URL)
+            assert calls == {"GET /repos/{owner}/{repo}/contents/{path}": 3}
+
+            languages = await gh.get_langauges("bench/repo")
+            assert abs(sum(languages.values()) - 100) < 1e-6
+            assert await bench_calls(settings.GITHUB_API_URL) == {"GET /repos/{owner}/{repo}/languages": 1}
+        finally:
+            gh.close()
+    fake_github(test, repo)
@@ -0,0 +1,100 @@
+import re
+import zlib
+
+import pytest
+
+from services.service_search import RepoIndex, find_candidates, query_trigrams, required_literals, search_blobs, trigrams
+
+FILES = {
+    "a.py": "def foo():\n    return 'foo bar'\n",
+    "b.py": "FOO = 1\nx = foo\\x20bar\n",
+    "c.md": "# Title\nhello (world) [1] café\n",
+    "d.txt": "line one\nline two\n\tindented\n",
+}
+
+
+@pytest.mark.parametrize("pattern, literals", [
+    ("foobar", ["foobar"]),
+    (r"foo\.bar", ["foo.bar"]),
+    (r"foo\w+bar", ["foo", "bar"]),
+    ("foo.bar", ["foo", "bar"]),
+    ("colou?r", ["colo", "r"]),
+    ("ab{2,3}cd", ["a", "cd"]),
+    ("ab{x}", ["ab{x}"]),
+    ("foo(bar)?baz", ["foo", "baz"]),
+    ("foo|bar", []),
+    ("(foo|bar)baz", ["baz"]),
+    ("[abc]def", ["def"]),
+    (r"[]\]x]yz", ["yz"]),
+    ("^start$", ["start"]),
+    # Escape có tham số: bỏ qua cả tham số
+    (r"foo\x20bar", ["foo", "bar"]),
+    ("café ok", ["café ok"]),
+    (r"caf\U000000e9 ok", ["caf", " ok"]),
+    (r"a\N{SPACE}bcd", ["a", "bcd"]),
+    (r"(ab)\1cde", ["cde"]),
+    (r"ab\012cd", ["ab", "cd"]),
+])
+def test_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
+
+
+def test_trigrams_are_lowercased_and_distinct():
+    assert trigrams(b"ab") == set()
+    assert trigrams(b"ABCabc") == {int.from_bytes(gram, "big") for gram in (b"abc", b"bca", b"cab")}
+
+
+def build_index():
+    index = RepoIndex()
+    view = {}
+    for path, text in FILES.items():
+        data = text.encode()
+        view[path] = index.add(path, zlib.compress(data), trigrams(data))
+    return index.snapshot(view)
+
+
+def test_find_candidates_intersects_postings():
+    _, _, postings = snapshot = build_index()
+    assert find_candidates(postings, set()) is None
+    assert find_candidates(postings, trigrams(b"foo")) == {snapshot[0]["a.py"], snapshot[0]["b.py"]}
+    assert find_candidates(postings, trigrams(b"foo bar")) == {snapshot[0]["a.py"]}
+    assert find_candidates(postings, trigrams(b"zzz")) == set()
+
+
+@pytest.mark.parametrize("query, regex, case_sensitive", [
+    ("foo", False, False),
+    ("FOO", False, True),
+    ("foo bar", False, False),
+    (r"foo\x20bar", True, False),
+    (r"foo bar", True, False),
+    (r"foo\N{SPACE}bar", True, False),
+    (r"foo\\x20bar", True, False),
+    ("café", False, False),
+    ("CAFÉ", False, False),
+    (r"\(world\) \[1\]", True, False),
+    (r"line (one|two)", True, False),
+    (r"^\tindent", True, False),
+    (r"(?i)def\s+FOO", True, True),
+    ("(?x) foo \\x20 bar", True, False),
+    ("nothing here", False, False),
+])
+def test_prefilter_never_drops_a_matching_file(query, regex, case_sensitive):
+    """The trigram prefilter only narrows the files ``re`` would match anyway"""
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    pattern = re.compile(query if regex else re.escape(query), flags)
+    snapshot = build_index()
+
+    matches, _, matched_files, truncated = search_blobs(snapshot, query_trigrams(query, pattern, regex), pattern, None, 100)
+    expected = {path for path, text in FILES.items() if pattern.search(text)}
+    assert {match["path"] for match in matches} == expected
+    assert matched_files == len(expected) and not truncated
+
+
+def test_search_blobs_reports_lines_and_globs():
+    pattern = re.compile("line", re.MULTILINE)
+    matches, searched, _, _ = search_blobs(build_index(), query_trigrams("line", pattern, False), pattern, ["*.txt"], 100)
+    assert searched == 1
+    assert [(match["line"], match["column"], match["text"]) for match in matches] == [(1, 1, "line one"), (2, 1, "line two")]
+
+    matches, _, _, truncated = search_blobs(build_index(), set(), pattern, None, 1)
+    assert len(matches) == 1 and truncated
@@ -0,0 +1,91 @@
+import asyncio
+
+import aiohttp
+from fastapi.testclient import TestClient
+
+import main
+
+from benchmarks.common import UpstreamProfile
+from benchmarks.fake_github import FakeGitHub
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.synthetic import SyntheticRepo
+from configs.config import settings
+from services import service_base
+from services.service_github import GitHubRepo
+from tests.conftest import serve
+
+
+def test_download_errors_are_reported_per_file(fake_llm, monkeypatch):
+    monkeypatch.setattr(settings, "GITHUB_MAX_CONCURRENCY", 3)
+    repo = SyntheticRepo(files = 40, commits = 5)
+
+    async def test(url):
+        runner, github_url = await serve(FakeGitHub(repo, UpstreamProfile()).app())
+        monkeypatch.setattr(settings, "GITHUB_API_URL", github_url)
+        gh = GitHubRepo("token")
+        index = await gh.get_tree_index(await gh.get_repo(repo.full_name), "main")
+        broken = sorted(path for path in index.blobs if path.endswith(".py"))[:2]
+        get_blob, in_flight, peak = gh.get_blob, [0], [0]
+
+        async def flaky_get_blob(owner, name, sha, *args, **kwargs):
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+            try:
+                await asyncio.sleep(0.01)
+                if sha == index.blobs[broken[0]][0]:
+                    raise aiohttp.ClientConnectionError("connection reset")
+                if sha == index.blobs[broken[1]][0]:
+                    raise TimeoutError()
+                return await get_blob(owner, name, sha, *args, **kwargs)
+            finally:
+                in_flight[0] -= 1
+        gh.get_blob = flaky_get_blob
+
+        try:
+            events = await service_base.retrieve_repo_info(gh, repo.full_name, refresh_cache = True)
+            result = [event async for event in events][-1]
+        finally:
+            gh.close()
+            await runner.cleanup()
+
+        assert result["type"] == "result"
+        assert result["errors"] == {
+            broken[0]: "Download failed: connection reset",
+            broken[1]: "Download failed: TimeoutError",
+        }
+        assert set(result["structure"]) == {path for path in index.blobs if path.endswith(".py")} - set(broken)
+        # Blob được tải qua semaphore GITHUB_MAX_CONCURRENCY, không phải một lượt cho mọi file
+        assert peak[0] <= 3
+
+    fake_llm(test, FakeLLM(UpstreamProfile(), tokens = 5))
+
+
+def test_prompt_fences_use_the_file_extension(monkeypatch):
+    prompts = []
+
+    async def chat_llm_retry(job, refresh_cache = False):
+        prompts.append(job["prompt"])
+        return {"status_code": 200, "output": "[]"}
+    monkeypatch.setattr(service_base, "chat_llm_retry", chat_llm_retry)
+
+    async def test():
+        assert await service_base.summarize_file("src/app.ts", "let x = 1", "openai", "gpt-4o-mini") == ([], None)
+        assert await service_base.summarize_file("README", "hello", "openai", "gpt-4o-mini") == ([], None)
+    asyncio.run(test())
+    assert prompts[0].startswith("File: src/app.ts\n```ts\nlet x = 1\n```")
+    assert "```python" not in "".join(prompts)
+
+
+def test_summarize_without_result_is_an_error(monkeypatch):
+    async def no_result(*args, **kwargs):
+        async def events():
+            yield {"type": "start"}
+        return events()
+    monkeypatch.setattr(service_base, "retrieve_repo_info", no_result)
+
+    with TestClient(main.app) as client:
+        response = client.post(
+            "/api/v1/summarize", params = {"repo_name": "bench/repo", "provider": "openai", "model_name": "gpt-4o-mini"},
+            headers = {"Authorization": "Bearer token"},
+        )
+    assert response.status_code == 502
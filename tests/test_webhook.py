@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import aiohttp
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.synthetic import SyntheticRepo
+from configs.config import settings
+from services import service_webhook
+from services.service_github import GitHubClientPool
+from services.service_webhook import WebhookProcessor, delivery_ref, ref_matcher, verify_signature, webhook_processor
+
+SECRET = "s3cret"
+API = settings.GITHUB_API_URL
+
+
+def sign(body, secret = SECRET):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def push(full_name = "octo/repo", branch = "main", after = "b" * 40, **extra):
+    return {"ref": f"refs/heads/{branch}", "before": "a" * 40, "after": after, "repository": {"full_name": full_name}, **extra}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(webhook_processor, "secret", SECRET)
+    # Không pre-warm thật: chỉ kiểm tra job được xếp hàng
+    monkeypatch.setattr(webhook_processor, "_enqueue", lambda key, payload: True)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def deliver(client, event, body, signature = None):
+    body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return client.post("/api/v1/webhook/github", content = body, headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-GitHub-Delivery": "delivery-1",
+        "X-Hub-Signature-256": signature or sign(body),
+    })
+
+
+def test_verify_signature():
+    body = b'{"zen": "x"}'
+    assert verify_signature(SECRET, body, sign(body))
+    assert not verify_signature(SECRET, body, sign(body, "other"))
+    assert not verify_signature(SECRET, body + b" ", sign(body))
+    assert not verify_signature(SECRET, body, sign(body)[len("sha256="):])
+    assert not verify_signature(None, body, sign(body))
+    assert not verify_signature(SECRET, body, None)
+
+
+def test_endpoint_rejects_bad_signature(client):
+    response = deliver(client, "push", push(), signature = sign(b"other body"))
+    assert response.status_code == 401
+
+
+def test_endpoint_without_secret(client, monkeypatch):
+    monkeypatch.setattr(webhook_processor, "secret", None)
+    assert deliver(client, "push", push()).status_code == 503
+
+
+@pytest.mark.parametrize("body", [b'{"zen": "x"}', b"not json", b"[]", b'"x"', json.dumps({"ref": 1, "repository": {"full_name": "o/r"}}).encode()])
+def test_endpoint_rejects_malformed_payloads(client, body):
+    response = deliver(client, "push", body)
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid webhook payload")
+
+
+def test_endpoint_ignores_other_events(client):
+    response = deliver(client, "ping", {"zen": "x"})
+    assert response.status_code == 202
+    assert response.json()["ignored"] is True
+
+
+def test_endpoint_handles_push(client):
+    response = deliver(client, "push", push())
+    assert response.status_code == 202
+    assert response.json() == {
+        "delivery": "delivery-1", "event": "push", "repository": "octo/repo", "branch": "main",
+        "invalidated": 0, "prewarm_queued": True
+    }
+
+
+def test_delivery_ref():
+    assert delivery_ref("push", push(branch = "feature/x")) == ("octo/repo", "feature/x")
+    assert delivery_ref("push", {**push(), "ref": "refs/tags/v1"}) == ("octo/repo", None)
+    assert delivery_ref("create", {"ref": "dev", "ref_type": "branch", "repository": {"full_name": "octo/repo"}}) == ("octo/repo", "dev")
+    assert delivery_ref("delete", {"ref": "v1", "ref_type": "tag", "repository": {"full_name": "octo/repo"}}) == ("octo/repo", None)
+    for payload in ({}, {"ref": "refs/heads/main"}, {"repository": {"full_name": "octo/repo"}}, {"ref": "x", "repository": "octo/repo"}, []):
+        with pytest.raises(ValueError):
+            delivery_ref("push", payload)
+
+
+def test_ref_matcher():
+    match = ref_matcher("Octo/Repo", "main")
+    base = f"{API}/repos/octo/repo"
+    for url in (base, f"{base}/branches", f"{base}/tags", f"{base}/branches/main", f"{base}/commits/main",
+                f"{base}/commits?sha=main&per_page=100", f"{base}/compare/main...feature", f"{base}/compare/dev...main"):
+        assert match(url), url
+    for url in (f"{base}/commits/{'a' * 40}", f"{base}/git/trees/{'a' * 40}?recursive=1", f"{base}/branches/dev",
+                f"{base}/commits?sha=dev", f"{base}/compare/dev...feature", f"{API}/repos/octo/other/branches/main"):
+        assert not match(url), url
+
+    # Tag / không có branch: chỉ danh sách ref và repo
+    tags = ref_matcher("octo/repo")
+    assert tags(f"{base}/tags") and tags(base)
+    assert not tags(f"{base}/branches/main") and not tags(f"{base}/commits?sha=main")
+
+
+def test_pushes_are_coalesced_and_bounded():
+    async def main():
+        processor = WebhookProcessor(secret = SECRET, workers = 0, queue_size = 2, max_files = 10)
+        assert processor.handle("push", push(after = "1" * 40))["prewarm_queued"]
+        # Push mới cho ref đang chờ chỉ thay payload của job cũ
+        assert processor.handle("push", push(after = "2" * 40))["prewarm_queued"]
+        assert processor.handle("push", push(branch = "dev"))["prewarm_queued"]
+        # Hàng đợi đầy: không pre-warm nhưng cache vẫn được xoá
+        assert not processor.handle("push", push(branch = "other"))["prewarm_queued"]
+        # Xoá branch hoặc push tag: không pre-warm
+        assert not processor.handle("push", push(branch = "gone", after = "0" * 40, deleted = True))["prewarm_queued"]
+        assert not processor.handle("push", {**push(), "ref": "refs/tags/v1"})["prewarm_queued"]
+
+        stats = processor.stats()
+        assert (stats["deliveries"], stats["queued"], stats["coalesced"], stats["dropped"], stats["pending"]) == (6, 2, 1, 1, 2)
+        assert processor._jobs[("octo/repo", "main")]["after"] == "2" * 40
+    asyncio.run(main())
+
+
+def test_prewarmed_tree_is_shared_across_tokens(fake_github, monkeypatch):
+    repo = SyntheticRepo(files = 30, commits = 5)
+    pool = GitHubClientPool(ttl = 60, max_size = 4)
+    monkeypatch.setattr(service_webhook, "github_pool", pool)
+    monkeypatch.setattr(settings, "GITHUB_TOKEN", "token-webhook")
+
+    async def test(server):
+        async def calls(reset = False):
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{settings.GITHUB_API_URL}/_bench/calls", params = {"reset": "1"} if reset else {}) as response:
+                    return await response.json()
+
+        processor = WebhookProcessor(secret = SECRET, workers = 0, queue_size = 2, max_files = 10)
+        await processor._prewarm(repo.full_name, "main", push(repo.full_name, after = repo.shas[-1]))
+        await calls(reset = True)
+        try:
+            # Token khác: quyền đọc repo vẫn được kiểm tra, branch và tree lấy từ cache đã pre-warm
+            gh = pool.get("token-client")
+            index = await gh.get_tree_index(await gh.get_repo(repo.full_name), "main")
+            assert index.commit_sha == repo.shas[-1]
+            assert await calls() == {"GET /repos/{owner}/{repo}": 1}
+        finally:
+            for client, _ in pool._clients.values():
+                client.close()
+    fake_github(test, repo)
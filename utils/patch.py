@@ -0,0 +1,113 @@
+import difflib
+import re
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_EOL = "\\ No newline at end of file"
+
+
+class PatchError(ValueError):
+    pass
+
+
+def split_lines(text):
+    """Lines of ``text`` (keeping ``\\r``) and whether it ends with a newline"""
+    if text == "":
+        return [], True
+    lines = text.split("\n")
+    if lines[-1] == "":
+        return lines[:-1], True
+    return lines, False
+
+
+def parse_hunks(patch):
+    """``[(old_start, new_start, [(op, line), ...]), ...]`` of a GitHub-style unified diff (no file headers)"""
+    hunks, old_left, new_left = [], 0, 0
+    for raw in patch.split("\n"):
+        header = HUNK_HEADER.match(raw)
+        if header:
+            old_left = int(header.group(2) or 1)
+            new_left = int(header.group(4) or 1)
+            hunks.append((int(header.group(1)), int(header.group(3)), []))
+            continue
+        if not hunks:
+            continue
+        op = raw[:1]
+        if op == "\\":
+            hunks[-1][2].append((op, raw[1:]))
+            continue
+        if op == "" and old_left and new_left:
+            # Một số diff bỏ dấu cách đầu dòng của dòng context rỗng
+            op, raw = " ", " "
+        if op == " " and old_left and new_left:
+            old_left, new_left = old_left - 1, new_left - 1
+        elif op == "-" and old_left:
+            old_left -= 1
+        elif op == "+" and new_left:
+            new_left -= 1
+        else:
+            continue
+        hunks[-1][2].append((op, raw[1:]))
+    return hunks
+
+
+def apply_patch(text, patch, reverse = False):
+    """Apply ``patch`` to ``text`` (or undo it with ``reverse``), checking every context and removed line.
+
+    Handles ``\\ No newline at end of file`` markers; raises ``PatchError``
+    when the patch does not match ``text``.
+    """
+    source, eol = split_lines(text)
+    remove, add = ("+", "-") if reverse else ("-", "+")
+    result, position = [], 0
+    source_marker = target_marker = False
+
+    for old_start, new_start, lines in parse_hunks(patch):
+        start = new_start if reverse else old_start
+        # Hunk thêm vào file rỗng / xoá hết file có start = 0
+        start = max(start - 1, 0) if any(op in (" ", remove) for op, _ in lines) else start
+        if start < position or start > len(source):
+            raise PatchError(f"Hunk at line {start + 1} is out of order or out of range")
+        result.extend(source[position:start])
+        position = start
+
+        previous = None
+        for op, line in lines:
+            if op == "\\":
+                if previous in (" ", add):
+                    target_marker = True
+                if previous in (" ", remove):
+                    source_marker = True
+                continue
+            previous = op
+            if op == add:
+                result.append(line)
+                continue
+            if position >= len(source) or source[position] != line:
+                raise PatchError(f"Line {position + 1} does not match the patch")
+            position += 1
+            if op == " ":
+                result.append(line)
+
+    result.extend(source[position:])
+    if target_marker:
+        eol = False
+    elif source_marker:
+        eol = True
+    if not result:
+        return ""
+    return "\n".join(result) + ("\n" if eol else "")
+
+
+def make_patch(before, after, context = 3):
+    """GitHub-style unified diff (no file headers) from ``before`` to ``after``: ``(patch, additions, deletions)``"""
+    sides = []
+    for text in (before, after):
+        lines, eol = split_lines(text)
+        if lines and not eol:
+            # Dòng cuối không có newline khác với cùng dòng đó có newline, như git
+            lines[-1] = f"{lines[-1]}\n{NO_EOL}"
+        sides.append(lines)
+    diff = list(difflib.unified_diff(*sides, n = context, lineterm = ""))[2:]
+    additions = sum(line.startswith("+") for line in diff)
+    deletions = sum(line.startswith("-") for line in diff)
+    return "\n".join(diff), additions, deletions